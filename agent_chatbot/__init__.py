@@ -0,0 +1,5 @@
+# Load the Celery app with Django so web processes publish through it
+# (and its signal handlers) too.
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
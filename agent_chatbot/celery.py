@@ -1,5 +1,8 @@
 import os
 from celery import Celery
+from celery.signals import (
+    before_task_publish, task_postrun, task_prerun, worker_init, worker_process_init, worker_process_shutdown
+)
 
 # Set default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agent_chatbot.settings')
@@ -17,6 +20,79 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 app.autodiscover_tasks()
 
 
+@worker_process_init.connect
+def reset_api_clients(**kwargs):
+    """
+    Prefork children must not reuse the parent's pooled sockets.
+    """
+    from core.clients import reset_clients
+    reset_clients()
+
+
+def gevent_pool() -> bool:
+    """Whether this worker runs the gevent pool (-P gevent monkey-patches the stdlib first)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return False
+    return monkey.is_module_patched('socket')
+
+
+@worker_init.connect
+def make_db_cooperative(**kwargs):
+    """
+    gevent pool: psycopg2 is a C extension that monkey patching can't reach;
+    psycogreen makes its network waits yield to other greenlets, so hundreds
+    of conversations share one process while they wait on OpenAI, Twilio
+    and the database.
+    """
+    if gevent_pool():
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+        print("gevent pool: psycopg2 patched for cooperative I/O")
+
+
+@task_postrun.connect
+def close_greenlet_db_connections(**kwargs):
+    """
+    gevent pool: every greenlet gets its own DB connection (connections are
+    greenlet-local); close it with the task instead of leaking one per task.
+    """
+    if gevent_pool():
+        from django.db import connections
+        connections.close_all()
+
+
+@worker_init.connect
+def clear_metrics_files(**kwargs):
+    from core.metrics import clear_process_files
+    clear_process_files()
+
+
+@worker_process_shutdown.connect
+def mark_metrics_process_dead(pid=None, **kwargs):
+    from core.metrics import mark_process_dead
+    mark_process_dead(pid or os.getpid())
+
+
+@before_task_publish.connect
+def stamp_published_at(**kwargs):
+    from core.metrics import on_task_publish
+    on_task_publish(**kwargs)
+
+
+@task_prerun.connect
+def observe_task_start(**kwargs):
+    from core.metrics import on_task_prerun
+    on_task_prerun(**kwargs)
+
+
+@task_postrun.connect
+def observe_task_end(**kwargs):
+    from core.metrics import on_task_postrun
+    on_task_postrun(**kwargs)
+
+
 @app.task(bind=True)
 def debug_task(self):
     """
@@ -140,13 +140,59 @@ LOGOUT_REDIRECT_URL = '/api/chat/'
 # CORS
 CORS_ALLOWED_ORIGINS = os.environ.get('CORS_ALLOWED_ORIGINS', '').split()
 
+# Redis (Celery broker, shared cache)
+REDIS_URL = os.environ.get('redis_url', 'redis://redis:6379/0')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+}
+
 # Celery configuration
-CELERY_BROKER_URL = os.environ.get('redis_url', 'redis://redis:6379/0')
-CELERY_RESULT_BACKEND = os.environ.get('redis_url', 'redis://redis:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
+# reply tasks go to their channel's shard queue (PipelineConfig.QUEUE_SHARDS)
+CELERY_TASK_ROUTES = ('chat.routing.route_task',)
+CELERY_BEAT_SCHEDULE = {
+    'ensure-message-partitions': {
+        'task': 'chat.tasks.ensure_message_partitions',
+        'schedule': 24 * 3600,
+    },
+    'archive-idle-channels': {
+        'task': 'chat.tasks.archive_idle_channels',
+        'schedule': 24 * 3600,
+    },
+    # retries and messages whose sender died; new messages trigger a drain themselves
+    'drain-outbox': {
+        'task': 'chat.tasks.drain_outbox',
+        'schedule': 5,
+    },
+}
 
+# Catalog snapshot (memory-mapped by every process on the host)
+CATALOG_SNAPSHOT_DIR = os.environ.get('CATALOG_SNAPSHOT_DIR', str(BASE_DIR / 'var' / 'catalog'))
+
+# Vehicle CSV imports (catalog.importer): rows per chunk (one COPY + upsert
+# each) and how many rejected rows are kept for the import-status endpoint
+CATALOG_IMPORT_CHUNK_SIZE = int(os.environ.get('CATALOG_IMPORT_CHUNK_SIZE', '20000'))
+CATALOG_IMPORT_MAX_ERROR_ROWS = int(os.environ.get('CATALOG_IMPORT_MAX_ERROR_ROWS', '100'))
+
+# Message storage: monthly partitions created ahead (PostgreSQL) and
+# zstd NDJSON archives of channels idle for longer than the retention window
+CHAT_MESSAGE_PARTITIONS_AHEAD = int(os.environ.get('CHAT_MESSAGE_PARTITIONS_AHEAD', '2'))
+CHAT_ARCHIVE_DIR = os.environ.get('CHAT_ARCHIVE_DIR', str(BASE_DIR / 'var' / 'archives'))
+CHAT_ARCHIVE_RETENTION_DAYS = int(os.environ.get('CHAT_ARCHIVE_RETENTION_DAYS', '90'))
+
+# Embeddings: 'hashing' (offline, deterministic) or 'openai'; stored as 'float16' or 'int8'
+EMBEDDING_PROVIDER = os.environ.get('EMBEDDING_PROVIDER', 'hashing')
+EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'text-embedding-3-small')
+EMBEDDING_DIM = int(os.environ.get('EMBEDDING_DIM', '256'))
+EMBEDDING_STORAGE = os.environ.get('EMBEDDING_STORAGE', 'float16')
 
 # Logging configuration
 LOGGING = {
@@ -159,8 +205,125 @@ LOGGING = {
 # Third-party API keys
 class OpenAIConfig:
     API_KEY = os.environ.get('OPENAI_API_KEY')
+    # per-process connection pool
+    MAX_CONNECTIONS = int(os.environ.get('OPENAI_MAX_CONNECTIONS', '20'))
+    MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('OPENAI_MAX_KEEPALIVE_CONNECTIONS', '10'))
+    KEEPALIVE_EXPIRY = float(os.environ.get('OPENAI_KEEPALIVE_EXPIRY', '90'))
+    TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', '60'))
+    # cluster-wide limits: model=requests_per_minute:tokens_per_minute,... (empty disables)
+    RATE_LIMITS = {
+        model: tuple(int(n) for n in limits.split(':'))
+        for model, limits in (
+            item.strip().split('=') for item in os.environ.get('OPENAI_RATE_LIMITS', '').split(',') if item.strip()
+        )
+    }
+    # share of every bucket kept for live replies (background jobs cannot use it)
+    RATE_LIMIT_RESERVE = float(os.environ.get('OPENAI_RATE_LIMIT_RESERVE', '0.2'))
+    RATE_LIMIT_MAX_WAIT = float(os.environ.get('OPENAI_RATE_LIMIT_MAX_WAIT', '20'))
+    RATE_LIMIT_BACKGROUND_MAX_WAIT = float(os.environ.get('OPENAI_RATE_LIMIT_BACKGROUND_MAX_WAIT', '30'))
+    # retries of throttled/transient calls (jittered exponential backoff, honours Retry-After)
+    MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', '4'))
+    BACKOFF_BASE = float(os.environ.get('OPENAI_BACKOFF_BASE', '0.5'))
+    BACKOFF_MAX = float(os.environ.get('OPENAI_BACKOFF_MAX', '20'))
+    # per-process circuit breaker per model
+    CIRCUIT_ERROR_RATE = float(os.environ.get('OPENAI_CIRCUIT_ERROR_RATE', '0.5'))
+    CIRCUIT_MIN_CALLS = int(os.environ.get('OPENAI_CIRCUIT_MIN_CALLS', '10'))
+    CIRCUIT_COOLDOWN = float(os.environ.get('OPENAI_CIRCUIT_COOLDOWN', '30'))
 
 class TwilioConfig:
     ACCOUNT_SID = os.environ.get('TWILIO_ACCOUNT_SID')
     AUTH_TOKEN = os.environ.get('TWILIO_AUTH_TOKEN')
     WHATSAPP_FROM = os.environ.get('TWILIO_WHATSAPP_NUMBER')
+    POOL_SIZE = int(os.environ.get('TWILIO_POOL_SIZE', '10'))
+    TIMEOUT = float(os.environ.get('TWILIO_TIMEOUT', '15'))
+    # check X-Twilio-Signature on inbound webhooks; WEBHOOK_URL is the public URL
+    # Twilio posts to, when the proxy in front hides the original scheme/host
+    VALIDATE_SIGNATURE = os.environ.get('TWILIO_VALIDATE_SIGNATURE', 'False') == 'True'
+    WEBHOOK_URL = os.environ.get('TWILIO_WEBHOOK_URL', '')
+    # how long a MessageSid is remembered to drop Twilio's webhook retries
+    DEDUPE_TTL = int(os.environ.get('TWILIO_DEDUPE_TTL', '900'))
+    # replies go through the outbox table and the drain_outbox sender task
+    # (chat.outbox) instead of being sent by the reply worker
+    OUTBOX = os.environ.get('TWILIO_OUTBOX', 'True') == 'True'
+    # queue of the sender task ('' keeps the default queue)
+    OUTBOX_QUEUE = os.environ.get('TWILIO_OUTBOX_QUEUE', '')
+    OUTBOX_BATCH_SIZE = int(os.environ.get('TWILIO_OUTBOX_BATCH_SIZE', '100'))
+    OUTBOX_MAX_ATTEMPTS = int(os.environ.get('TWILIO_OUTBOX_MAX_ATTEMPTS', '8'))
+    OUTBOX_BACKOFF_BASE = float(os.environ.get('TWILIO_OUTBOX_BACKOFF_BASE', '2'))
+    OUTBOX_BACKOFF_MAX = float(os.environ.get('TWILIO_OUTBOX_BACKOFF_MAX', '300'))
+    # a claimed message not sent within this time is picked up again
+    OUTBOX_CLAIM_SECONDS = int(os.environ.get('TWILIO_OUTBOX_CLAIM_SECONDS', '60'))
+    # messages per second per sender number (0 disables)
+    SEND_RATE = float(os.environ.get('TWILIO_SEND_RATE', '80'))
+    # public URL of api/twilio/status/, where Twilio reports delivery status
+    STATUS_CALLBACK_URL = os.environ.get('TWILIO_STATUS_CALLBACK_URL', '')
+
+class PipelineConfig:
+    CONCURRENT_STAGES = os.environ.get('CHAT_CONCURRENT_STAGES', 'False') == 'True'
+    SPECULATIVE_VEHICLE_SEARCH = os.environ.get('CHAT_SPECULATIVE_VEHICLE_SEARCH', 'False') == 'True'
+    ROUTER_MODE = os.environ.get('CHAT_ROUTER_MODE', 'False') == 'True'
+    ROUTER_MODEL = os.environ.get('CHAT_ROUTER_MODEL', 'gpt-4o-mini')
+    LOCAL_NORMALIZATION = os.environ.get('CHAT_LOCAL_NORMALIZATION', 'False') == 'True'
+    LOCAL_NORMALIZATION_THRESHOLD = float(os.environ.get('CHAT_LOCAL_NORMALIZATION_THRESHOLD', '0.9'))
+    KB_RETRIEVAL = os.environ.get('CHAT_KB_RETRIEVAL', 'llm')
+    KB_TOP_K = int(os.environ.get('CHAT_KB_TOP_K', '4'))
+    SEMANTIC_VEHICLE_SEARCH = os.environ.get('CHAT_SEMANTIC_VEHICLE_SEARCH', 'False') == 'True'
+    STREAM_REPLY = os.environ.get('CHAT_STREAM_REPLY', 'False') == 'True'
+    # faster models used when a call is hedged or the primary's circuit is open
+    FALLBACK_MODEL = os.environ.get('CHAT_FALLBACK_MODEL') or None
+    CLASSIFICATION_FALLBACK_MODEL = os.environ.get('CHAT_CLASSIFICATION_FALLBACK_MODEL') or None
+    HEDGE_REQUESTS = os.environ.get('CHAT_HEDGE_REQUESTS', 'False') == 'True'
+    # stage=seconds; stages without an SLO hedge at their rolling p95
+    LATENCY_SLOS = {
+        stage: float(seconds)
+        for stage, seconds in (
+            item.strip().split('=') for item in os.environ.get('CHAT_LATENCY_SLOS', '').split(',') if item.strip()
+        )
+    }
+    # write-through Redis cache of recent messages per conversation (chat.store)
+    CONVERSATION_STORE = os.environ.get('CHAT_CONVERSATION_STORE', 'False') == 'True'
+    CONVERSATION_STORE_SIZE = int(os.environ.get('CHAT_CONVERSATION_STORE_SIZE', '50'))
+    CONVERSATION_STORE_TTL = int(os.environ.get('CHAT_CONVERSATION_STORE_TTL', '86400'))
+    # quiet period before replying to a burst of messages (0 = reply to each message)
+    DEBOUNCE_SECONDS = float(os.environ.get('CHAT_DEBOUNCE_SECONDS', '0'))
+    # channel-affine reply queues chat.0 .. chat.N-1 (0 = default queue)
+    QUEUE_SHARDS = int(os.environ.get('CHAT_QUEUE_SHARDS', '0'))
+    # one run per channel at a time (0 disables); must exceed the longest run
+    CHANNEL_LEASE_SECONDS = int(os.environ.get('CHAT_CHANNEL_LEASE_SECONDS', '300'))
+    CHANNEL_LEASE_RETRY_SECONDS = float(os.environ.get('CHAT_CHANNEL_LEASE_RETRY_SECONDS', '2'))
+    # "task": one process_and_reply task per message; "dag": a chain of stage
+    # tasks (ingest -> route -> retrieve -> generate -> deliver), each on its queue
+    PIPELINE_MODE = os.environ.get('CHAT_PIPELINE_MODE', 'task')
+    STAGE_QUEUES = {
+        stage: os.environ.get(f'CHAT_STAGE_QUEUE_{stage.upper()}', default)
+        for stage, default in (
+            ('ingest', 'pipeline.light'),
+            ('route', 'pipeline.light'),
+            ('retrieve', 'pipeline.light'),
+            ('generate', 'pipeline.generate'),
+            ('deliver', 'pipeline.deliver'),
+        )
+    }
+    # retries of a stage throttled by the OpenAI rate limiter before the run fails
+    STAGE_MAX_RETRIES = int(os.environ.get('CHAT_STAGE_MAX_RETRIES', '3'))
+    # persist per-stage spans of every run as a PipelineRun
+    TRACING = os.environ.get('CHAT_TRACING', 'True') == 'True'
+    TOKEN_BUDGETS = {
+        section: int(os.environ[f'CHAT_TOKEN_BUDGET_{section.upper()}'])
+        for section in ('transcript', 'summary', 'last_user_message', 'vehicles', 'extra')
+        if os.environ.get(f'CHAT_TOKEN_BUDGET_{section.upper()}')
+    }
+
+class MetricsConfig:
+    # shared by every gunicorn/Celery process that should be aggregated
+    MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    # bearer token required by api/metrics/ (open without one only with DEBUG on)
+    TOKEN = os.environ.get('METRICS_TOKEN', '')
+    # queue lengths reported by api/metrics/; by default every queue the
+    # task router (chat.routing) sends to
+    CELERY_QUEUES = [q for q in os.environ.get('METRICS_CELERY_QUEUES', '').split(',') if q] or list(dict.fromkeys([
+        'celery',
+        *(f'chat.{shard}' for shard in range(PipelineConfig.QUEUE_SHARDS)),
+        *PipelineConfig.STAGE_QUEUES.values(),
+        *([TwilioConfig.OUTBOX_QUEUE] if TwilioConfig.OUTBOX_QUEUE else []),
+    ]))
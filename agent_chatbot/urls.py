@@ -16,8 +16,8 @@ Including another URLconf
 """
 from django.contrib import admin
 from django.urls import path, include
-from core.views_api import credentials_check
-from chat.api_views import twilio_inbound
+from core.views_api import credentials_check, metrics
+from chat.api_views import twilio_inbound, twilio_status
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -26,7 +26,9 @@ urlpatterns = [
     path('api/chat/', include('chat.urls')),
     path('api/catalog/', include('catalog.urls')),
     path('api/credentials_check/', credentials_check, name='credentials-check'),
+    path('api/metrics/', metrics, name='metrics'),
     path('api/twilio/inbound/', twilio_inbound, name='twilio-inbound'),
+    path('api/twilio/status/', twilio_status, name='twilio-status'),
 
 
 ]
@@ -0,0 +1,189 @@
+import hashlib
+from typing import Iterable, List, Optional
+import numpy as np
+from django.conf import settings
+from catalog.kb_index import analyze, chunk_text
+from catalog.models import KnowledgeArticle, KnowledgeChunk, Vehicle
+from core.clients import get_openai_client
+from core.metrics import record_openai_usage
+from core.ratelimit import BACKGROUND, call_openai
+
+
+class Embedder:
+    """
+    Base class for embedding providers. `embed` returns an L2-normalized
+    float32 matrix of shape (len(texts), dim).
+    """
+    name = 'base'
+    dim = 0
+
+    def embed(self, texts: List[str], priority: str = BACKGROUND) -> np.ndarray:
+        raise NotImplementedError
+
+    def embed_one(self, text: str, priority: str = BACKGROUND) -> np.ndarray:
+        return self.embed([text], priority)[0]
+
+
+class HashingEmbedder(Embedder):
+    """
+    Deterministic, offline embedder: signed feature hashing of analyzed
+    words and their character trigrams. No network, stable across processes.
+    """
+
+    def __init__(self, dim: int = 256):
+        self.dim = dim
+        self.name = f'hashing-{dim}'
+
+    def _features(self, text: str) -> Iterable[str]:
+        for word in analyze(text):
+            yield f'w:{word}'
+            padded = f'#{word}#'
+            for i in range(len(padded) - 2):
+                yield f'g:{padded[i:i + 3]}'
+
+    def embed(self, texts: List[str], priority: str = BACKGROUND) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+                value = int.from_bytes(digest, 'little')
+                weight = 2.0 if feature.startswith('w:') else 1.0
+                out[row, value % self.dim] += weight if (value >> 63) & 1 else -weight
+        return _l2_normalize(out)
+
+
+class OpenAIEmbedder(Embedder):
+    """Embeddings from the OpenAI API (text-embedding-3-* supports `dimensions`)."""
+
+    def __init__(self, model: str = 'text-embedding-3-small', dim: int = 256):
+        self.model = model
+        self.dim = dim
+        self.name = f'{model}-{dim}'
+        self.client = get_openai_client()
+
+    def embed(self, texts: List[str], priority: str = BACKGROUND) -> np.ndarray:
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        resp = call_openai(
+            self.client.embeddings.create, 'embedding', priority,
+            model=self.model, input=texts, dimensions=self.dim,
+        )
+        record_openai_usage(self.model, resp.usage)
+        vectors = np.array([item.embedding for item in resp.data], dtype=np.float32)
+        return _l2_normalize(vectors)
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+_embedder: Optional[Embedder] = None
+
+
+def get_embedder() -> Embedder:
+    """Return the configured embedding provider (EMBEDDING_PROVIDER setting)."""
+    global _embedder
+    if _embedder is None:
+        provider = settings.EMBEDDING_PROVIDER
+        if provider == 'hashing':
+            _embedder = HashingEmbedder(dim=settings.EMBEDDING_DIM)
+        elif provider == 'openai':
+            _embedder = OpenAIEmbedder(model=settings.EMBEDDING_MODEL, dim=settings.EMBEDDING_DIM)
+        else:
+            raise ValueError(f"Unknown EMBEDDING_PROVIDER: {provider}")
+    return _embedder
+
+
+# --- compact storage -------------------------------------------------------
+
+def encode_vector(vector: np.ndarray, storage: Optional[str] = None) -> bytes:
+    """
+    Serialize one normalized vector as float16 (2 bytes/dim) or as int8 with
+    a float32 scale prefix (4 + 1 byte/dim).
+    """
+    storage = storage or settings.EMBEDDING_STORAGE
+    if storage == 'float16':
+        return vector.astype(np.float16).tobytes()
+    if storage == 'int8':
+        scale = float(np.abs(vector).max()) / 127 or 1.0
+        quantized = np.clip(np.round(vector / scale), -127, 127).astype(np.int8)
+        return np.float32(scale).tobytes() + quantized.tobytes()
+    raise ValueError(f"Unknown EMBEDDING_STORAGE: {storage}")
+
+
+def decode_vectors(blobs: List[bytes], dim: int) -> np.ndarray:
+    """Inverse of encode_vector for a batch; the format is inferred from the blob size."""
+    out = np.zeros((len(blobs), dim), dtype=np.float32)
+    for row, blob in enumerate(blobs):
+        blob = bytes(blob)
+        if len(blob) == 2 * dim:
+            out[row] = np.frombuffer(blob, dtype=np.float16)
+        elif len(blob) == 4 + dim:
+            scale = np.frombuffer(blob[:4], dtype=np.float32)[0]
+            out[row] = np.frombuffer(blob[4:], dtype=np.int8).astype(np.float32) * scale
+        else:
+            raise ValueError(f"Embedding blob of {len(blob)} bytes does not match dim={dim}")
+    return out
+
+
+# --- ingest ----------------------------------------------------------------
+
+def describe_vehicle(v: Vehicle) -> str:
+    """Natural-language description used to embed a vehicle."""
+    words = [f"{v.make} {v.model} {v.version} {v.year}", f"{v.km} km", f"precio {v.price:.0f} pesos"]
+    if v.largo >= 4.7:
+        words.append("grande familiar espacioso camioneta")
+    elif v.largo and v.largo < 4.2:
+        words.append("compacto pequeño urbano ciudad")
+    else:
+        words.append("mediano")
+    if v.price < 250000:
+        words.append("económico barato accesible")
+    elif v.price > 500000:
+        words.append("lujo premium caro")
+    if v.km < 30000:
+        words.append("poco kilometraje casi nuevo")
+    if v.bluetooth:
+        words.append("bluetooth")
+    if v.car_play:
+        words.append("carplay apple")
+    return ", ".join(words)
+
+
+def embed_vehicles(stock_ids: Iterable[str], batch_size: int = 500):
+    """
+    Compute and store embeddings for the given vehicles (called on import/CRUD).
+    """
+    embedder = get_embedder()
+    stock_ids = list(stock_ids)
+    for start in range(0, len(stock_ids), batch_size):
+        vehicles = list(Vehicle.objects.filter(stock_id__in=stock_ids[start:start + batch_size]))
+        if not vehicles:
+            continue
+        vectors = embedder.embed([describe_vehicle(v) for v in vehicles])
+        for vehicle, vector in zip(vehicles, vectors):
+            vehicle.embedding = encode_vector(vector)
+            vehicle.embedding_model = embedder.name
+        Vehicle.objects.bulk_update(vehicles, fields=['embedding', 'embedding_model'])
+
+
+def index_article_chunks(article: KnowledgeArticle):
+    """
+    Replace an article's passages with freshly chunked and embedded ones.
+    """
+    embedder = get_embedder()
+    passages = chunk_text(article.text or '')
+    vectors = embedder.embed([f"{article.name or ''}\n{p}" for p in passages])
+    KnowledgeChunk.objects.filter(article=article).delete()
+    KnowledgeChunk.objects.bulk_create([
+        KnowledgeChunk(
+            article=article,
+            position=position,
+            text=passage,
+            embedding=encode_vector(vector),
+            embedding_model=embedder.name,
+        )
+        for position, (passage, vector) in enumerate(zip(passages, vectors))
+    ])
@@ -0,0 +1,256 @@
+"""
+Background vehicle CSV import (VehicleImport).
+
+The file is parsed as a stream and processed in chunks of
+CATALOG_IMPORT_CHUNK_SIZE rows. Memory stays bounded by one chunk no matter
+how large the feed is. On PostgreSQL each chunk is COPY'd into a temporary
+staging table and merged with a single INSERT ... ON CONFLICT (stock_id)
+DO UPDATE. Rows whose values did not change are left untouched and keep
+their embedding. Other databases fall back to batched bulk_create and
+bulk_update.
+
+Each chunk commits on its own, so progress is visible while the import
+runs. The upsert is idempotent, so a failed import (whose upload is kept,
+unlike a finished one) can simply be re-run.
+"""
+import csv
+import io
+import time
+from typing import Iterator, List, Optional, Tuple
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+from catalog.models import Vehicle, VehicleImport
+from catalog.snapshot import bump_catalog_version
+from core.fields import uuid7
+from core.metrics import CATALOG_IMPORT_DURATION, CATALOG_IMPORT_ROWS
+
+TRUE_VALUES = ('true', '1', 'yes', 'si', 'sí')
+# CSV columns imported into Vehicle, in staging-table order
+FIELDS = ('stock_id', 'km', 'price', 'make', 'model', 'year', 'version', 'bluetooth', 'car_play', 'largo', 'ancho', 'altura')
+DATA_FIELDS = FIELDS[1:]
+STAGE_TABLE = 'catalog_vehicle_import_stage'
+# km is an integer column; model years outside MIN_YEAR..next year are typos
+MAX_KM = 2 ** 31 - 1
+MIN_YEAR = 1900
+
+
+def _int(value: Optional[str], name: str, minimum: int, maximum: int) -> int:
+    if not (value or '').strip():
+        raise ValueError(f"missing {name}")
+    number = int(float(value))
+    if not minimum <= number <= maximum:
+        raise ValueError(f"{name} must be between {minimum} and {maximum}")
+    return number
+
+
+def _float(value: str) -> float:
+    return float(value) if value else 0.0
+
+
+def _text(value: Optional[str], name: str, max_length: int) -> str:
+    value = (value or '').strip()
+    if len(value) > max_length:
+        raise ValueError(f"{name} longer than {max_length} characters")
+    return value
+
+
+def parse_row(row: dict) -> tuple:
+    """One CSV row as a tuple of FIELDS values; raises ValueError when invalid."""
+    stock_id = _text(row.get('stock_id'), 'stock_id', 50)
+    if not stock_id:
+        raise ValueError("missing stock_id")
+    max_year = timezone.now().year + 1
+    return (
+        stock_id,
+        _int(row.get('km'), 'km', 0, MAX_KM),
+        _float(row.get('price')),
+        _text(row.get('make'), 'make', 100),
+        _text(row.get('model'), 'model', 100),
+        _int(row.get('year'), 'year', MIN_YEAR, max_year),
+        _text(row.get('version'), 'version', 100),
+        (row.get('bluetooth') or '').lower() in TRUE_VALUES,
+        (row.get('car_play') or '').lower() in TRUE_VALUES,
+        _float(row.get('largo')),
+        _float(row.get('ancho')),
+        _float(row.get('altura')),
+    )
+
+
+def iter_chunks(stream, chunk_size: int, on_error) -> Iterator[List[Tuple[int, tuple]]]:
+    """
+    Yield lists of at most `chunk_size` (line, values) pairs of valid rows;
+    invalid rows go to `on_error(line, stock_id, message)`.
+    """
+    reader = csv.DictReader(stream)
+    chunk = []
+    for row in reader:
+        try:
+            chunk.append((reader.line_num, parse_row(row)))
+        except (TypeError, ValueError, OverflowError) as e:
+            on_error(reader.line_num, row.get('stock_id') or '', str(e))
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# --- PostgreSQL: COPY into staging + set-based upsert ------------------------
+
+def _stage_sql() -> str:
+    return f"""
+        CREATE TEMPORARY TABLE IF NOT EXISTS {STAGE_TABLE} (
+            line integer NOT NULL,
+            id uuid NOT NULL,
+            stock_id varchar(50) NOT NULL,
+            km integer NOT NULL,
+            price double precision NOT NULL,
+            make varchar(100) NOT NULL,
+            model varchar(100) NOT NULL,
+            year integer NOT NULL,
+            version varchar(100) NOT NULL,
+            bluetooth boolean NOT NULL,
+            car_play boolean NOT NULL,
+            largo double precision NOT NULL,
+            ancho double precision NOT NULL,
+            altura double precision NOT NULL
+        )
+    """
+
+
+def _upsert_sql() -> str:
+    table = Vehicle._meta.db_table
+    columns = ', '.join(FIELDS)
+    updates = ', '.join(f"{f} = EXCLUDED.{f}" for f in DATA_FIELDS)
+    current = ', '.join(f"v.{f}" for f in DATA_FIELDS)
+    incoming = ', '.join(f"EXCLUDED.{f}" for f in DATA_FIELDS)
+    # DISTINCT ON: the last line wins when a chunk repeats a stock_id;
+    # changed vehicles lose their embedding until it is recomputed
+    return f"""
+        WITH src AS (
+            SELECT DISTINCT ON (stock_id) * FROM {STAGE_TABLE} ORDER BY stock_id, line DESC
+        )
+        INSERT INTO {table} AS v (id, {columns}, embedding_model)
+        SELECT id, {columns}, '' FROM src
+        ON CONFLICT (stock_id) DO UPDATE SET {updates}, embedding = NULL, embedding_model = ''
+        WHERE ({current}) IS DISTINCT FROM ({incoming})
+        RETURNING v.stock_id, (v.xmax = 0) AS inserted
+    """
+
+
+def _copy_chunk_postgres(chunk: List[Tuple[int, tuple]]) -> Tuple[int, int, List[str]]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line, values in chunk:
+        writer.writerow((line, uuid7()) + values)
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.execute(_stage_sql())
+        cursor.execute(f"TRUNCATE {STAGE_TABLE}")
+        cursor.copy_expert(f"COPY {STAGE_TABLE} (line, id, {', '.join(FIELDS)}) FROM STDIN WITH (FORMAT csv, FORCE_NOT_NULL (stock_id, make, model, version))", buffer)
+        cursor.execute(_upsert_sql())
+        changed = cursor.fetchall()
+    created = sum(1 for _, inserted in changed if inserted)
+    return created, len(changed) - created, [stock_id for stock_id, _ in changed]
+
+
+# --- other databases ---------------------------------------------------------
+
+def _upsert_chunk_orm(chunk: List[Tuple[int, tuple]], batch_size: int = 500) -> Tuple[int, int, List[str]]:
+    rows = {values[0]: values for _, values in chunk}
+    stock_ids = list(rows)
+    to_create, to_update = [], []
+    for start in range(0, len(stock_ids), batch_size):
+        batch = stock_ids[start:start + batch_size]
+        existing = {v.stock_id: v for v in Vehicle.objects.filter(stock_id__in=batch)}
+        for stock_id in batch:
+            data = dict(zip(DATA_FIELDS, rows[stock_id][1:]))
+            vehicle = existing.get(stock_id)
+            if vehicle is None:
+                to_create.append(Vehicle(stock_id=stock_id, **data))
+            elif any(getattr(vehicle, f) != value for f, value in data.items()):
+                for f, value in data.items():
+                    setattr(vehicle, f, value)
+                vehicle.embedding, vehicle.embedding_model = None, ''
+                to_update.append(vehicle)
+    Vehicle.objects.bulk_create(to_create, batch_size=batch_size)
+    Vehicle.objects.bulk_update(to_update, fields=[*DATA_FIELDS, 'embedding', 'embedding_model'], batch_size=batch_size)
+    return len(to_create), len(to_update), [v.stock_id for v in to_create + to_update]
+
+
+def upsert_chunk(chunk: List[Tuple[int, tuple]]) -> Tuple[int, int, List[str]]:
+    """Insert or update one chunk; returns (created, updated, changed stock_ids)."""
+    if connection.vendor == 'postgresql':
+        return _copy_chunk_postgres(chunk)
+    return _upsert_chunk_orm(chunk)
+
+
+def run_import(import_id: str, on_changed=None) -> VehicleImport:
+    """
+    Import the VehicleImport's file chunk by chunk, recording progress after
+    every chunk. `on_changed(stock_ids)` is called (on commit) with the
+    vehicles each chunk created or changed.
+    """
+    job = VehicleImport.objects.get(id=import_id)
+    started = time.perf_counter()
+    max_errors = settings.CATALOG_IMPORT_MAX_ERROR_ROWS
+    totals = {'rows_processed': 0, 'created': 0, 'updated': 0, 'unchanged': 0, 'error_count': 0}
+
+    def on_error(line: int, stock_id: str, message: str):
+        totals['error_count'] += 1
+        if len(job.errors) < max_errors:
+            job.errors.append({'line': line, 'stock_id': stock_id, 'error': message})
+
+    # a re-run starts over; the previous attempt's counts and errors go
+    job.errors = []
+    VehicleImport.objects.filter(id=job.id).update(
+        status=VehicleImport.RUNNING,
+        started_at=timezone.now(),
+        date_updated=timezone.now(),
+        errors=job.errors,
+        **totals
+    )
+    try:
+        with job.file.open('rb') as f:
+            stream = io.TextIOWrapper(f.file, encoding='utf-8-sig', newline='')
+            for chunk in iter_chunks(stream, settings.CATALOG_IMPORT_CHUNK_SIZE, on_error):
+                with transaction.atomic():
+                    created, updated, changed = upsert_chunk(chunk)
+                    if changed and on_changed:
+                        transaction.on_commit(lambda ids=changed: on_changed(ids))
+                totals['rows_processed'] += len(chunk)
+                totals['created'] += created
+                totals['updated'] += updated
+                # a stock_id repeated within the chunk is upserted once
+                unique = len({values[0] for _, values in chunk})
+                totals['unchanged'] += unique - created - updated
+                VehicleImport.objects.filter(id=job.id).update(
+                    errors=job.errors, date_updated=timezone.now(), **totals
+                )
+                print(f"Vehicle import {job.id}: {totals['rows_processed']} rows")
+    except Exception as e:
+        print(f"Vehicle import {job.id} failed: {e}")
+        status, error = VehicleImport.FAILED, f"{type(e).__name__}: {e}"
+    else:
+        status, error = VehicleImport.DONE, ''
+    if totals['created'] or totals['updated']:
+        bump_catalog_version()
+    if status == VehicleImport.DONE:
+        # a failed import keeps its file to be run again
+        job.file.delete(save=False)
+    VehicleImport.objects.filter(id=job.id).update(
+        file=job.file.name or '',
+        status=status,
+        error=error,
+        errors=job.errors,
+        finished_at=timezone.now(),
+        date_updated=timezone.now(),
+        **totals
+    )
+    CATALOG_IMPORT_DURATION.observe(time.perf_counter() - started)
+    for action in ('created', 'updated', 'unchanged'):
+        CATALOG_IMPORT_ROWS.labels(action).inc(totals[action])
+    CATALOG_IMPORT_ROWS.labels('error').inc(totals['error_count'])
+    job.refresh_from_db()
+    return job
@@ -0,0 +1,202 @@
+import math
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from django.core.cache import cache
+from django.db import transaction
+from catalog.models import KnowledgeArticle
+from core.text import fold
+from core.metrics import record_cache
+
+KB_VERSION_KEY = 'kb:version'
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?;:])\s+")
+
+SPANISH_STOPWORDS = frozenset(fold(w) for w in """
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun como con contra cual cuales
+cuando de del desde donde dos el ella ellas ello ellos en entre era eran es esa esas ese eso esos
+esta estas este esto estos fue fueron ha han hasta hay la las le les lo los mas me mi mis mucho muy
+nada ni no nos nosotros o os otra otras otro otros para pero poco por porque que quien se ser si
+sin sobre son su sus tambien tan te tiene tienen todo todos tu tus un una unas uno unos usted ustedes
+y ya yo puede pueden cada segun
+""".split())
+
+
+def analyze(text: str) -> List[str]:
+    """
+    Spanish analyzer: fold accents/case, drop stopwords and apply a light
+    plural stemmer ("garantías" -> "garantia", "vehículos" -> "vehiculo").
+    """
+    terms = []
+    for word in _WORD_RE.findall(fold(text or '')):
+        if word in SPANISH_STOPWORDS or len(word) < 2:
+            continue
+        if len(word) > 5 and word.endswith('es') and word[-3] not in 'aeiou':
+            word = word[:-2]
+        elif len(word) > 3 and word.endswith('s'):
+            word = word[:-1]
+        terms.append(word)
+    return terms
+
+
+def chunk_text(text: str, max_words: int = 120) -> List[str]:
+    """
+    Split article text into passages of at most ~max_words, on paragraph
+    and sentence boundaries.
+    """
+    chunks, current, size = [], [], 0
+    for paragraph in re.split(r"\n\s*\n", text or ''):
+        for sentence in _SENTENCE_RE.split(paragraph.strip()):
+            words = len(sentence.split())
+            if not words:
+                continue
+            if current and size + words > max_words:
+                chunks.append(' '.join(current))
+                current, size = [], 0
+            current.append(sentence)
+            size += words
+        if current and size >= max_words // 2:
+            chunks.append(' '.join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(' '.join(current))
+    return chunks
+
+
+@dataclass
+class Passage:
+    article_id: str
+    article_name: str
+    text: str
+    score: float
+
+
+class BM25Index:
+    """
+    In-process inverted index over knowledge-article passages with
+    Okapi BM25 scoring. Articles can be upserted/removed incrementally.
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75, max_words: int = 120):
+        self.k1 = k1
+        self.b = b
+        self.max_words = max_words
+        self.postings: Dict[str, Dict[int, int]] = defaultdict(dict)
+        self.chunk_len: Dict[int, int] = {}
+        self.chunks: Dict[int, tuple] = {}
+        self.article_chunks: Dict[str, List[int]] = defaultdict(list)
+        self.article_stamp: Dict[str, float] = {}
+        self._next_id = 0
+        self._total_len = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def upsert_article(self, article: KnowledgeArticle):
+        """(Re)index every passage of an article."""
+        article_id = str(article.id)
+        with self._lock:
+            self._remove(article_id)
+            for passage in chunk_text(article.text or '', self.max_words):
+                terms = analyze(passage)
+                if not terms:
+                    continue
+                chunk_id = self._next_id
+                self._next_id += 1
+                self.chunks[chunk_id] = (article_id, article.name or '', passage)
+                self.chunk_len[chunk_id] = len(terms)
+                self._total_len += len(terms)
+                for term, tf in Counter(terms).items():
+                    self.postings[term][chunk_id] = tf
+                self.article_chunks[article_id].append(chunk_id)
+            self.article_stamp[article_id] = article.date_updated.timestamp() if article.date_updated else 0.0
+
+    def remove_article(self, article_id):
+        with self._lock:
+            self._remove(str(article_id))
+
+    def _remove(self, article_id: str):
+        for chunk_id in self.article_chunks.pop(article_id, []):
+            _, _, passage = self.chunks.pop(chunk_id)
+            self._total_len -= self.chunk_len.pop(chunk_id)
+            for term in set(analyze(passage)):
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(chunk_id, None)
+                    if not postings:
+                        del self.postings[term]
+        self.article_stamp.pop(article_id, None)
+
+    def search(self, query: str, k: int = 4, min_score: float = 0.0) -> List[Passage]:
+        """Return the top-k passages for the query."""
+        with self._lock:
+            n = len(self.chunks)
+            if not n:
+                return []
+            avgdl = self._total_len / n
+            scores: Dict[int, float] = defaultdict(float)
+            for term in set(analyze(query)):
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self.chunk_len[chunk_id] / avgdl)
+                    scores[chunk_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [
+                Passage(*self.chunks[chunk_id], score=score)
+                for chunk_id, score in top if score >= min_score
+            ]
+
+    def sync(self):
+        """
+        Bring the index in line with the DB, re-reading only the articles
+        whose date_updated changed and dropping inactive/deleted ones.
+        """
+        stamps = {
+            str(article_id): updated.timestamp() if updated else 0.0
+            for article_id, updated in KnowledgeArticle.objects.filter(active=True).values_list('id', 'date_updated')
+        }
+        for article_id in set(self.article_stamp) - set(stamps):
+            self.remove_article(article_id)
+        changed = [a for a, stamp in stamps.items() if self.article_stamp.get(a) != stamp]
+        for article in KnowledgeArticle.objects.filter(id__in=changed):
+            self.upsert_article(article)
+
+
+def get_kb_version() -> int:
+    return cache.get_or_set(KB_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_kb_version():
+    """Tell every process to re-sync its KB index once the transaction commits."""
+    transaction.on_commit(lambda: cache.set(KB_VERSION_KEY, time.time_ns(), timeout=None))
+
+
+_index: Optional[BM25Index] = None
+_index_version = None
+_index_lock = threading.Lock()
+
+
+def get_kb_index() -> BM25Index:
+    """
+    Return this process' BM25 index, incrementally synced whenever the
+    shared KB version moves.
+    """
+    global _index, _index_version
+    version = get_kb_version()
+    record_cache('kb_bm25', _index is not None and _index_version == version)
+    if _index is None or _index_version != version:
+        with _index_lock:
+            if _index is None:
+                _index = BM25Index()
+            if _index_version != version:
+                _index.sync()
+                _index_version = version
+    return _index
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:20
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0005_alter_knowledgearticle_name'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(django.db.models.functions.text.Upper('make'), django.db.models.functions.text.Upper('model'), models.F('price'), name='vehicle_make_model_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['price'], name='vehicle_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['year'], name='vehicle_year_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='vehicle',
+            index=models.Index(fields=['km'], name='vehicle_km_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:26
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0006_vehicle_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vehicle',
+            name='embedding',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='embedding_model',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.CreateModel(
+            name='KnowledgeChunk',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('position', models.PositiveIntegerField()),
+                ('text', models.TextField()),
+                ('embedding', models.BinaryField(blank=True, null=True)),
+                ('embedding_model', models.CharField(blank=True, max_length=100)),
+                ('article', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='catalog.knowledgearticle')),
+            ],
+            options={
+                'ordering': ['article', 'position'],
+            },
+        ),
+    ]
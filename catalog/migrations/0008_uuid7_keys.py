@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:42
+
+import core.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0007_embeddings'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='knowledgearticle',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='knowledgechunk',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='vehicle',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:13
+
+import core.fields
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0008_uuid7_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VehicleImport',
+            fields=[
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField()),
+                ('id', core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('file', models.FileField(upload_to='vehicle_imports/')),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('running', 'running'), ('done', 'done'), ('failed', 'failed')], default='pending', max_length=16)),
+                ('rows_processed', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('updated', models.PositiveIntegerField(default=0)),
+                ('unchanged', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('errors', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True, default='')),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
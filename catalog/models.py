@@ -1,9 +1,10 @@
-import uuid
 from django.db import models
+from django.db.models.functions import Upper
+from core.fields import UUIDv7Field
 from core.models import BaseModel
 
 class Vehicle(models.Model):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = UUIDv7Field(primary_key=True, editable=False)
     stock_id = models.CharField(max_length=50, unique=True)
     km = models.PositiveIntegerField()
     price = models.FloatField(help_text='Price of the vehicle')
@@ -16,12 +17,22 @@ class Vehicle(models.Model):
     largo = models.FloatField(help_text='Length of the vehicle')
     ancho = models.FloatField(help_text='Width of the vehicle')
     altura = models.FloatField(help_text='Height of the vehicle')
-    
+    embedding = models.BinaryField(null=True, blank=True, editable=False)
+    embedding_model = models.CharField(max_length=100, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # make/model lookups are case-insensitive (iexact -> UPPER(...))
+            models.Index(Upper('make'), Upper('model'), 'price', name='vehicle_make_model_price_idx'),
+            models.Index(fields=['price'], name='vehicle_price_idx'),
+            models.Index(fields=['year'], name='vehicle_year_idx'),
+            models.Index(fields=['km'], name='vehicle_km_idx'),
+        ]
+
 
 class KnowledgeArticle(BaseModel):
-    id = models.UUIDField(
+    id = UUIDv7Field(
         primary_key=True,
-        default=uuid.uuid4,
         editable=False
     )
     name = models.TextField(blank=True, null=True)
@@ -30,4 +41,41 @@ class KnowledgeArticle(BaseModel):
     active = models.BooleanField(default=True)
 
     def __str__(self):
-        return self.name
\ No newline at end of file
+        return self.name
+
+
+class KnowledgeChunk(models.Model):
+    """A passage of a KnowledgeArticle with its (quantized) embedding."""
+    id = UUIDv7Field(primary_key=True, editable=False)
+    article = models.ForeignKey(KnowledgeArticle, on_delete=models.CASCADE, related_name='chunks')
+    position = models.PositiveIntegerField()
+    text = models.TextField()
+    embedding = models.BinaryField(null=True, blank=True)
+    embedding_model = models.CharField(max_length=100, blank=True)
+
+    class Meta:
+        ordering = ['article', 'position']
+
+
+class VehicleImport(BaseModel):
+    """
+    A vehicle CSV upload imported in the background (catalog.importer),
+    with its progress and the rows that could not be imported.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = [(s, s) for s in (PENDING, RUNNING, DONE, FAILED)]
+
+    id = UUIDv7Field(primary_key=True, editable=False)
+    file = models.FileField(upload_to='vehicle_imports/')
+    size_bytes = models.PositiveBigIntegerField(default=0)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    rows_processed = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    unchanged = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    # first CATALOG_IMPORT_MAX_ERROR_ROWS rejected rows: {"line", "stock_id", "error"}
+    errors = models.JSONField(default=list)
+    error = models.TextField(blank=True, default='')
+    started_at = models.DateTimeField(blank=True, null=True)
+    finished_at = models.DateTimeField(blank=True, null=True)
@@ -0,0 +1,178 @@
+import csv
+import io
+from dataclasses import dataclass, fields
+from typing import Iterable, List, Optional
+from django.db.models import Q
+from catalog.models import Vehicle
+
+VEHICLE_CSV_COLUMNS = [
+    'stock_id', 'km', 'price', 'make', 'model', 'year',
+    'version', 'bluetooth', 'largo', 'ancho', 'altura', 'car_play'
+]
+
+# Allowed ranking orders for the search results. The first key always hits
+# one of the single-column indexes declared on Vehicle.
+SORT_ORDERS = {
+    'price_asc': ('price', 'km'),
+    'price_desc': ('-price', 'km'),
+    'year_desc': ('-year', 'price'),
+    'km_asc': ('km', 'price'),
+}
+DEFAULT_SORT = 'price_asc'
+
+_INT_FIELDS = ('year_min', 'year_max', 'km_max')
+_FLOAT_FIELDS = (
+    'price_min', 'price_max',
+    'largo_min', 'largo_max', 'ancho_min', 'ancho_max', 'altura_min', 'altura_max',
+)
+_BOOL_FIELDS = ('bluetooth', 'car_play')
+_TEXT_FIELDS = ('make', 'model', 'version')
+
+
+@dataclass
+class VehicleFilter:
+    """
+    Typed search spec extracted from a user message.
+    Every attribute is optional; `None` means "no constraint".
+    """
+    make: Optional[str] = None
+    model: Optional[str] = None
+    version: Optional[str] = None
+    year_min: Optional[int] = None
+    year_max: Optional[int] = None
+    price_min: Optional[float] = None
+    price_max: Optional[float] = None
+    km_max: Optional[int] = None
+    bluetooth: Optional[bool] = None
+    car_play: Optional[bool] = None
+    largo_min: Optional[float] = None
+    largo_max: Optional[float] = None
+    ancho_min: Optional[float] = None
+    ancho_max: Optional[float] = None
+    altura_min: Optional[float] = None
+    altura_max: Optional[float] = None
+    sort: str = DEFAULT_SORT
+
+    @classmethod
+    def from_dict(cls, data: Optional[dict]) -> 'VehicleFilter':
+        """
+        Build a spec from loosely-typed (LLM) output, silently dropping
+        unknown keys and values that cannot be coerced.
+        """
+        spec = cls()
+        if not isinstance(data, dict):
+            return spec
+        for name in _TEXT_FIELDS:
+            value = data.get(name)
+            if isinstance(value, str) and value.strip():
+                setattr(spec, name, value.strip())
+        for name in _INT_FIELDS:
+            setattr(spec, name, _coerce_number(data.get(name), int))
+        for name in _FLOAT_FIELDS:
+            setattr(spec, name, _coerce_number(data.get(name), float))
+        for name in _BOOL_FIELDS:
+            setattr(spec, name, _coerce_bool(data.get(name)))
+        if data.get('sort') in SORT_ORDERS:
+            spec.sort = data['sort']
+        return spec
+
+    def to_dict(self) -> dict:
+        """Return only the constrained attributes (plus the sort order)."""
+        out = {f.name: getattr(self, f.name) for f in fields(self) if getattr(self, f.name) is not None}
+        out['sort'] = self.sort
+        return out
+
+    def is_empty(self) -> bool:
+        return all(getattr(self, f.name) is None for f in fields(self) if f.name != 'sort')
+
+    @staticmethod
+    def json_schema() -> dict:
+        """
+        JSON schema of the spec, used to constrain the LLM extraction output.
+        """
+        properties = {name: {"type": ["string", "null"]} for name in _TEXT_FIELDS}
+        properties.update({name: {"type": ["integer", "null"]} for name in _INT_FIELDS})
+        properties.update({name: {"type": ["number", "null"]} for name in _FLOAT_FIELDS})
+        properties.update({name: {"type": ["boolean", "null"]} for name in _BOOL_FIELDS})
+        properties['sort'] = {"type": "string", "enum": list(SORT_ORDERS)}
+        return {
+            "type": "object",
+            "properties": properties,
+            "required": list(properties),
+            "additionalProperties": False,
+        }
+
+    def to_q(self) -> Q:
+        """Translate the spec into an ORM filter."""
+        q = Q()
+        if self.make:
+            q &= Q(make__iexact=self.make)
+        if self.model:
+            q &= Q(model__iexact=self.model)
+        if self.version:
+            q &= Q(version__icontains=self.version)
+        if self.year_min is not None:
+            q &= Q(year__gte=self.year_min)
+        if self.year_max is not None:
+            q &= Q(year__lte=self.year_max)
+        if self.price_min is not None:
+            q &= Q(price__gte=self.price_min)
+        if self.price_max is not None:
+            q &= Q(price__lte=self.price_max)
+        if self.km_max is not None:
+            q &= Q(km__lte=self.km_max)
+        if self.bluetooth is not None:
+            q &= Q(bluetooth=self.bluetooth)
+        if self.car_play is not None:
+            q &= Q(car_play=self.car_play)
+        for dim in ('largo', 'ancho', 'altura'):
+            low = getattr(self, f'{dim}_min')
+            high = getattr(self, f'{dim}_max')
+            if low is not None:
+                q &= Q(**{f'{dim}__gte': low})
+            if high is not None:
+                q &= Q(**{f'{dim}__lte': high})
+        return q
+
+
+def _coerce_number(value, cast):
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _coerce_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().lower() == 'true'
+    return None
+
+
+def search_vehicles(spec: VehicleFilter, limit: int = 10) -> List[Vehicle]:
+    """
+    Run the spec as an indexed ORM query and return the top `limit` matches
+    (used when the catalog snapshot is unavailable).
+    """
+    order = SORT_ORDERS.get(spec.sort, SORT_ORDERS[DEFAULT_SORT])
+    return list(Vehicle.objects.filter(spec.to_q()).order_by(*order)[:limit])
+
+
+def vehicles_to_csv(vehicles: Iterable[Vehicle]) -> str:
+    """
+    Serialize vehicles with the CSV layout expected by the final prompt.
+    """
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(VEHICLE_CSV_COLUMNS)
+    for v in vehicles:
+        writer.writerow([
+            v.stock_id, v.km, v.price, v.make, v.model, v.year,
+            v.version, 'true' if v.bluetooth else 'false',
+            v.largo, v.ancho, v.altura,
+            'true' if v.car_play else 'false'
+        ])
+    return output.getvalue()
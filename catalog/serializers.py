@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from catalog.models import Vehicle, KnowledgeArticle
+from catalog.models import Vehicle, VehicleImport, KnowledgeArticle
 
 class VehicleSerializer(serializers.ModelSerializer):
     url = serializers.HyperlinkedIdentityField(
@@ -33,6 +33,20 @@ class VehicleImportSerializer(serializers.Serializer):
             raise serializers.ValidationError(f'Invalid file type: {content_type}. Must be CSV.')
         return value
 
+class VehicleImportStatusSerializer(serializers.ModelSerializer):
+    url = serializers.HyperlinkedIdentityField(
+        view_name='vehicleimport-detail',
+        lookup_field='pk'
+    )
+
+    class Meta:
+        model = VehicleImport
+        fields = [
+            'url', 'id', 'status', 'size_bytes', 'rows_processed', 'created', 'updated', 'unchanged',
+            'error_count', 'errors', 'error', 'started_at', 'finished_at', 'date_created',
+        ]
+        read_only_fields = fields
+
 class KnowledgeArticleSerializer(serializers.ModelSerializer):
     _url = serializers.HyperlinkedIdentityField(
         view_name='knowledgearticle-detail',
@@ -0,0 +1,250 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from catalog.models import Vehicle
+from catalog.search import DEFAULT_SORT, VehicleFilter
+from core.metrics import record_cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+# column name -> dtype of the plain numeric/boolean columns
+NUMERIC_COLUMNS = {
+    'km': np.int64,
+    'price': np.float64,
+    'year': np.int32,
+    'bluetooth': np.bool_,
+    'car_play': np.bool_,
+    'largo': np.float64,
+    'ancho': np.float64,
+    'altura': np.float64,
+}
+# dictionary-encoded string columns: codes array + vocabulary list
+ENCODED_COLUMNS = ('make', 'model', 'version')
+
+# vectorized equivalents of catalog.search.SORT_ORDERS: (column, descending)
+SORT_KEYS = {
+    'price_asc': (('price', False), ('km', False)),
+    'price_desc': (('price', True), ('km', False)),
+    'year_desc': (('year', True), ('price', False)),
+    'km_asc': (('km', False), ('price', False)),
+}
+
+
+def get_catalog_version() -> int:
+    """
+    Return the current catalog version shared by every web/worker process.
+    Versions are timestamps, so a flushed cache never resurrects a stale snapshot.
+    """
+    return cache.get_or_set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def bump_catalog_version():
+    """
+    Invalidate every process' snapshot once the current transaction commits.
+    """
+    transaction.on_commit(lambda: cache.set(CATALOG_VERSION_KEY, time.time_ns(), timeout=None))
+
+
+class CatalogSnapshot:
+    """
+    Read-only columnar copy of the Vehicle table: one NumPy array per column,
+    with make/model/version dictionary-encoded. Saved as .npy files so that
+    every process on the host memory-maps the same pages.
+    """
+
+    def __init__(self, version: int, columns: Dict[str, np.ndarray], vocab: Dict[str, List[str]]):
+        self.version = version
+        self.columns = columns
+        self.vocab = vocab
+        self._upper_vocab = {name: [v.upper() for v in values] for name, values in vocab.items()}
+        self._row_by_stock_id = None
+
+    def __len__(self):
+        return len(self.columns['stock_id'])
+
+    @classmethod
+    def build_from_db(cls, version: int) -> 'CatalogSnapshot':
+        """Read the whole catalog once and encode it column by column."""
+        names = ['stock_id', *ENCODED_COLUMNS, *NUMERIC_COLUMNS]
+        rows = list(Vehicle.objects.order_by('stock_id').values_list(*names))
+        raw = dict(zip(names, zip(*rows))) if rows else {name: () for name in names}
+
+        columns = {'stock_id': np.array(raw['stock_id'], dtype=str)}
+        vocab = {}
+        for name in ENCODED_COLUMNS:
+            values, codes = np.unique(np.array(raw[name], dtype=str), return_inverse=True)
+            vocab[name] = values.tolist()
+            columns[f'{name}_code'] = codes.astype(np.int32)
+        for name, dtype in NUMERIC_COLUMNS.items():
+            columns[name] = np.array(raw[name], dtype=dtype)
+        return cls(version, columns, vocab)
+
+    def save(self, directory: Path):
+        """
+        Write the snapshot atomically: build it in a temp dir, then rename.
+        If another process won the race, keep theirs.
+        """
+        directory.parent.mkdir(parents=True, exist_ok=True)
+        tmp = Path(tempfile.mkdtemp(dir=directory.parent, prefix='.tmp-'))
+        try:
+            for name, array in self.columns.items():
+                np.save(tmp / f'{name}.npy', array, allow_pickle=False)
+            (tmp / 'vocab.json').write_text(json.dumps(self.vocab), encoding='utf-8')
+            os.rename(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not directory.exists():
+                raise
+
+    @classmethod
+    def load(cls, directory: Path, version: int) -> 'CatalogSnapshot':
+        """Map a saved snapshot; FileNotFoundError if it is (being) pruned."""
+        vocab = json.loads((directory / 'vocab.json').read_text(encoding='utf-8'))
+        names = ['stock_id', *(f'{name}_code' for name in ENCODED_COLUMNS), *NUMERIC_COLUMNS]
+        columns = {
+            name: np.load(directory / f'{name}.npy', mmap_mode='r', allow_pickle=False)
+            for name in names
+        }
+        return cls(version, columns, vocab)
+
+    def _codes_matching(self, name: str, value: str, contains: bool = False) -> np.ndarray:
+        needle = value.upper()
+        values = self._upper_vocab[name]
+        if contains:
+            return np.array([i for i, v in enumerate(values) if needle in v], dtype=np.int32)
+        return np.array([i for i, v in enumerate(values) if v == needle], dtype=np.int32)
+
+    def mask(self, spec: VehicleFilter) -> np.ndarray:
+        """Vectorized equivalent of VehicleFilter.to_q()."""
+        c = self.columns
+        mask = np.ones(len(self), dtype=bool)
+        if spec.make:
+            mask &= np.isin(c['make_code'], self._codes_matching('make', spec.make))
+        if spec.model:
+            mask &= np.isin(c['model_code'], self._codes_matching('model', spec.model))
+        if spec.version:
+            mask &= np.isin(c['version_code'], self._codes_matching('version', spec.version, contains=True))
+        if spec.year_min is not None:
+            mask &= c['year'] >= spec.year_min
+        if spec.year_max is not None:
+            mask &= c['year'] <= spec.year_max
+        if spec.price_min is not None:
+            mask &= c['price'] >= spec.price_min
+        if spec.price_max is not None:
+            mask &= c['price'] <= spec.price_max
+        if spec.km_max is not None:
+            mask &= c['km'] <= spec.km_max
+        if spec.bluetooth is not None:
+            mask &= c['bluetooth'] == spec.bluetooth
+        if spec.car_play is not None:
+            mask &= c['car_play'] == spec.car_play
+        for dim in ('largo', 'ancho', 'altura'):
+            low = getattr(spec, f'{dim}_min')
+            high = getattr(spec, f'{dim}_max')
+            if low is not None:
+                mask &= c[dim] >= low
+            if high is not None:
+                mask &= c[dim] <= high
+        return mask
+
+    def rank(self, indices: np.ndarray, sort: str = DEFAULT_SORT) -> np.ndarray:
+        """Order row indices by the given sort key (np.lexsort: last key is primary)."""
+        keys = []
+        for name, descending in reversed(SORT_KEYS.get(sort, SORT_KEYS[DEFAULT_SORT])):
+            column = np.asarray(self.columns[name][indices], dtype=np.float64)
+            keys.append(-column if descending else column)
+        return indices[np.lexsort(keys)] if keys else indices
+
+    def vehicles(self, indices) -> List[Vehicle]:
+        """Materialize rows as unsaved Vehicle instances (for CSV rendering)."""
+        c = self.columns
+        out = []
+        for i in indices:
+            out.append(Vehicle(
+                stock_id=str(c['stock_id'][i]),
+                make=self.vocab['make'][c['make_code'][i]],
+                model=self.vocab['model'][c['model_code'][i]],
+                version=self.vocab['version'][c['version_code'][i]],
+                **{name: c[name][i].item() for name in NUMERIC_COLUMNS}
+            ))
+        return out
+
+    def indices_for(self, stock_ids: List[str]) -> np.ndarray:
+        """Row indices of the given stock_ids, in the given order (unknown ids skipped)."""
+        if self._row_by_stock_id is None:
+            self._row_by_stock_id = {str(s): i for i, s in enumerate(self.columns['stock_id'])}
+        rows = [self._row_by_stock_id.get(str(s)) for s in stock_ids]
+        return np.array([r for r in rows if r is not None], dtype=np.int64)
+
+    def search(self, spec: VehicleFilter, limit: int = 10) -> List[Vehicle]:
+        """Filter, rank and return the top `limit` vehicles."""
+        indices = np.flatnonzero(self.mask(spec))
+        return self.vehicles(self.rank(indices, spec.sort)[:limit])
+
+    def vehicle_vocab(self) -> Dict[str, List[str]]:
+        return {
+            "makes": list(self.vocab['make']),
+            "models": list(self.vocab['model']),
+            "versions": list(self.vocab['version']),
+        }
+
+
+_current: Optional[CatalogSnapshot] = None
+
+
+def get_catalog_snapshot() -> CatalogSnapshot:
+    """
+    Return this process' snapshot, rebuilding (or mapping a sibling process'
+    build) only when the shared catalog version has moved.
+    """
+    global _current
+    version = get_catalog_version()
+    if _current is not None and _current.version == version:
+        record_cache('catalog_snapshot', True)
+        return _current
+    record_cache('catalog_snapshot', False)
+
+    root = Path(settings.CATALOG_SNAPSHOT_DIR)
+    directory = root / f'v{version}'
+    if not directory.exists():
+        CatalogSnapshot.build_from_db(version).save(directory)
+        _prune_snapshots(root, keep=directory)
+    try:
+        _current = CatalogSnapshot.load(directory, version)
+    except FileNotFoundError:
+        # pruned meanwhile by a process that saw a newer version; this one
+        # moves on at its next call, so serve an unsaved build until then
+        _current = CatalogSnapshot.build_from_db(version)
+    return _current
+
+
+def _version(path: Path) -> Optional[int]:
+    try:
+        return int(path.name[1:])
+    except ValueError:
+        return None
+
+
+def _prune_snapshots(root: Path, keep: Path, previous: int = 1):
+    """
+    Drop versions older than `keep` except the `previous` newest ones, which
+    processes that have not seen the new version yet may still be loading.
+    Processes already mapping a dropped version keep their pages. Another
+    process may be pruning at the same time.
+    """
+    current = _version(keep)
+    older = sorted(
+        (path for path in root.glob('v*') if (_version(path) or current) < current),
+        key=_version,
+        reverse=True,
+    )
+    for path in older[previous:]:
+        shutil.rmtree(path, ignore_errors=True)
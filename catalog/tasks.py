@@ -1,20 +1,24 @@
-import requests
 from celery import shared_task
-from openai import OpenAI
 from bs4 import BeautifulSoup
-from agent_chatbot.settings import OpenAIConfig
+from catalog import importer
+from catalog.embeddings import embed_vehicles, index_article_chunks
+from catalog.kb_index import bump_kb_version, get_kb_index
 from catalog.models import KnowledgeArticle
+from core.clients import get_http_session, get_openai_client
+from core.metrics import record_openai_usage
+from core.ratelimit import BACKGROUND, RateLimited, call_openai
 
 class KnowledgeArticleProcessor:
     """
     Helper to fetch HTML from URL and clean it via Python lib or LLM.
     """
     def __init__(self):
-        self.client = OpenAI(api_key=OpenAIConfig.API_KEY)
+        self.client = get_openai_client()
+        self.session = get_http_session()
 
     def fetch_html(self, url: str) -> str:
         """Downloads raw HTML from the given URL."""
-        resp = requests.get(url, timeout=10)
+        resp = self.session.get(url, timeout=10)
         resp.raise_for_status()
         return resp.text
 
@@ -41,23 +45,65 @@ class KnowledgeArticleProcessor:
             )},
             {"role": "user", "content": html}
         ]
-        response = self.client.chat.completions.create(
+        response = call_openai(
+            self.client.chat.completions.create,
+            priority=BACKGROUND,
             model="gpt-4-turbo",
             messages=prompt,
             temperature=0
         )
+        record_openai_usage("gpt-4-turbo", response.usage)
         return response.choices[0].message.content.strip()
 
     def process(self, article_id: str):
-        """Fetches, cleans, and updates the KnowledgeArticle text field."""
+        """
+        Fetches, cleans, and updates the KnowledgeArticle text field,
+        then re-indexes and embeds its passages for local KB retrieval.
+        """
         article = KnowledgeArticle.objects.filter(id=article_id).first()
         raw_html = self.fetch_html(article.url)
         text = self.clean_html(raw_html)
         article.text = text
         article.save()
+        get_kb_index().upsert_article(article)
+        index_article_chunks(article)
+        bump_kb_version()
 
-@shared_task
-def fetch_and_process_article(article_id: str):
+@shared_task(bind=True, max_retries=5)
+def fetch_and_process_article(self, article_id: str):
     """Celery task: fetch HTML and update the model."""
     processor = KnowledgeArticleProcessor()
-    processor.process(article_id)
+    try:
+        processor.process(article_id)
+    except RateLimited as e:
+        # give the worker slot back instead of sleeping through the quota
+        raise self.retry(exc=e, countdown=e.retry_after)
+
+
+@shared_task(bind=True, max_retries=5)
+def embed_article(self, article_id: str):
+    """Celery task: re-chunk and embed an article whose text was edited."""
+    article = KnowledgeArticle.objects.filter(id=article_id).first()
+    if article is None:
+        return
+    try:
+        index_article_chunks(article)
+    except RateLimited as e:
+        raise self.retry(exc=e, countdown=e.retry_after)
+
+
+@shared_task
+def import_vehicles(import_id: str):
+    """Celery task: run a VehicleImport (catalog.importer) and embed what changed."""
+    job = importer.run_import(import_id, on_changed=lambda stock_ids: embed_changed_vehicles.delay(stock_ids))
+    print(f"Vehicle import {job.id} {job.status}: {job.created} created, {job.updated} updated, "
+          f"{job.unchanged} unchanged, {job.error_count} rejected")
+
+
+@shared_task(bind=True, max_retries=5)
+def embed_changed_vehicles(self, stock_ids: list):
+    """Celery task: embed vehicles created or changed by an import or the API."""
+    try:
+        embed_vehicles(stock_ids)
+    except RateLimited as e:
+        raise self.retry(exc=e, countdown=e.retry_after)
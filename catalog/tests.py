@@ -1,3 +1,122 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from django.core.files.base import ContentFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from catalog.importer import parse_row, run_import
+from catalog.kb_index import BM25Index, analyze, chunk_text
+from catalog.models import KnowledgeArticle, Vehicle, VehicleImport
 
-# Create your tests here.
+
+class KBIndexTests(SimpleTestCase):
+    def article(self, name, text):
+        return KnowledgeArticle(name=name, text=text, date_updated=timezone.now())
+
+    def test_analyze_folds_and_stems(self):
+        self.assertEqual(analyze("Las garantías de los VEHÍCULOS"), ['garantia', 'vehiculo'])
+
+    def test_chunk_text_splits_on_sentences(self):
+        sentences = ["Uno dos tres cuatro cinco.", "Seis siete ocho nueve diez.", "Once doce trece catorce quince."]
+        self.assertEqual(chunk_text(" ".join(sentences), max_words=10), [" ".join(sentences[:2]), sentences[2]])
+
+    def test_chunk_text_merges_short_paragraphs(self):
+        self.assertEqual(chunk_text("Hola.\n\nUno dos tres cuatro.", max_words=10), ["Hola. Uno dos tres cuatro."])
+
+    def test_search_ranks_rare_terms_higher(self):
+        index = BM25Index()
+        warranty = self.article("Garantía", "La garantía cubre el motor y la transmisión por tres meses.")
+        financing = self.article("Financiamiento", "El financiamiento cubre hasta sesenta meses con enganche.")
+        index.upsert_article(warranty)
+        index.upsert_article(financing)
+        passages = index.search("¿la garantía cubre el motor?")
+        self.assertEqual([p.article_name for p in passages], ["Garantía", "Financiamiento"])
+        self.assertGreater(passages[0].score, passages[1].score)
+
+    def test_upsert_and_remove(self):
+        index = BM25Index()
+        article = self.article("Garantía", "La garantía cubre el motor.")
+        index.upsert_article(article)
+        article.text = "Las devoluciones se aceptan durante siete días."
+        index.upsert_article(article)
+        self.assertEqual(len(index), 1)
+        self.assertEqual(index.search("motor"), [])
+        self.assertEqual(len(index.search("devoluciones")), 1)
+        index.remove_article(article.id)
+        self.assertEqual(len(index), 0)
+        self.assertEqual(index.postings, {})
+
+
+HEADER = 'stock_id,km,price,make,model,year,version,bluetooth,car_play,largo,ancho,altura\n'
+
+
+def row(stock_id, km='1000', price='10000', year='2020'):
+    return f"{stock_id},{km},{price},Nissan,Versa,{year},Sense,si,false,4.4,1.7,1.5\n"
+
+
+class ParseRowTests(SimpleTestCase):
+    def fields(self, **values):
+        data = {'stock_id': 'S1', 'km': '1000', 'price': '1', 'make': 'Nissan', 'model': 'Versa', 'year': '2020'}
+        data.update(values)
+        return data
+
+    def test_valid_row(self):
+        values = parse_row(self.fields(km='1500.0', bluetooth='Sí'))
+        self.assertEqual(values[:2], ('S1', 1500))
+        self.assertTrue(values[7])
+
+    def test_invalid_rows(self):
+        next_year = str(timezone.now().year + 2)
+        for values in (
+            {'stock_id': ''}, {'km': '-1'}, {'km': str(2 ** 31)}, {'km': 'abc'}, {'km': ''},
+            {'year': '20'}, {'year': next_year}, {'year': ''}, {'make': 'x' * 101},
+        ):
+            with self.subTest(values=values), self.assertRaises(ValueError):
+                parse_row(self.fields(**values))
+
+
+class RunImportTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, ignore_errors=True)
+        # bump_catalog_version() writes to the cache on commit
+        settings = override_settings(
+            MEDIA_ROOT=media,
+            CATALOG_IMPORT_CHUNK_SIZE=2,
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def start(self, content: str) -> VehicleImport:
+        job = VehicleImport(size_bytes=len(content))
+        job.file.save('vehicles.csv', ContentFile(content.encode()), save=True)
+        return job
+
+    def test_counts_and_errors(self):
+        Vehicle.objects.create(stock_id='OLD', km=1000, price=10000, make='Nissan', model='Versa', year=2020,
+                               version='Sense', bluetooth=True, largo=4.4, ancho=1.7, altura=1.5)
+        # S1 repeats within a chunk: the last line wins, counted once
+        content = HEADER + row('S1') + row('S1', price='12000') + row('OLD') + row('BAD', km='-5') + row('S2')
+        changed = []
+        with self.captureOnCommitCallbacks(execute=True):
+            job = run_import(str(self.start(content).id), on_changed=changed.extend)
+        self.assertEqual(job.status, VehicleImport.DONE)
+        self.assertEqual(
+            (job.rows_processed, job.created, job.updated, job.unchanged, job.error_count), (4, 2, 0, 1, 1)
+        )
+        self.assertEqual(job.errors, [{'line': 5, 'stock_id': 'BAD', 'error': 'km must be between 0 and 2147483647'}])
+        self.assertEqual(Vehicle.objects.get(stock_id='S1').price, 12000)
+        self.assertEqual(sorted(changed), ['S1', 'S2'])
+
+    def test_rerun_starts_over(self):
+        job = self.start(HEADER + row('S1') + row('BAD', year='x'))
+        # what a failed first attempt left behind
+        VehicleImport.objects.filter(id=job.id).update(
+            status=VehicleImport.FAILED, rows_processed=7, created=5, error_count=3,
+            errors=[{'line': 9, 'stock_id': 'GONE', 'error': 'missing stock_id'}],
+        )
+        job = run_import(str(job.id))
+        self.assertEqual(
+            (job.rows_processed, job.created, job.updated, job.unchanged, job.error_count), (1, 1, 0, 0, 1)
+        )
+        self.assertEqual([error['stock_id'] for error in job.errors], ['BAD'])
@@ -1,9 +1,10 @@
 from rest_framework import routers
 from django.urls import path, include
-from catalog.views_api import VehicleViewSet, KnowledgeArticleViewSet
+from catalog.views_api import VehicleViewSet, VehicleImportViewSet, KnowledgeArticleViewSet
 
 router = routers.DefaultRouter()
 router.register(r'vehicles', VehicleViewSet, basename='vehicle')
+router.register(r'vehicle_imports', VehicleImportViewSet, basename='vehicleimport')
 router.register(r'knowledge_articles', KnowledgeArticleViewSet, basename='knowledgearticle')
 
 urlpatterns = [
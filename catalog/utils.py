@@ -1,17 +1,11 @@
-from catalog.models import Vehicle
+from catalog.snapshot import get_catalog_snapshot
 
 
 def get_vehicle_vocab():
     """
     Retrieve unique makes, models, and versions from the Vehicle catalog.
+    Served from the in-memory catalog snapshot, no DB round-trip.
     Returns:
         dict: {'makes': [...], 'models': [...], 'versions': [...]}
     """
-    makes = list(Vehicle.objects.values_list('make', flat=True).distinct())
-    models = list(Vehicle.objects.values_list('model', flat=True).distinct())
-    versions = list(Vehicle.objects.values_list('version', flat=True).distinct())
-    return {
-        "makes": makes,
-        "models": models,
-        "versions": versions
-    }
+    return get_catalog_snapshot().vehicle_vocab()
@@ -0,0 +1,89 @@
+import threading
+from typing import List, Tuple
+import numpy as np
+from catalog.embeddings import decode_vectors, get_embedder
+from catalog.kb_index import Passage, get_kb_version
+from catalog.models import KnowledgeChunk, Vehicle
+from catalog.snapshot import get_catalog_version
+from core.metrics import record_cache
+from core.ratelimit import LIVE
+
+
+class VectorIndex:
+    """
+    Brute-force cosine top-k over a float16 matrix of normalized vectors.
+    At catalog/KB sizes a blocked matrix-vector product beats any ANN setup.
+    """
+    block_rows = 8192
+
+    def __init__(self, keys: List, matrix: np.ndarray):
+        self.keys = keys
+        self.matrix = matrix.astype(np.float16)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, query: np.ndarray, k: int = 10, min_score: float = -1.0) -> List[Tuple[object, float]]:
+        if not self.keys:
+            return []
+        query = query.astype(np.float32)
+        # upcast block by block: NumPy has no fast float16 matmul
+        scores = np.concatenate([
+            self.matrix[i:i + self.block_rows].astype(np.float32) @ query
+            for i in range(0, len(self.keys), self.block_rows)
+        ])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self.keys[i], float(scores[i])) for i in top if scores[i] >= min_score]
+
+
+def _load(queryset, key_field: str) -> VectorIndex:
+    embedder = get_embedder()
+    rows = list(
+        queryset.filter(embedding_model=embedder.name, embedding__isnull=False)
+        .values_list(key_field, 'embedding')
+    )
+    keys = [key for key, _ in rows]
+    matrix = decode_vectors([blob for _, blob in rows], embedder.dim)
+    return VectorIndex(keys, matrix)
+
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cached(name: str, version, loader) -> VectorIndex:
+    with _cache_lock:
+        entry = _cache.get(name)
+        record_cache(f'vector_{name}', entry is not None and entry[0] == version)
+        if entry is None or entry[0] != version:
+            entry = (version, loader())
+            _cache[name] = entry
+        return entry[1]
+
+
+def get_vehicle_vector_index() -> VectorIndex:
+    """Vehicle embeddings keyed by stock_id, reloaded when the catalog version moves."""
+    return _cached('vehicles', get_catalog_version(), lambda: _load(Vehicle.objects.all(), 'stock_id'))
+
+
+def get_kb_vector_index() -> VectorIndex:
+    """KB chunk embeddings keyed by chunk id, reloaded when the KB version moves."""
+    return _cached(
+        'kb', get_kb_version(),
+        lambda: _load(KnowledgeChunk.objects.filter(article__active=True), 'id'),
+    )
+
+
+def semantic_vehicle_stock_ids(query: str, k: int = 10) -> List[str]:
+    return [key for key, _ in get_vehicle_vector_index().search(get_embedder().embed_one(query, LIVE), k)]
+
+
+def semantic_kb_passages(query: str, k: int = 4, min_score: float = 0.0) -> List[Passage]:
+    hits = get_kb_vector_index().search(get_embedder().embed_one(query, LIVE), k, min_score)
+    chunks = KnowledgeChunk.objects.select_related('article').in_bulk([key for key, _ in hits])
+    return [
+        Passage(str(chunks[key].article_id), chunks[key].article.name or '', chunks[key].text, score)
+        for key, score in hits if key in chunks
+    ]
@@ -1,13 +1,16 @@
-import csv
-import io
-from rest_framework import viewsets
+from django.db import transaction
+from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.parsers import MultiPartParser, FormParser
-from catalog.models import Vehicle, KnowledgeArticle
-from catalog.serializers import VehicleSerializer, VehicleImportSerializer, KnowledgeArticleSerializer
-from catalog.tasks import fetch_and_process_article
+from catalog.kb_index import bump_kb_version
+from catalog.models import Vehicle, VehicleImport, KnowledgeArticle
+from catalog.serializers import (
+    VehicleSerializer, VehicleImportSerializer, VehicleImportStatusSerializer, KnowledgeArticleSerializer
+)
+from catalog.snapshot import bump_catalog_version
+from catalog.tasks import embed_article, embed_changed_vehicles, fetch_and_process_article, import_vehicles
 
 
 class VehicleViewSet(viewsets.ModelViewSet):
@@ -16,6 +19,21 @@ class VehicleViewSet(viewsets.ModelViewSet):
     serializer_class = VehicleSerializer
     permission_classes = [IsAuthenticated]
 
+    # the embedding is computed by a worker, off the request
+    def perform_create(self, serializer):
+        vehicle = serializer.save()
+        transaction.on_commit(lambda: embed_changed_vehicles.delay([vehicle.stock_id]))
+        bump_catalog_version()
+
+    def perform_update(self, serializer):
+        vehicle = serializer.save()
+        transaction.on_commit(lambda: embed_changed_vehicles.delay([vehicle.stock_id]))
+        bump_catalog_version()
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        bump_catalog_version()
+
     @action(
         detail=False,
         methods=['post'],
@@ -27,56 +45,25 @@ class VehicleViewSet(viewsets.ModelViewSet):
     def import_csv(self, request):
         """
         Authenticated users only: bulk import or update Vehicles via CSV.
-        Uses a serializer to validate file upload and batch operations.
+        The upload is stored and imported in the background (catalog.importer);
+        follow its progress at the returned status URL.
         """
-        # Validate uploaded file
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         csv_file = serializer.validated_data['file']
+        job = VehicleImport.objects.create(file=csv_file, size_bytes=csv_file.size)
+        transaction.on_commit(lambda: import_vehicles.delay(str(job.id)))
+        status_serializer = VehicleImportStatusSerializer(job, context=self.get_serializer_context())
+        return Response(status_serializer.data, status=status.HTTP_202_ACCEPTED)
 
-        # Read and parse CSV
-        decoded = csv_file.read().decode('utf-8')
-        reader = csv.DictReader(io.StringIO(decoded))
-        rows = [row for row in reader if row.get('stock_id')]
-        stock_ids = [row['stock_id'] for row in rows]
-
-        # Fetch existing vehicles
-        existing_qs = Vehicle.objects.filter(stock_id__in=stock_ids)
-        existing_map = {v.stock_id: v for v in existing_qs}
-
-        to_create, to_update = [], []
-        for row in rows:
-            stock_id = row['stock_id']
-            data = {
-                'km': int(row.get('km', 0) or 0),
-                'price': float(row.get('price', 0) or 0),
-                'make': row.get('make', ''),
-                'model': row.get('model', ''),
-                'year': int(row.get('year', 0) or 0),
-                'version': row.get('version', ''),
-                'bluetooth': row.get('bluetooth', '').lower() in ['true','1','yes', 'si', 'sí'],
-                'car_play': row.get('car_play', '').lower() in ['true','1','yes', 'si', 'sí'],
-                'largo': float(row.get('largo', 0) or 0),
-                'ancho': float(row.get('ancho', 0) or 0),
-                'altura': float(row.get('altura', 0) or 0),
-            }
-            if stock_id in existing_map:
-                veh = existing_map[stock_id]
-                for field, val in data.items():
-                    setattr(veh, field, val)
-                to_update.append(veh)
-            else:
-                to_create.append(Vehicle(stock_id=stock_id, **data))
-
-        # Bulk create and update
-        created_count = len(to_create)
-        updated_count = len(to_update)
-        if to_create:
-            Vehicle.objects.bulk_create(to_create)
-        if to_update:
-            Vehicle.objects.bulk_update(to_update, fields=list(data.keys()))
-
-        return Response({'created': created_count, 'updated': updated_count})
+class VehicleImportViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Status of background vehicle CSV imports: progress counters and the
+    first rejected rows (line, stock_id, error).
+    """
+    queryset = VehicleImport.objects.all().order_by('-date_created')
+    serializer_class = VehicleImportStatusSerializer
+    permission_classes = [IsAuthenticated]
 
 class KnowledgeArticleViewSet(viewsets.ModelViewSet):
     """
@@ -88,11 +75,23 @@ class KnowledgeArticleViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         article = serializer.save()
+        bump_kb_version()
+        # fetching the URL re-chunks and embeds the article too
         if article.url:
-            fetch_and_process_article.delay(article.id)
+            transaction.on_commit(lambda: fetch_and_process_article.delay(article.id))
+        elif article.text:
+            transaction.on_commit(lambda: embed_article.delay(str(article.id)))
 
     def perform_update(self, serializer):
+        old_text = serializer.instance.text
         article = serializer.save()
+        bump_kb_version()
         # only re-fetch if URL changed or newly provided
         if 'url' in serializer.validated_data and article.url:
-            fetch_and_process_article.delay(article.id)
\ No newline at end of file
+            transaction.on_commit(lambda: fetch_and_process_article.delay(article.id))
+        elif article.text != old_text:
+            transaction.on_commit(lambda: embed_article.delay(str(article.id)))
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        bump_kb_version()
\ No newline at end of file
@@ -1,13 +1,27 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, HttpResponseBadRequest
 from django.views.decorators.csrf import csrf_exempt
-from rest_framework.decorators import api_view, authentication_classes, permission_classes, action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework import viewsets, status
 
 
-from chat.models import Channel, Message
-from chat.serializers import ChannelSerializer, MessageSerializer
-from chat.tasks import process_and_reply
+from datetime import timedelta
+from django.utils import timezone
+from twilio.request_validator import RequestValidator
+from agent_chatbot.settings import PipelineConfig, TwilioConfig
+from chat.archive import channel_messages
+from chat.ingest import claim_message_sid, enqueue_reply, release_message_sid
+from chat.models import Channel, Message, OutboundMessage, PipelineRun
+from chat.outbox import record_status
+from chat.serializers import ChannelSerializer, MessageSerializer, OutboundMessageSerializer, PipelineRunSerializer
+from chat.store import forget_conversation
+from chat.tracing import percentile, stage_stats
+from core.metrics import track_view
+
+TWIML_ACK = "<Response></Response>"
 
 class ChannelViewSet(viewsets.ModelViewSet):
     """
@@ -17,14 +31,28 @@ class ChannelViewSet(viewsets.ModelViewSet):
     serializer_class = ChannelSerializer
     permission_classes = [IsAuthenticated]
 
+    def perform_update(self, serializer):
+        old_ext_id = serializer.instance.external_id
+        channel = serializer.save()
+        forget_conversation(old_ext_id)
+        forget_conversation(channel.external_id)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        forget_conversation(instance.external_id)
+
 
     @action(detail=True, methods=['get'], url_path='messages')
     def messages(self, request, pk=None):
         """
-        Returns all messages belonging to this channel.
+        Returns all messages belonging to this channel, including the ones
+        moved to archive files.
         """
         channel = self.get_object()
-        msgs = Message.objects.filter(channel=channel).order_by('date_created')
+        if channel.archives.exists():
+            msgs = channel_messages(channel)
+        else:
+            msgs = Message.objects.filter(channel=channel).order_by('date_created')
         page = self.paginate_queryset(msgs)
         if page is not None:
             serializer = MessageSerializer(page, many=True)
@@ -48,37 +76,169 @@ class MessageViewSet(viewsets.ModelViewSet):
             qs = qs.filter(channel_id=channel_id)
         return qs
 
+    # edits outside the webhook invalidate the channel's cached history
+    def perform_create(self, serializer):
+        message = serializer.save()
+        forget_conversation(message.channel.external_id, messages_only=True)
+
+    def perform_update(self, serializer):
+        message = serializer.save()
+        forget_conversation(message.channel.external_id, messages_only=True)
+
+    def perform_destroy(self, instance):
+        instance.delete()
+        forget_conversation(instance.channel.external_id, messages_only=True)
+
+class PipelineRunViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to pipeline traces. Filter by `?channel=<uuid>` or `?message=<uuid>`.
+    """
+    queryset = PipelineRun.objects.all().order_by('-date_created')
+    serializer_class = PipelineRunSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        for param in ('channel', 'message', 'mode'):
+            value = self.request.query_params.get(param)
+            if value:
+                qs = qs.filter(**{param: value})
+        return qs
+
+    @action(detail=False, methods=['get'], url_path='stats')
+    def stats(self, request):
+        """
+        p50/p95 latency, tokens and DB queries per stage over the last
+        `?hours=` (default 24), using at most `?limit=` runs (default 5000).
+        """
+        try:
+            hours = float(request.query_params.get('hours', 24))
+            limit = int(request.query_params.get('limit', 5000))
+        except ValueError:
+            return Response("hours and limit must be numbers", status=status.HTTP_400_BAD_REQUEST)
+        runs = list(
+            self.get_queryset()
+            .filter(date_created__gte=timezone.now() - timedelta(hours=hours))
+            .values_list('total_ms', 'spans')[:limit]
+        )
+        totals = [total for total, _ in runs]
+        return Response({
+            'runs': len(runs),
+            'hours': hours,
+            'total': {
+                'p50_ms': round(percentile(totals, 50), 2),
+                'p95_ms': round(percentile(totals, 95), 2),
+            },
+            'stages': stage_stats([spans for _, spans in runs]),
+        })
+
+class OutboundMessageViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Read-only access to the WhatsApp outbox. Filter by `?channel=<uuid>`,
+    `?status=` (pending/sending/sent/failed) or `?delivery_status=`.
+    """
+    queryset = OutboundMessage.objects.all().order_by('-date_created')
+    serializer_class = OutboundMessageSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        qs = super().get_queryset()
+        for param in ('channel', 'status', 'delivery_status'):
+            value = self.request.query_params.get(param)
+            if value:
+                qs = qs.filter(**{param: value})
+        return qs
+
+def _twilio_signature_ok(request, params, url: str = '') -> bool:
+    validator = RequestValidator(TwilioConfig.AUTH_TOKEN or '')
+    url = url or TwilioConfig.WEBHOOK_URL or request.build_absolute_uri()
+    return validator.validate(url, params, request.headers.get('X-Twilio-Signature', ''))
+
+
 @csrf_exempt
-@api_view(['GET', 'POST'])
-@authentication_classes([])     # disable any DRF authentication
-@permission_classes([AllowAny]) # allow anonymous POSTs
-def twilio_inbound(request):
+@track_view('twilio_inbound')
+async def twilio_inbound(request):
     """
-    Webhook for incoming Twilio messages (WhatsApp).
-    - Creates or retrieves a Channel per WaId (sender).
-    - Persists each Message.
-    - Replies with a simple acknowledgement.
+    Webhook for incoming Twilio messages (WhatsApp), async so one ASGI
+    process (the `ingest` service) absorbs webhook bursts.
+    - Validates X-Twilio-Signature (TWILIO_VALIDATE_SIGNATURE).
+    - Drops Twilio retries: a MessageSid already seen is acknowledged only.
+    - Enqueues the reply; channel and message are persisted by the worker
+      (or here, with CHAT_DEBOUNCE_SECONDS > 0, before scheduling the reply).
+    - Replies with an empty TwiML acknowledgement.
     """
-    data = request.data
+    if request.method != 'POST':
+        return HttpResponse(status=405)
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            err = "Invalid request: body is not a JSON object"
+            print(err)
+            return HttpResponseBadRequest(err)
+    else:
+        data = request.POST.dict()
 
-    # extract WhatsApp ID and message body in one line each
-    ext_id   = data.get('From', '').replace('whatsapp:', '')
-    msg_body =(data.get('Body') or (data.get('Body')[0] if isinstance(data.get('Body'), list) else "")) 
+    if TwilioConfig.VALIDATE_SIGNATURE and not _twilio_signature_ok(request, data):
+        print(f"Invalid Twilio signature for {data.get('MessageSid')}")
+        return HttpResponse('Invalid signature', status=403)
+
+    ext_id = data.get('From', '').replace('whatsapp:', '')
+    msg_body = data.get('Body') or ''
 
     if not ext_id:
         err = f"Invalid request: missing 'From' field in data: {data}"
         print(err)
-        return Response(err, status=status.HTTP_400_BAD_REQUEST)
+        return HttpResponseBadRequest(err)
 
     if not msg_body:
         err = f"Invalid request: missing 'Body' field in data: {data}"
         print(err)
-        return Response(err, status=status.HTTP_400_BAD_REQUEST)
-    
+        return HttpResponseBadRequest(err)
+
     profile = data.get('ProfileName', None) or ""
-    
-    # process the heavy work asynchronously
-    process_and_reply.delay(ext_id, profile, msg_body)
+
+    message_sid = data.get('MessageSid') or data.get('SmsMessageSid')
+    if message_sid and not await claim_message_sid(message_sid):
+        print(f"Ignoring duplicate webhook for {message_sid}")
+        return HttpResponse(TWIML_ACK, content_type='application/xml')
+
+    # process the heavy work asynchronously (broker publish off the event loop).
+    # With a debounce window enqueue_reply also writes to the database, which
+    # must stay on the thread whose connections Django closes after the request.
+    enqueue = sync_to_async(enqueue_reply, thread_sensitive=PipelineConfig.DEBOUNCE_SECONDS > 0)
+    try:
+        await enqueue(ext_id, profile, msg_body)
+    except Exception:
+        # let Twilio's retry through instead of acknowledging it as a duplicate
+        if message_sid:
+            await release_message_sid(message_sid)
+        raise
 
     # respond to Twilio
-    return Response("<Response><Response/>", content_type='application/xml', status=status.HTTP_200_OK)
\ No newline at end of file
+    return HttpResponse(TWIML_ACK, content_type='application/xml')
+
+
+@csrf_exempt
+@track_view('twilio_status')
+def twilio_status(request):
+    """
+    Twilio status callback (TWILIO_STATUS_CALLBACK_URL): records the
+    delivery status (sent/delivered/read/undelivered/failed) of an
+    outbound message.
+    """
+    if request.method != 'POST':
+        return HttpResponse(status=405)
+    data = request.POST.dict()
+    if TwilioConfig.VALIDATE_SIGNATURE and not _twilio_signature_ok(request, data, TwilioConfig.STATUS_CALLBACK_URL):
+        print(f"Invalid Twilio signature for status of {data.get('MessageSid')}")
+        return HttpResponse('Invalid signature', status=403)
+    message_sid = data.get('MessageSid')
+    delivery_status = data.get('MessageStatus')
+    if not message_sid or not delivery_status:
+        return HttpResponseBadRequest("missing 'MessageSid' or 'MessageStatus'")
+    if not record_status(message_sid, delivery_status, data.get('ErrorCode') or ''):
+        print(f"Status {delivery_status} for unknown message {message_sid}")
+    return HttpResponse(status=204)
@@ -0,0 +1,171 @@
+import io
+import json
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Iterator, List, Optional
+import zstandard
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from chat.models import Channel, ChannelArchive, Message
+from chat.store import forget_conversation
+
+# the archiver works in days; an hour of slack in last_message_at is enough
+LAST_MESSAGE_RESOLUTION = timedelta(hours=1)
+
+
+def _archive_root() -> Path:
+    return Path(settings.CHAT_ARCHIVE_DIR)
+
+
+def touch_channel(channel: Channel, message: Message):
+    """
+    Record the channel's latest activity (Channel.last_message_at). Written
+    at most every LAST_MESSAGE_RESOLUTION so busy channels don't rewrite
+    their row on every message.
+    """
+    Channel.objects.filter(id=channel.id).filter(
+        Q(last_message_at__isnull=True) | Q(last_message_at__lt=message.date_created - LAST_MESSAGE_RESOLUTION)
+    ).update(last_message_at=message.date_created)
+
+
+def write_archive(channel: Channel, messages: List[Message]) -> ChannelArchive:
+    """
+    Write messages as zstd-compressed NDJSON (one message per line) with an
+    atomic rename, and return the unsaved ChannelArchive describing it.
+    """
+    directory = _archive_root() / str(channel.id)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{timezone.now():%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}.ndjson.zst"
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as raw, zstandard.ZstdCompressor(level=10).stream_writer(raw) as out:
+        for m in messages:
+            line = json.dumps({
+                "id": str(m.id),
+                "author": m.author,
+                "text": m.text,
+                "date_created": m.date_created.isoformat(),
+                "date_updated": m.date_updated.isoformat(),
+            }, ensure_ascii=False)
+            out.write(line.encode('utf-8') + b"\n")
+    os.replace(tmp, path)
+    return ChannelArchive(
+        channel=channel,
+        path=str(path.relative_to(_archive_root())),
+        message_count=len(messages),
+        first_message_at=messages[0].date_created,
+        last_message_at=messages[-1].date_created,
+        size_bytes=path.stat().st_size,
+    )
+
+
+def read_archive(archive: ChannelArchive, start: int = 0, stop: Optional[int] = None) -> Iterator[Message]:
+    """
+    Archived messages `start`..`stop` as unsaved Message instances, oldest
+    first. The file is decompressed as a stream and only the requested
+    lines are decoded.
+    """
+    with open(_archive_root() / archive.path, 'rb') as raw, zstandard.ZstdDecompressor().stream_reader(raw) as stream:
+        for line in islice(io.TextIOWrapper(stream, encoding='utf-8'), start, stop):
+            data = json.loads(line)
+            yield Message(
+                id=uuid.UUID(data["id"]),
+                channel=archive.channel,
+                author=data["author"],
+                text=data["text"],
+                date_created=datetime.fromisoformat(data["date_created"]),
+                date_updated=datetime.fromisoformat(data["date_updated"]),
+            )
+
+
+class ChannelMessages:
+    """
+    Archived and live messages of a channel, oldest first, as a lazy
+    sequence for Django's Paginator: the count comes from the archives'
+    message_count and one COUNT query, and a slice only reads the archive
+    lines it covers and the live rows it needs (LIMIT/OFFSET).
+    """
+
+    def __init__(self, channel: Channel):
+        self.archives = list(channel.archives.order_by('first_message_at'))
+        self.live = channel.messages.order_by('date_created')
+
+    def count(self) -> int:
+        return sum(a.message_count for a in self.archives) + self.live.count()
+
+    def __len__(self) -> int:
+        return self.count()
+
+    def __iter__(self) -> Iterator[Message]:
+        for archive in self.archives:
+            yield from read_archive(archive)
+        yield from self.live.iterator()
+
+    def __getitem__(self, index):
+        if not isinstance(index, slice):
+            return self[index:index + 1][0]
+        start, stop = index.start or 0, index.stop
+        messages = []
+        offset = 0
+        for archive in self.archives:
+            end = offset + archive.message_count
+            if end > start and (stop is None or offset < stop):
+                messages.extend(read_archive(
+                    archive, max(start - offset, 0), None if stop is None else min(stop, end) - offset
+                ))
+            offset = end
+        live_start = max(start - offset, 0)
+        live_stop = None if stop is None else max(stop - offset, 0)
+        if live_stop is None or live_stop > live_start:
+            messages.extend(self.live[live_start:live_stop])
+        return messages
+
+
+def channel_messages(channel: Channel) -> ChannelMessages:
+    """Archived and live messages of a channel, oldest first (paginate it)."""
+    return ChannelMessages(channel)
+
+
+def archive_channel(channel: Channel) -> Optional[ChannelArchive]:
+    """
+    Move every message of a channel into a new archive file. The file is
+    written first; the rows are only deleted once the archive is recorded.
+    """
+    messages = list(channel.messages.order_by('date_created'))
+    if not messages:
+        return None
+    archive = write_archive(channel, messages)
+    try:
+        with transaction.atomic():
+            archive.save()
+            Message.objects.filter(channel=channel, id__in=[m.id for m in messages]).delete()
+            # unless a message arrived meanwhile, nothing is left to archive
+            Channel.objects.filter(id=channel.id, last_message_at__lte=archive.last_message_at).update(
+                last_message_at=None
+            )
+    except Exception:
+        (_archive_root() / archive.path).unlink(missing_ok=True)
+        raise
+    forget_conversation(channel.external_id)
+    return archive
+
+
+def archive_idle_channels(retention_days: int, limit: int = 500) -> List[ChannelArchive]:
+    """
+    Archive channels whose latest message is older than `retention_days`
+    (an index scan on Channel.last_message_at).
+    """
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    channels = Channel.objects.filter(last_message_at__lt=cutoff).order_by('last_message_at')[:limit]
+    archives = []
+    for channel in channels:
+        archive = archive_channel(channel)
+        if archive:
+            print(f"Archived {archive.message_count} messages of channel {channel.external_id} to {archive.path}")
+            archives.append(archive)
+    return archives
@@ -0,0 +1,137 @@
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_TOKEN_BUDGETS = {
+    "transcript": 1500,
+    "summary": 400,
+    "last_user_message": 300,
+    "vehicles": 1500,
+    "extra": 1500,
+}
+
+
+@lru_cache(maxsize=8)
+def get_encoding(model: str):
+    """
+    Tokenizer for the model, loaded once per process. Returns None when
+    tiktoken (or its BPE files) is unavailable; counts are then estimated.
+    """
+    try:
+        import tiktoken
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+def count_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    encoding = get_encoding(model)
+    if encoding is None:
+        # ~4 characters per token for Spanish/English prose
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_tokens(text: str, max_tokens: int, model: str) -> str:
+    """Cut text to at most max_tokens, keeping the beginning."""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is None:
+        return text[: max_tokens * 4]
+    tokens = encoding.encode(text, disallowed_special=())
+    return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+
+
+class PromptBudget:
+    """
+    Keeps each prompt section under its token budget and records usage.
+
+    - transcript: keeps the most recent lines
+    - summary / last user message: truncated
+    - vehicles: keeps the CSV header and the first (best-ranked) rows
+    - extra: keeps whole passages in rank order, truncating the last one
+    """
+
+    def __init__(self, model: str, budgets: Optional[Dict[str, int]] = None):
+        self.model = model
+        self.budgets = {**DEFAULT_TOKEN_BUDGETS, **(budgets or {})}
+        self.usage: Dict[str, dict] = {}
+
+    def _record(self, section: str, before: int, after: int):
+        self.usage[section] = {
+            "tokens": after,
+            "budget": self.budgets[section],
+            "truncated": after < before,
+            "original_tokens": before,
+        }
+
+    def _keep(self, items: List[str], budget: int, reverse: bool = False) -> Tuple[List[str], int]:
+        kept, used = [], 0
+        for item in (reversed(items) if reverse else items):
+            cost = count_tokens(item, self.model) + 1
+            if used + cost > budget:
+                break
+            kept.append(item)
+            used += cost
+        return (kept[::-1] if reverse else kept), used
+
+    def fit_transcript(self, transcript: str) -> str:
+        budget = self.budgets["transcript"]
+        before = count_tokens(transcript, self.model)
+        if before <= budget:
+            self._record("transcript", before, before)
+            return transcript
+        lines, used = self._keep(transcript.split("\n"), budget, reverse=True)
+        self._record("transcript", before, used)
+        return "\n".join(lines)
+
+    def _fit_text(self, section: str, text: str) -> str:
+        budget = self.budgets[section]
+        before = count_tokens(text, self.model)
+        fitted = truncate_tokens(text, budget, self.model) if before > budget else text
+        self._record(section, before, count_tokens(fitted, self.model))
+        return fitted
+
+    def fit_summary(self, summary: str) -> str:
+        return self._fit_text("summary", summary)
+
+    def fit_last_user_message(self, text: str) -> str:
+        return self._fit_text("last_user_message", text)
+
+    def fit_vehicles(self, vehicles_csv: str) -> str:
+        budget = self.budgets["vehicles"]
+        before = count_tokens(vehicles_csv, self.model)
+        if before <= budget or not vehicles_csv:
+            self._record("vehicles", before, before)
+            return vehicles_csv
+        header, *rows = vehicles_csv.strip().splitlines()
+        header_cost = count_tokens(header, self.model) + 1
+        kept, used = self._keep(rows, budget - header_cost)
+        self._record("vehicles", before, used + header_cost)
+        return "\n".join([header, *kept]) + "\n"
+
+    def fit_extra(self, extra: str) -> str:
+        budget = self.budgets["extra"]
+        before = count_tokens(extra, self.model)
+        if before <= budget or not extra:
+            self._record("extra", before, before)
+            return extra
+        passages = [p for p in extra.split("\n\n") if p.strip()]
+        kept, used = self._keep(passages, budget)
+        if len(kept) < len(passages):
+            remainder = truncate_tokens(passages[len(kept)], budget - used - 1, self.model)
+            if remainder:
+                kept.append(remainder)
+                used += count_tokens(remainder, self.model) + 1
+        self._record("extra", before, used)
+        return "\n\n".join(kept)
+
+    def report(self, prompt: List[dict]) -> dict:
+        """Per-section usage plus the total size of the final prompt."""
+        total = sum(count_tokens(m["content"], self.model) for m in prompt)
+        return {"sections": self.usage, "prompt_tokens": total}
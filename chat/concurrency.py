@@ -0,0 +1,49 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Tuple
+from django.db import connections
+
+
+class StageGraph:
+    """
+    Minimal dependency-graph runner for pipeline stages.
+
+    Stages are registered in topological order with the names of the stages
+    they depend on; each stage is called with its dependencies' results as
+    keyword arguments and starts as soon as those are available, so
+    independent stages (e.g. two LLM calls) overlap on the thread pool.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self.max_workers = max_workers
+        self._stages: Dict[str, Tuple[Callable[..., Any], Tuple[str, ...]]] = {}
+
+    def add(self, name: str, fn: Callable[..., Any], deps: Iterable[str] = ()):
+        deps = tuple(deps)
+        missing = [d for d in deps if d not in self._stages]
+        if missing:
+            raise ValueError(f"Stage '{name}' depends on unknown stage(s): {missing}")
+        self._stages[name] = (fn, deps)
+        return self
+
+    def run(self) -> Dict[str, Any]:
+        """
+        Execute every stage and return {stage name: result}.
+        The first stage exception is re-raised once all stages settle.
+        """
+        futures: Dict[str, Future] = {}
+        # FIFO submission in topological order guarantees the earliest
+        # unfinished stage always holds a thread, so waiting cannot deadlock.
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='stage') as pool:
+            for name, (fn, deps) in self._stages.items():
+                dep_futures = {d: futures[d] for d in deps}
+                futures[name] = pool.submit(self._run_stage, fn, dep_futures)
+        return {name: future.result() for name, future in futures.items()}
+
+    @staticmethod
+    def _run_stage(fn: Callable[..., Any], dep_futures: Dict[str, Future]):
+        kwargs = {name: future.result() for name, future in dep_futures.items()}
+        try:
+            return fn(**kwargs)
+        finally:
+            # worker threads open their own DB connections; don't leak them
+            connections.close_all()
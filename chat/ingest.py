@@ -0,0 +1,102 @@
+from typing import Optional, Tuple
+from agent_chatbot.settings import PipelineConfig, TwilioConfig
+from chat.archive import touch_channel
+from chat.models import Channel, Message
+from chat.store import get_conversation_store
+from core.clients import get_async_redis, get_redis
+
+
+def ingest_message(ext_id: str, profile_name: str, msg_body: str) -> Tuple[Channel, Message]:
+    """
+    Find or create the Channel (cached per external_id with the conversation
+    store) and persist the incoming message (written through to the store).
+    """
+    store = get_conversation_store()
+    channel = store.get_channel(ext_id) if store else None
+    if channel is None:
+        channel, _ = Channel.objects.get_or_create(external_id=ext_id)
+        if store:
+            store.remember_channel(channel)
+    message = Message.objects.create(channel=channel, text=msg_body, author=profile_name)
+    touch_channel(channel, message)
+    if store:
+        store.append(channel, message)
+    return channel, message
+
+
+def get_channel(ext_id: str) -> Optional[Channel]:
+    store = get_conversation_store()
+    channel = store.get_channel(ext_id) if store else None
+    return channel or Channel.objects.filter(external_id=ext_id).first()
+
+
+# --- burst debounce ----------------------------------------------------------
+#
+# Every inbound message overwrites `chat:debounce:<ext_id>` with its own id and
+# schedules a reply after the quiet period. A scheduled run only proceeds while
+# its message is still the latest one; otherwise a newer message superseded it
+# and that message's run will answer the whole burst.
+
+def _debounce_key(ext_id: str) -> str:
+    return f"chat:debounce:{ext_id}"
+
+
+def mark_latest(ext_id: str, message_id: str, ttl_seconds: int):
+    get_redis().set(_debounce_key(ext_id), message_id, ex=ttl_seconds)
+
+
+def is_latest(ext_id: str, message_id: str) -> bool:
+    latest = get_redis().get(_debounce_key(ext_id))
+    # a missing key (expired/flushed) never blocks a reply
+    return latest is None or latest.decode() == message_id
+
+
+# --- webhook ingest ----------------------------------------------------------
+
+def _sid_key(message_sid: str) -> str:
+    return f"twilio:sid:{message_sid}"
+
+
+async def claim_message_sid(message_sid: str) -> bool:
+    """
+    Remember Twilio's MessageSid for TwilioConfig.DEDUPE_TTL seconds. Returns
+    False when it was already seen, i.e. the webhook is a retry.
+    """
+    try:
+        return bool(await get_async_redis().set(_sid_key(message_sid), 1, nx=True, ex=TwilioConfig.DEDUPE_TTL))
+    except Exception as e:
+        # never drop a message because Redis is unavailable
+        print(f"Error deduplicating {message_sid}: {e}")
+        return True
+
+
+async def release_message_sid(message_sid: str):
+    """Forget a claimed MessageSid, so Twilio's retry of a message we failed to enqueue is processed."""
+    try:
+        await get_async_redis().delete(_sid_key(message_sid))
+    except Exception as e:
+        print(f"Error releasing {message_sid}: {e}")
+
+
+def enqueue_reply(ext_id: str, profile_name: str, msg_body: str):
+    """
+    Hand an inbound message to the workers. With a debounce window the
+    message is persisted now and the reply scheduled after the quiet period.
+    In "dag" mode the reply runs as a chain of stage tasks (chat.stages).
+    """
+    # imported here: chat.tasks imports this module
+    from chat.tasks import process_and_reply, reply_to_burst, start_stage_pipeline
+
+    dag = PipelineConfig.PIPELINE_MODE == 'dag'
+    window = PipelineConfig.DEBOUNCE_SECONDS
+    if window > 0:
+        _, message = ingest_message(ext_id, profile_name, msg_body)
+        mark_latest(ext_id, str(message.id), ttl_seconds=int(window * 10) + 60)
+        if dag:
+            start_stage_pipeline(ext_id, profile_name, message_id=str(message.id), countdown=window)
+        else:
+            reply_to_burst.apply_async((ext_id, profile_name, str(message.id)), countdown=window)
+    elif dag:
+        start_stage_pipeline(ext_id, profile_name, msg_body=msg_body)
+    else:
+        process_and_reply.delay(ext_id, profile_name, msg_body)
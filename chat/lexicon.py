@@ -0,0 +1,73 @@
+"""
+Static Spanish vocabulary used by the local typo normalizer (chat.normalizer).
+Entries keep their canonical spelling (accents, capitalization); the catalog
+vocabulary (makes, models, versions) is added at runtime.
+"""
+
+MEXICAN_PLACES = [
+    "Aguascalientes", "Acapulco", "Baja California", "Campeche", "Cancún", "Celaya", "Chetumal",
+    "Chiapas", "Chihuahua", "Ciudad de México", "Ciudad Juárez", "Coahuila", "Colima", "Cuernavaca",
+    "Culiacán", "Durango", "Ecatepec", "Ensenada", "Guadalajara", "Guanajuato", "Guerrero", "Hermosillo",
+    "Hidalgo", "Irapuato", "Jalisco", "León", "Mazatlán", "Mérida", "Mexicali", "México", "Michoacán",
+    "Monterrey", "Morelia", "Morelos", "Naucalpan", "Nayarit", "Nezahualcóyotl", "Oaxaca", "Pachuca",
+    "Puebla", "Querétaro", "Quintana Roo", "Reynosa", "Saltillo", "San Luis Potosí", "Sinaloa", "Sonora",
+    "Tabasco", "Tamaulipas", "Tampico", "Tepic", "Tijuana", "Tlalnepantla", "Tlaxcala", "Toluca",
+    "Torreón", "Tuxtla", "Veracruz", "Villahermosa", "Xalapa", "Yucatán", "Zacatecas", "Zapopan",
+    "CDMX", "Kavak",
+]
+
+SPANISH_WORDS = [
+    # articles, pronouns, prepositions, conjunctions
+    "el", "la", "los", "las", "un", "una", "unos", "unas", "lo", "al", "del", "de", "en", "con", "sin",
+    "por", "para", "a", "ante", "bajo", "desde", "entre", "hacia", "hasta", "sobre", "tras", "según",
+    "y", "e", "o", "u", "ni", "pero", "sino", "que", "porque", "pues", "como", "cuando", "donde",
+    "si", "sí", "no", "ya", "también", "tampoco", "muy", "más", "menos", "mas", "tan", "tanto",
+    "yo", "tú", "tu", "él", "ella", "usted", "ustedes", "nosotros", "ellos", "ellas", "me", "te", "se",
+    "le", "les", "nos", "mi", "mis", "tus", "su", "sus", "nuestro", "nuestra", "mío", "tuyo", "suyo",
+    "este", "esta", "esto", "estos", "estas", "ese", "esa", "eso", "esos", "esas", "aquel", "aquella",
+    "qué", "quién", "quiénes", "cuál", "cuáles", "cuánto", "cuánta", "cuántos", "cuántas", "cómo",
+    "dónde", "cuándo", "cual", "cuales", "cuanto", "cuanta", "cuantos", "cuantas", "quien",
+    "algo", "alguno", "alguna", "algunos", "algunas", "algún", "nada", "nadie", "ningún", "ninguno",
+    "ninguna", "otro", "otra", "otros", "otras", "todo", "toda", "todos", "todas", "mismo", "misma",
+    "cada", "varios", "varias", "mucho", "mucha", "muchos", "muchas", "poco", "poca", "pocos", "pocas",
+    # common verbs and forms
+    "ser", "es", "son", "era", "fue", "sea", "estar", "está", "están", "estoy", "estamos", "estaba",
+    "haber", "hay", "había", "he", "ha", "han", "hemos", "tener", "tengo", "tiene", "tienen", "tienes",
+    "tenemos", "tenga", "tengan", "hacer", "hago", "hace", "hacen", "puedo", "puede", "pueden", "puedes",
+    "podemos", "podría", "poder", "quiero", "quiere", "quieren", "quieres", "queremos", "querer",
+    "quisiera", "necesito", "necesita", "necesitan", "necesitas", "necesitamos", "necesitar", "busco",
+    "busca", "buscan", "buscas", "buscando", "buscar", "comprar", "compro", "compra", "comprarlo",
+    "comprarla", "vender", "vendo", "venden", "vende", "venta", "ventas", "pagar", "pago", "pagos",
+    "dar", "doy", "da", "dan", "ver", "veo", "ir", "voy", "va", "van", "vamos", "venir", "vengo",
+    "saber", "sé", "sabe", "conocer", "interesa", "interesan", "interesado", "interesada", "gusta",
+    "gustan", "gustaría", "encanta", "prefiero", "preferiría", "decir", "dice", "dicen", "dime",
+    "mandar", "manda", "mandame", "mándame", "enviar", "envía", "envíame", "mostrar", "muestra",
+    "muéstrame", "recomendar", "recomienda", "recomiendas", "recomiéndame", "ayudar", "ayuda",
+    "ayúdame", "ayudas", "cotizar", "cotización", "calcular", "calcula", "financiar", "financian",
+    "aceptan", "acepta", "ofrecen", "ofrece", "incluye", "incluyen", "cuesta", "cuestan", "costar",
+    "sale", "salen", "llevar", "llevo", "agendar", "agenda", "visitar", "probar", "prueba", "manejo",
+    "manejar", "revisar", "revisión", "entregar", "entrega", "recoger", "cambiar", "cambio", "tomar",
+    "toman", "dejar", "hablar", "llamar", "llámame", "escribir", "contactar", "esperar", "espero",
+    "gracias", "muchas", "favor", "porfavor", "hola", "buenos", "buenas", "días", "tardes", "noches",
+    "adiós", "saludos", "perfecto", "excelente", "claro", "ok", "vale", "bueno", "buena", "bien", "mal",
+    # cars, features, finance
+    "auto", "autos", "carro", "carros", "coche", "coches", "vehículo", "vehículos", "camioneta",
+    "camionetas", "sedán", "sedan", "hatchback", "suv", "pickup", "marca", "marcas", "modelo", "modelos",
+    "versión", "versiones", "año", "años", "kilometraje", "kilómetros", "km", "precio", "precios",
+    "costo", "barato", "barata", "baratos", "baratas", "económico", "económica", "económicos", "caro",
+    "cara", "nuevo", "nueva", "nuevos", "seminuevo", "seminuevos", "usado", "usados", "usada", "color",
+    "rojo", "azul", "blanco", "negro", "gris", "plata", "automático", "automática", "manual", "estándar",
+    "transmisión", "motor", "gasolina", "híbrido", "eléctrico", "diésel", "rendimiento", "puertas",
+    "asientos", "pasajeros", "familia", "familiar", "grande", "grandes", "pequeño", "pequeña", "chico",
+    "chica", "espacio", "cajuela", "largo", "ancho", "altura", "medidas", "dimensiones", "bluetooth",
+    "carplay", "pantalla", "cámara", "sensores", "seguridad", "garantía", "seguro", "seguros",
+    "financiamiento", "financiamientos", "crédito", "créditos", "enganche", "mensualidad",
+    "mensualidades", "plazo", "plazos", "meses", "mes", "tasa", "interés", "intereses", "pesos", "mil",
+    "millón", "presupuesto", "contado", "efectivo", "tarjeta", "trámite", "trámites", "documentos",
+    "requisitos", "papeles", "factura", "placas", "tenencia", "sucursal", "sucursales", "ubicación",
+    "dirección", "cita", "horario", "horarios", "domicilio", "envío", "devolución", "política",
+    "políticas", "reembolso", "días", "semana", "hoy", "mañana", "ahora", "después", "antes", "luego",
+    "aquí", "allí", "cerca", "menor", "mayor", "máximo", "mínimo", "entre", "aproximadamente", "unos",
+    "opciones", "opción", "disponible", "disponibles", "información", "detalles", "fotos", "foto",
+    "ciudad", "estado", "zona", "mejor", "mejores", "peor", "otra", "vez", "solo", "sólo", "hasta",
+]
@@ -0,0 +1,21 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.archive import archive_idle_channels
+from chat.partitions import ensure_message_partitions
+
+
+class Command(BaseCommand):
+    help = "Archive channels idle past the retention window and create upcoming message partitions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CHAT_ARCHIVE_RETENTION_DAYS,
+                            help="Archive channels whose last message is older than this many days.")
+        parser.add_argument('--limit', type=int, default=500, help="Maximum channels to archive in this run.")
+
+    def handle(self, *args, **options):
+        created = ensure_message_partitions(settings.CHAT_MESSAGE_PARTITIONS_AHEAD)
+        if created:
+            self.stdout.write(f"Partitions present: {', '.join(created)}")
+        archives = archive_idle_channels(options['days'], options['limit'])
+        messages = sum(a.message_count for a in archives)
+        self.stdout.write(self.style.SUCCESS(f"Archived {messages} messages from {len(archives)} channel(s)"))
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='summary_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:34
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_channel_summary'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineRun',
+            fields=[
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField()),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('mode', models.CharField(blank=True, default='', max_length=32)),
+                ('total_ms', models.FloatField(default=0)),
+                ('spans', models.JSONField(default=list)),
+                ('error', models.TextField(blank=True, default='')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_runs', to='chat.channel')),
+                ('message', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pipeline_runs', to='chat.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date_created'], name='chat_pipeli_date_cr_b6df3e_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,136 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:40
+
+import django.db.models.deletion
+import uuid
+from datetime import date
+from django.db import migrations, models
+from django.db.models import Max, OuterRef, Subquery
+
+
+def backfill_last_message_at(apps, schema_editor):
+    # one pass over the (channel, date_created) index
+    Channel = apps.get_model('chat', 'Channel')
+    Message = apps.get_model('chat', 'Message')
+    latest = Message.objects.filter(channel=OuterRef('pk')).values('channel').annotate(last=Max('date_created')).values('last')
+    Channel.objects.update(last_message_at=Subquery(latest))
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_messages(apps, schema_editor, months_ahead=2):
+    """
+    PostgreSQL only: turn chat_message into a table partitioned by month on
+    date_created (kept up to date by chat.partitions afterwards). Nothing is
+    copied: the existing table is attached as the chat_message_legacy
+    partition, holding every row before the current month; only the current
+    month's rows move to their partition. Index and constraint names match
+    what Django created so later migrations keep working. The SQL is frozen
+    here on purpose, independent of the live chat.partitions module.
+    """
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    table, legacy = 'chat_message', 'chat_message_legacy'
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [table],
+        )
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT LIKE %s",
+            [table, '%_pkey'],
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [table],
+        )
+        foreign_keys = cursor.fetchall()
+
+        # free the names for the partitioned table; the parent's indexes
+        # adopt the renamed ones instead of building them again. A partition
+        # can only have the parent's primary key, so the old one goes.
+        cursor.execute(f'ALTER TABLE "{table}" RENAME TO "{legacy}"')
+        cursor.execute(f'ALTER TABLE "{legacy}" DROP CONSTRAINT "{table}_pkey"')
+        for name, _ in indexes:
+            cursor.execute(f'ALTER INDEX "{name}" RENAME TO "{name[:50]}_legacy"')
+        cursor.execute(
+            f'CREATE TABLE "{table}" (LIKE "{legacy}" INCLUDING DEFAULTS) '
+            f'PARTITION BY RANGE (date_created)'
+        )
+        cursor.execute(f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT')
+        start = _month_start(date.today())
+        for i in range(months_ahead + 1):
+            month = _month_start(start, i)
+            cursor.execute(
+                f'CREATE TABLE "{table}_p{month:%Y%m}" PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{_month_start(month, 1).isoformat()}')"
+            )
+        # this month's rows (usually few) go to their partition; the legacy
+        # table covers everything before and is attached after one scan
+        cursor.execute(f'INSERT INTO "{table}" SELECT * FROM "{legacy}" WHERE date_created >= %s', [start])
+        cursor.execute(f'DELETE FROM "{legacy}" WHERE date_created >= %s', [start])
+        cursor.execute(
+            f'ALTER TABLE "{table}" ATTACH PARTITION "{legacy}" '
+            f"FOR VALUES FROM (MINVALUE) TO ('{start.isoformat()}')"
+        )
+
+        # the primary key must include the partition key; Django keeps using id
+        cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY (id, date_created)')
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE "{table}" ADD CONSTRAINT "{name}" {definition}')
+        # indexes created on the parent cascade to every partition
+        for _, definition in indexes:
+            cursor.execute(definition)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_pipeline_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChannelArchive',
+            fields=[
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField()),
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('path', models.CharField(max_length=500)),
+                ('message_count', models.PositiveIntegerField(default=0)),
+                ('first_message_at', models.DateTimeField()),
+                ('last_message_at', models.DateTimeField()),
+                ('size_bytes', models.PositiveBigIntegerField(default=0)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AlterField(
+            model_name='pipelinerun',
+            name='message',
+            field=models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pipeline_runs', to='chat.message'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['channel', 'date_created'], name='chat_messag_channel_676ea6_idx'),
+        ),
+        migrations.AddField(
+            model_name='channelarchive',
+            name='channel',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archives', to='chat.channel'),
+        ),
+        migrations.AddField(
+            model_name='channel',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.RunPython(backfill_last_message_at, migrations.RunPython.noop),
+        migrations.RunPython(partition_messages, migrations.RunPython.noop),
+    ]
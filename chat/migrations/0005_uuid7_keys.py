@@ -0,0 +1,34 @@
+# Generated by Django 5.2.1 on 2026-10-16 22:42
+
+import core.fields
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_message_partitions'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='channel',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='channelarchive',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='message',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='pipelinerun',
+            name='id',
+            field=core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False),
+        ),
+    ]
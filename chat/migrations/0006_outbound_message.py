@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-16 23:09
+
+import core.fields
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_uuid7_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundMessage',
+            fields=[
+                ('date_created', models.DateTimeField(auto_now_add=True)),
+                ('date_updated', models.DateTimeField()),
+                ('id', core.fields.UUIDv7Field(default=core.fields.uuid7, editable=False, primary_key=True, serialize=False)),
+                ('body', models.TextField()),
+                ('to_number', models.CharField(max_length=64)),
+                ('from_number', models.CharField(max_length=64)),
+                ('status', models.CharField(choices=[('pending', 'pending'), ('sending', 'sending'), ('sent', 'sent'), ('failed', 'failed')], default='pending', max_length=16)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('sent_at', models.DateTimeField(blank=True, null=True)),
+                ('provider_sid', models.CharField(blank=True, db_index=True, default='', max_length=64)),
+                ('delivery_status', models.CharField(blank=True, default='', max_length=32)),
+                ('error', models.TextField(blank=True, default='')),
+                ('channel', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbound_messages', to='chat.channel')),
+                ('message', models.ForeignKey(blank=True, db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='outbound_messages', to='chat.message')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='chat_outbou_status_89a6fa_idx')],
+            },
+        ),
+    ]
@@ -1,14 +1,90 @@
-import uuid
 from django.db import models
+from django.utils import timezone
+from core.fields import UUIDv7Field
 from core.models import BaseModel
 
 
 class Channel(BaseModel):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = UUIDv7Field(primary_key=True, editable=False)
     external_id = models.CharField(max_length=255, unique=True)
+    # rolling summary of the turns that fell out of the history window
+    summary = models.TextField(blank=True, default='')
+    summary_until = models.DateTimeField(blank=True, null=True)
+    # latest inbound message still in chat_message (None once archived);
+    # lets the archiver find idle channels without scanning messages
+    last_message_at = models.DateTimeField(blank=True, null=True, db_index=True)
 
 class Message(BaseModel):
-    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    id = UUIDv7Field(primary_key=True, editable=False)
     channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='messages')
     text = models.TextField()
-    author = models.CharField(max_length=255, blank=True, null=True)
\ No newline at end of file
+    author = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        # history queries: latest messages of one channel.
+        # On PostgreSQL the table is partitioned by month (chat.partitions).
+        indexes = [models.Index(fields=['channel', 'date_created'])]
+
+
+class ChannelArchive(BaseModel):
+    """
+    Messages of an idle channel moved out of chat_message into a
+    zstd-compressed NDJSON file (see chat.archive).
+    """
+    id = UUIDv7Field(primary_key=True, editable=False)
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='archives')
+    path = models.CharField(max_length=500)
+    message_count = models.PositiveIntegerField(default=0)
+    first_message_at = models.DateTimeField()
+    last_message_at = models.DateTimeField()
+    size_bytes = models.PositiveBigIntegerField(default=0)
+
+class PipelineRun(BaseModel):
+    """
+    Timed spans of one LLMPipeline run (see chat.tracing), linked to the
+    bot reply it produced.
+    """
+    id = UUIDv7Field(primary_key=True, editable=False)
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='pipeline_runs')
+    # no database constraint: the partitioned message table has no unique key on id alone
+    message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='pipeline_runs', db_constraint=False
+    )
+    mode = models.CharField(max_length=32, blank=True, default='')
+    total_ms = models.FloatField(default=0)
+    spans = models.JSONField(default=list)
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['date_created'])]
+
+
+class OutboundMessage(BaseModel):
+    """
+    WhatsApp message waiting to be sent (transactional outbox). Written in
+    the same transaction as the bot Message; chat.outbox sends it.
+    """
+    PENDING, SENDING, SENT, FAILED = 'pending', 'sending', 'sent', 'failed'
+    STATUS_CHOICES = [(s, s) for s in (PENDING, SENDING, SENT, FAILED)]
+
+    id = UUIDv7Field(primary_key=True, editable=False)
+    channel = models.ForeignKey(Channel, on_delete=models.CASCADE, related_name='outbound_messages')
+    # no database constraint: the partitioned message table has no unique key on id alone
+    message = models.ForeignKey(
+        Message, on_delete=models.SET_NULL, blank=True, null=True, related_name='outbound_messages', db_constraint=False
+    )
+    body = models.TextField()
+    to_number = models.CharField(max_length=64)
+    from_number = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    # earliest next send (backoff, throttling); for SENDING rows, when the claim expires
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    sent_at = models.DateTimeField(blank=True, null=True)
+    # Twilio's message SID and delivery status (queued/sent/delivered/read/undelivered/failed)
+    provider_sid = models.CharField(max_length=64, blank=True, default='', db_index=True)
+    delivery_status = models.CharField(max_length=32, blank=True, default='')
+    error = models.TextField(blank=True, default='')
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'next_attempt_at'])]
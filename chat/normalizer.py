@@ -0,0 +1,177 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from itertools import combinations
+from typing import Dict, Iterable, List, Optional, Tuple
+from catalog.snapshot import get_catalog_snapshot
+from chat.lexicon import MEXICAN_PLACES, SPANISH_WORDS
+from core.text import fold
+from core.metrics import record_cache
+
+_TOKEN_RE = re.compile(r"(\w+)", re.UNICODE)
+
+# higher weight wins ties between candidates at the same edit distance
+WEIGHT_CATALOG = 3
+WEIGHT_PLACE = 2
+WEIGHT_WORD = 1
+
+
+def damerau_levenshtein(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, capped at max_distance + 1."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if prev2 is not None and i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > max_distance:
+            return max_distance + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+@dataclass
+class NormalizationResult:
+    text: str
+    confidence: float
+    corrections: List[Tuple[str, str]] = field(default_factory=list)
+
+
+class LocalNormalizer:
+    """
+    SymSpell-style typo corrector: every lexicon term is indexed under all of
+    its deletions (up to `max_distance`), so a lookup only generates the
+    deletions of the input word and verifies the few colliding terms.
+    """
+
+    def __init__(self, max_distance: int = 2):
+        self.max_distance = max_distance
+        # folded key -> {canonical spelling: weight}
+        self.terms: Dict[str, Dict[str, int]] = defaultdict(dict)
+        self.deletes: Dict[str, set] = defaultdict(set)
+
+    def add_terms(self, terms: Iterable[str], weight: int):
+        for term in terms:
+            # multi-word entries ("Ciudad de México", "Grand Cherokee") are indexed per word
+            for word in _TOKEN_RE.findall(term or ''):
+                key = fold(word)
+                if len(key) < 2 or key.isdigit():
+                    continue
+                if key not in self.terms:
+                    for variant in self._deletions(key, self._max_distance_for(key)):
+                        self.deletes[variant].add(key)
+                self.terms[key][word] = max(weight, self.terms[key].get(word, 0))
+        return self
+
+    def _max_distance_for(self, key: str) -> int:
+        if len(key) <= 3:
+            return 0
+        if len(key) <= 5:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    @staticmethod
+    def _deletions(key: str, distance: int) -> set:
+        out = {key}
+        for d in range(1, min(distance, len(key) - 1) + 1):
+            for idx in combinations(range(len(key)), d):
+                out.add(''.join(ch for i, ch in enumerate(key) if i not in idx))
+        return out
+
+    def _canonical(self, key: str) -> Optional[str]:
+        """Unique canonical spelling, or None if the folded key is ambiguous (esta/está)."""
+        spellings = self.terms[key]
+        best = max(spellings.values())
+        top = [s for s, w in spellings.items() if w == best]
+        if len(top) == 1:
+            return top[0]
+        lowered = {s.lower() for s in top}
+        return None if len(lowered) > 1 else top[0]
+
+    def lookup(self, word: str) -> Tuple[Optional[str], bool]:
+        """
+        Return (replacement, resolved). `replacement` is None when the word
+        should be left untouched; `resolved` is False when the word is unknown
+        or the correction is ambiguous.
+        """
+        key = fold(word)
+        if key.isdigit() or len(key) < 2:
+            return None, True
+        if key in self.terms:
+            canonical = self._canonical(key)
+            return canonical, True
+        max_distance = self._max_distance_for(key)
+        if max_distance == 0:
+            return None, False
+
+        best: Dict[str, int] = {}
+        for variant in self._deletions(key, max_distance):
+            for candidate in self.deletes.get(variant, ()):
+                if candidate not in best:
+                    best[candidate] = damerau_levenshtein(key, candidate, max_distance)
+        matches = [(d, c) for c, d in best.items() if d <= max_distance]
+        if not matches:
+            return None, False
+        top_distance = min(d for d, _ in matches)
+        closest = [c for d, c in matches if d == top_distance]
+        weights = {c: max(self.terms[c].values()) for c in closest}
+        top_weight = max(weights.values())
+        winners = [c for c in closest if weights[c] == top_weight]
+        if len(winners) != 1:
+            return None, False
+        canonical = self._canonical(winners[0])
+        return canonical, canonical is not None
+
+    def normalize(self, text: str) -> NormalizationResult:
+        """
+        Correct every word against the lexicon. Confidence is the share of
+        words that were either known or corrected unambiguously.
+        """
+        parts = _TOKEN_RE.split(text.strip())
+        corrections = []
+        words = resolved = 0
+        for i in range(1, len(parts), 2):
+            word = parts[i]
+            words += 1
+            replacement, ok = self.lookup(word)
+            resolved += ok
+            if replacement is None:
+                continue
+            if replacement.islower() and not word.islower():
+                # keep the user's casing when only accents change
+                replacement = replacement.capitalize() if word[:1].isupper() else replacement
+            if replacement != word:
+                corrections.append((word, replacement))
+                parts[i] = replacement
+        normalized = ''.join(parts)
+        if normalized[:1].islower():
+            normalized = normalized[0].upper() + normalized[1:]
+        confidence = resolved / words if words else 1.0
+        return NormalizationResult(text=normalized, confidence=confidence, corrections=corrections)
+
+
+_normalizer: Optional[LocalNormalizer] = None
+_normalizer_version = None
+
+
+def get_local_normalizer() -> LocalNormalizer:
+    """
+    Return this process' normalizer, rebuilt only when the catalog version
+    (and therefore the make/model/version vocabulary) changes.
+    """
+    global _normalizer, _normalizer_version
+    snapshot = get_catalog_snapshot()
+    record_cache('local_normalizer', _normalizer is not None and _normalizer_version == snapshot.version)
+    if _normalizer is None or _normalizer_version != snapshot.version:
+        vocab = snapshot.vehicle_vocab()
+        normalizer = LocalNormalizer()
+        normalizer.add_terms(SPANISH_WORDS, WEIGHT_WORD)
+        normalizer.add_terms(MEXICAN_PLACES, WEIGHT_PLACE)
+        normalizer.add_terms(vocab["makes"] + vocab["models"] + vocab["versions"], WEIGHT_CATALOG)
+        _normalizer, _normalizer_version = normalizer, snapshot.version
+    return _normalizer
@@ -0,0 +1,208 @@
+"""
+Transactional outbox for outbound WhatsApp messages.
+
+The reply pipeline never calls Twilio itself: the bot Message and its
+OutboundMessage row are committed together, and the drain_outbox task sends
+them. A Twilio outage therefore delays replies instead of losing them after
+the LLM call was paid for.
+
+The sender claims batches with SELECT ... FOR UPDATE SKIP LOCKED, so any
+number of sender processes can drain in parallel. A claim is a lease
+(OUTBOX_CLAIM_SECONDS): rows of a sender that died are picked up again.
+Messages of one channel are sent in order, one at a time; different
+channels are sent concurrently over the shared Twilio connection pool,
+within the per-sender-number rate (SEND_RATE).
+"""
+import random
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import List, Optional
+import requests
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from twilio.base.exceptions import TwilioRestException
+from agent_chatbot.settings import TwilioConfig
+from chat.models import Channel, Message, OutboundMessage
+from core.clients import get_redis, get_twilio_client
+from core.metrics import OUTBOX_LAG, OUTBOX_SENDS
+
+UNSENT = (OutboundMessage.PENDING, OutboundMessage.SENDING)
+
+
+def enqueue(channel: Channel, body: str, message: Optional[Message] = None) -> OutboundMessage:
+    """
+    Queue `body` for the channel's WhatsApp number. Call it inside the
+    transaction that persists `message`; the sender is triggered on commit.
+    """
+    outbound = OutboundMessage.objects.create(
+        channel=channel,
+        message=message,
+        body=body,
+        to_number=channel.external_id,
+        from_number=TwilioConfig.WHATSAPP_FROM or '',
+    )
+    transaction.on_commit(trigger_drain)
+    return outbound
+
+
+def trigger_drain():
+    # imported here: chat.tasks imports chat.utils, which imports this module
+    from chat.tasks import drain_outbox
+
+    try:
+        drain_outbox.delay()
+    except Exception as e:
+        # the periodic drain picks the message up
+        print(f"Could not trigger the outbox sender: {e}")
+
+
+# --- sender ------------------------------------------------------------------
+
+def claim_batch(limit: int) -> List[OutboundMessage]:
+    """
+    Lock up to `limit` due messages (skipping rows other senders hold) and
+    mark them SENDING until the claim expires. Only the oldest unsent
+    message of a channel qualifies (NOT EXISTS, before the LIMIT), so a
+    channel's messages never overtake each other and a channel waiting on a
+    retry doesn't take the batch's slots from the others.
+    """
+    now = timezone.now()
+    older_unsent = OutboundMessage.objects.filter(
+        channel_id=OuterRef('channel_id'), status__in=UNSENT, id__lt=OuterRef('id')
+    )
+    with transaction.atomic():
+        rows = list(
+            OutboundMessage.objects.select_for_update(skip_locked=True)
+            .filter(status__in=UNSENT, next_attempt_at__lte=now)
+            .exclude(Exists(older_unsent))
+            .order_by('id')[:limit]
+        )
+        if not rows:
+            return []
+        OutboundMessage.objects.filter(id__in=[row.id for row in rows]).update(
+            status=OutboundMessage.SENDING,
+            next_attempt_at=now + timedelta(seconds=TwilioConfig.OUTBOX_CLAIM_SECONDS),
+            date_updated=now,
+        )
+    return rows
+
+
+def take_send_slot(from_number: str) -> bool:
+    """Per-second window of SEND_RATE messages per sender number, shared by every sender."""
+    if TwilioConfig.SEND_RATE <= 0:
+        return True
+    key = f"ratelimit:twilio:{from_number}:{int(time.time())}"
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incr(key)
+        pipe.expire(key, 2)
+        count, _ = pipe.execute()
+    except Exception as e:
+        print(f"Error reading the Twilio send rate: {e}")
+        return True
+    return count <= TwilioConfig.SEND_RATE
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, TwilioRestException):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, requests.RequestException)
+
+
+def backoff_delay(attempts: int) -> float:
+    """Full-jitter exponential backoff after `attempts` failed sends."""
+    return random.uniform(0, min(TwilioConfig.OUTBOX_BACKOFF_MAX, TwilioConfig.OUTBOX_BACKOFF_BASE * 2 ** attempts))
+
+
+def _update(outbound: OutboundMessage, **fields):
+    fields['date_updated'] = timezone.now()
+    OutboundMessage.objects.filter(id=outbound.id).update(**fields)
+
+
+def send(outbound: OutboundMessage) -> str:
+    """
+    Send one claimed message and record the outcome: sent, retry (backoff),
+    failed (permanent error or out of attempts) or throttled (rescheduled
+    without counting an attempt).
+    """
+    if not take_send_slot(outbound.from_number):
+        _update(outbound, status=OutboundMessage.PENDING, next_attempt_at=timezone.now() + timedelta(seconds=1))
+        return 'throttled'
+    extra = {'status_callback': TwilioConfig.STATUS_CALLBACK_URL} if TwilioConfig.STATUS_CALLBACK_URL else {}
+    try:
+        resp = get_twilio_client().messages.create(
+            body=outbound.body,
+            from_=f"whatsapp:{outbound.from_number}",
+            to=f"whatsapp:{outbound.to_number}",
+            **extra
+        )
+    except Exception as e:
+        attempts = outbound.attempts + 1
+        error = f"{type(e).__name__}: {e}"
+        if not _retryable(e) or attempts >= TwilioConfig.OUTBOX_MAX_ATTEMPTS:
+            print(f"Giving up on outbound message {outbound.id} after {attempts} attempt(s): {error}")
+            _update(outbound, status=OutboundMessage.FAILED, attempts=attempts, error=error)
+            return 'failed'
+        delay = backoff_delay(attempts)
+        print(f"Outbound message {outbound.id} failed ({error}), retry {attempts} in {delay:.1f}s")
+        _update(
+            outbound,
+            status=OutboundMessage.PENDING,
+            attempts=attempts,
+            error=error,
+            next_attempt_at=timezone.now() + timedelta(seconds=delay),
+        )
+        return 'retry'
+    now = timezone.now()
+    _update(
+        outbound,
+        status=OutboundMessage.SENT,
+        attempts=outbound.attempts + 1,
+        sent_at=now,
+        provider_sid=getattr(resp, 'sid', '') or '',
+        delivery_status=getattr(resp, 'status', '') or '',
+        error='',
+    )
+    OUTBOX_LAG.observe((now - outbound.date_created).total_seconds())
+    return 'sent'
+
+
+def _send_claimed(outbound: OutboundMessage) -> str:
+    """Send a claimed message from a pool thread."""
+    try:
+        outcome = send(outbound)
+        OUTBOX_SENDS.labels(outcome).inc()
+        return outcome
+    finally:
+        # pool threads open their own connection
+        connection.close()
+
+
+def drain(batch_size: int = None, max_seconds: float = 30) -> Counter:
+    """
+    Send due messages batch after batch until the outbox is empty or
+    `max_seconds` passed. A batch holds at most one message per channel;
+    the channel's next one is claimed by a later batch, once this one is sent.
+    Returns the count of each outcome.
+    """
+    batch_size = batch_size or TwilioConfig.OUTBOX_BATCH_SIZE
+    deadline = time.monotonic() + max_seconds
+    counts = Counter()
+    with ThreadPoolExecutor(max_workers=TwilioConfig.POOL_SIZE, thread_name_prefix='outbox') as pool:
+        while time.monotonic() < deadline:
+            rows = claim_batch(batch_size)
+            if not rows:
+                break
+            counts.update(pool.map(_send_claimed, rows))
+    return counts
+
+
+def record_status(provider_sid: str, delivery_status: str, error_code: str = '') -> bool:
+    """Store a Twilio status callback on its message; False when the SID is unknown."""
+    fields = {'delivery_status': delivery_status, 'date_updated': timezone.now()}
+    if error_code:
+        fields['error'] = f"Twilio error {error_code}"
+    return OutboundMessage.objects.filter(provider_sid=provider_sid).update(**fields) > 0
@@ -0,0 +1,87 @@
+"""
+Monthly range partitioning of chat_message on PostgreSQL.
+
+The table is partitioned by date_created with one partition per month
+(chat_message_pYYYYMM) plus a default partition. Migration 0004 converts
+the existing table; its rows stay where they are, in chat_message_legacy (a
+partition for every month before the conversion). The primary key becomes
+(id, date_created), as PostgreSQL requires the partition key in every
+unique constraint; Django keeps treating `id` as the key. Other vendors
+(SQLite in development) keep a plain table and every function here is a
+no-op for them.
+"""
+from datetime import date
+from typing import List
+from django.db import connection, transaction
+from core.metrics import CHAT_PARTITION_ERRORS
+
+TABLE = 'chat_message'
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{TABLE}_p{month:%Y%m}'
+
+
+def is_partitioned(cursor) -> bool:
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+        [TABLE],
+    )
+    return cursor.fetchone() is not None
+
+
+def _create_month(cursor, month: date) -> str:
+    """
+    Create the month's partition. Rows of the month that already landed in
+    the default partition are moved into it: PostgreSQL refuses to create a
+    partition whose rows the default partition holds.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0] is not None:
+        return name
+    start, end = month.isoformat(), _month_start(month, 1).isoformat()
+    bounds = f"FOR VALUES FROM ('{start}') TO ('{end}')"
+    in_month = f"date_created >= '{start}' AND date_created < '{end}'"
+    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM "{TABLE}_default" WHERE {in_month})')
+    if not cursor.fetchone()[0]:
+        cursor.execute(f'CREATE TABLE "{name}" PARTITION OF "{TABLE}" {bounds}')
+        return name
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{TABLE}" INCLUDING DEFAULTS)')
+    cursor.execute(f'INSERT INTO "{name}" SELECT * FROM "{TABLE}_default" WHERE {in_month}')
+    cursor.execute(f'DELETE FROM "{TABLE}_default" WHERE {in_month}')
+    # indexes and constraints of the parent are attached or built on attach
+    cursor.execute(f'ALTER TABLE "{TABLE}" ATTACH PARTITION "{name}" {bounds}')
+    print(f"Moved {month:%Y-%m} messages out of {TABLE}_default")
+    return name
+
+
+def ensure_message_partitions(months_ahead: int = 2, today: date = None) -> List[str]:
+    """
+    Create the partitions for the current month and the next `months_ahead`
+    months. Run regularly (Celery beat) so rows never land in the default
+    partition. A month that fails is reported (CHAT_PARTITION_ERRORS) and
+    doesn't keep the others from being created.
+    """
+    if connection.vendor != 'postgresql':
+        return []
+    start = _month_start(today or date.today())
+    created = []
+    with connection.cursor() as cursor:
+        if not is_partitioned(cursor):
+            return []
+        for i in range(months_ahead + 1):
+            month = _month_start(start, i)
+            try:
+                with transaction.atomic():
+                    created.append(_create_month(cursor, month))
+            except Exception as e:
+                print(f"Error creating the {month:%Y-%m} partition of {TABLE}: {e}")
+                CHAT_PARTITION_ERRORS.inc()
+    return created
+
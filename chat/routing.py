@@ -0,0 +1,144 @@
+"""
+Channel-affine task routing.
+
+Reply tasks are routed by consistent hashing of the channel's external_id
+onto PipelineConfig.QUEUE_SHARDS queues (chat.0 .. chat.N-1). Every message
+of a conversation lands on the same queue, so a worker consuming that queue
+with a single process handles the conversation in arrival order, and
+workers scale out by taking over shards on other nodes.
+
+The per-channel lease is the safety net for everything routing alone does
+not cover (several processes on one shard, resharding, rolling deploys,
+redelivered tasks): only the holder of `chat:lease:<external_id>` may run
+the pipeline for that channel.
+"""
+import hashlib
+import uuid
+from contextlib import contextmanager
+from typing import Optional
+from agent_chatbot.settings import PipelineConfig, TwilioConfig
+from core.clients import get_redis
+
+QUEUE_PREFIX = 'chat'
+# tasks whose first argument is the channel's external_id
+CHANNEL_TASKS = ('chat.tasks.process_and_reply', 'chat.tasks.reply_to_burst')
+# chat.tasks.stage_<stage>[_<part>] (CHAT_PIPELINE_MODE=dag)
+STAGE_TASK_PREFIX = 'chat.tasks.stage_'
+OUTBOX_TASK = 'chat.tasks.drain_outbox'
+
+
+def jump_hash(key: int, buckets: int) -> int:
+    """
+    Jump consistent hash (Lamping & Veach): growing from N to N+1 buckets
+    only moves 1/(N+1) of the keys, all of them to the new bucket.
+    """
+    b, j = -1, 0
+    while j < buckets:
+        b = j
+        key = (key * 2862933555777941757 + 1) & 0xFFFFFFFFFFFFFFFF
+        j = int((b + 1) * ((1 << 31) / ((key >> 33) + 1)))
+    return b
+
+
+def channel_shard(ext_id: str, shards: int) -> int:
+    # stable across processes and hosts, unlike hash()
+    key = int.from_bytes(hashlib.blake2b(ext_id.encode(), digest_size=8).digest(), 'big')
+    return jump_hash(key, shards)
+
+
+def channel_queue(ext_id: str) -> Optional[str]:
+    """Queue for a channel's reply tasks, None when sharding is disabled."""
+    shards = PipelineConfig.QUEUE_SHARDS
+    if shards <= 0:
+        return None
+    return f"{QUEUE_PREFIX}.{channel_shard(ext_id, shards)}"
+
+
+def route_task(name, args, kwargs, options, task=None, **kw):
+    """
+    Celery router (CELERY_TASK_ROUTES): send reply tasks to their channel's
+    shard queue, pipeline stage tasks to their stage's queue
+    (PipelineConfig.STAGE_QUEUES) and the outbox sender to
+    TwilioConfig.OUTBOX_QUEUE; everything else keeps the default routing.
+    """
+    if name == OUTBOX_TASK:
+        return {'queue': TwilioConfig.OUTBOX_QUEUE} if TwilioConfig.OUTBOX_QUEUE else None
+    if name.startswith(STAGE_TASK_PREFIX):
+        queue = PipelineConfig.STAGE_QUEUES.get(name[len(STAGE_TASK_PREFIX):].split('_')[0])
+        return {'queue': queue} if queue else None
+    if name not in CHANNEL_TASKS:
+        return None
+    ext_id = args[0] if args else kwargs.get('ext_id')
+    queue = channel_queue(ext_id) if ext_id else None
+    return {'queue': queue} if queue else None
+
+
+# --- per-channel lease -------------------------------------------------------
+
+_RELEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+# restart the TTL of our lease, or take it back if it expired meanwhile
+_EXTEND = """
+local current = redis.call('get', KEYS[1])
+if current == ARGV[1] or not current then
+    return redis.call('set', KEYS[1], ARGV[1], 'EX', ARGV[2])
+end
+return false
+"""
+
+
+class LeaseBusy(Exception):
+    """Another worker holds the channel's lease."""
+
+
+def _lease_key(ext_id: str) -> str:
+    return f"chat:lease:{ext_id}"
+
+
+def acquire_lease(ext_id: str, ttl_seconds: int = None) -> str:
+    """
+    Take the channel's lease and return its token ("" when leases are
+    disabled), raising LeaseBusy when another run holds it. The TTL only
+    matters if the holder dies, so it must exceed the longest run.
+    """
+    ttl_seconds = ttl_seconds or PipelineConfig.CHANNEL_LEASE_SECONDS
+    if ttl_seconds <= 0:
+        return ""
+    token = uuid.uuid4().hex
+    if not get_redis().set(_lease_key(ext_id), token, nx=True, ex=ttl_seconds):
+        raise LeaseBusy(ext_id)
+    return token
+
+
+def release_lease(ext_id: str, token: str):
+    """
+    Compare-and-delete, so an expired holder never frees a lease that has
+    since passed to someone else.
+    """
+    if token:
+        get_redis().eval(_RELEASE, 1, _lease_key(ext_id), token)
+
+
+def extend_lease(ext_id: str, token: str, ttl_seconds: int = None) -> bool:
+    """
+    Keep holding the lease for a run that goes on (each stage of the stage
+    DAG). False when it has passed to another run.
+    """
+    ttl_seconds = ttl_seconds or PipelineConfig.CHANNEL_LEASE_SECONDS
+    if not token or ttl_seconds <= 0:
+        return True
+    return bool(get_redis().eval(_EXTEND, 1, _lease_key(ext_id), token, ttl_seconds))
+
+
+@contextmanager
+def channel_lease(ext_id: str, ttl_seconds: int = None):
+    """Hold the channel's lease for the duration of the block (see acquire_lease)."""
+    token = acquire_lease(ext_id, ttl_seconds)
+    try:
+        yield
+    finally:
+        release_lease(ext_id, token)
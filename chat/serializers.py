@@ -1,6 +1,6 @@
 from rest_framework import serializers
 from rest_framework.reverse import reverse
-from .models import Channel, Message
+from .models import Channel, Message, OutboundMessage, PipelineRun
 
 class MessageSerializer(serializers.ModelSerializer):
     url = serializers.SerializerMethodField(read_only=True)
@@ -39,3 +39,40 @@ class ChannelSerializer(serializers.ModelSerializer):
     def get_url(self, obj):
         request = self.context.get('request')
         return reverse('channel-detail', args=[obj.id], request=request)
+
+
+class PipelineRunSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PipelineRun
+        fields = [
+            'id',
+            'channel',
+            'message',
+            'mode',
+            'total_ms',
+            'spans',
+            'error',
+            'date_created',
+        ]
+        read_only_fields = fields
+
+
+class OutboundMessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OutboundMessage
+        fields = [
+            'id',
+            'channel',
+            'message',
+            'body',
+            'to_number',
+            'status',
+            'attempts',
+            'next_attempt_at',
+            'sent_at',
+            'provider_sid',
+            'delivery_status',
+            'error',
+            'date_created',
+        ]
+        read_only_fields = fields
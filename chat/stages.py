@@ -0,0 +1,256 @@
+"""
+LLMPipeline split into stages that run as separate Celery tasks
+(CHAT_PIPELINE_MODE=dag):
+
+    ingest -> route -> [retrieve_vehicles, retrieve_extra] -> generate -> deliver
+                       (chord: both retrievals run in parallel)
+
+Every stage receives and returns a small JSON `state` dict: ids, the texts
+the next stages need, and the spans traced so far. Nothing holds a model
+instance or a connection across stages, so each stage can run on its own
+queue with its own worker concurrency and be retried on its own.
+
+The channel's lease is taken by `ingest`, refreshed by every later stage
+and released by `deliver` (or by `finish` when the run stops early), so runs
+of one channel never overlap.
+"""
+import time
+from typing import List
+from agent_chatbot.settings import PipelineConfig, TwilioConfig
+from catalog.search import VehicleFilter
+from chat.ingest import get_channel, ingest_message, is_latest, mark_latest
+from chat.models import Message, PipelineRun
+from chat.routing import acquire_lease, extend_lease, release_lease
+from chat.utils import LLMPipeline, Superseded, TwilioWrapper
+from core.clients import get_redis
+from core.fields import uuid7
+from core.metrics import CHAT_RUNS
+
+
+def new_state(ext_id: str, profile_name: str, msg_body: str = "", message_id: str = "") -> dict:
+    """
+    State of a run for a new message (`msg_body`, persisted by ingest) or
+    for a debounced burst whose latest message the webhook already
+    persisted (`message_id`). Once ingested, every run is a burst run.
+    """
+    return {
+        "run_id": str(uuid7()),
+        "ext_id": ext_id,
+        "profile": profile_name,
+        "msg_body": msg_body,
+        "message_id": message_id,
+        "started_at": time.time(),
+        "spans": [],
+    }
+
+
+def _pipeline(state: dict) -> LLMPipeline:
+    return LLMPipeline.from_config(
+        get_channel(state["ext_id"]),
+        # stages already run in parallel as tasks; no stage threads inside one
+        concurrent_stages=False,
+        stream_reply=False,
+        coalesce_burst=True,
+        is_superseded=lambda: not is_latest(state["ext_id"], state["message_id"]),
+    )
+
+
+def _hold_lease(state: dict):
+    """
+    Refresh the run's lease at the start of a stage. A run whose lease
+    expired and passed to another run stops: that run answers the channel.
+    """
+    if state.get("lease") and not extend_lease(state["ext_id"], state["lease"]):
+        state.pop("lease")
+        raise Superseded(f"channel {state['ext_id']} leased to another run")
+
+
+def _spans(state: dict, pipeline: LLMPipeline, stage_started: float) -> List[dict]:
+    """The stage's spans, shifted onto the run's timeline."""
+    offset = (stage_started - state["started_at"]) * 1000
+    spans = pipeline.tracer.to_list()
+    for span in spans:
+        span["start_ms"] = round(span["start_ms"] + offset, 2)
+    return spans
+
+
+def ingest(state: dict) -> dict:
+    """
+    Persist the user message and mark it as the channel's latest, then take
+    the channel's lease (LeaseBusy while another run holds it) unless a
+    newer message superseded it. From here on the run answers a burst: every
+    message since the last reply.
+    """
+    if state["msg_body"]:
+        channel, message = ingest_message(state["ext_id"], state["profile"], state["msg_body"])
+        mark_latest(state["ext_id"], str(message.id), ttl_seconds=PipelineConfig.CHANNEL_LEASE_SECONDS + 60)
+        state["message_id"] = str(message.id)
+        state["msg_body"] = ""
+        state["channel_id"] = str(channel.id)
+    if not is_latest(state["ext_id"], state["message_id"]):
+        raise Superseded(f"newer message in channel {state['ext_id']}")
+    state["lease"] = acquire_lease(state["ext_id"])
+    if not state.get("channel_id"):
+        state["channel_id"] = str(get_channel(state["ext_id"]).id)
+    return state
+
+
+def route(state: dict) -> dict:
+    """
+    History, transcript and the cheap classification calls: normalization,
+    vehicle intent and KB article selection (or the single router call).
+    """
+    _hold_lease(state)
+    started = time.time()
+    pipeline = _pipeline(state)
+    history = pipeline.get_active_history()
+    last_user = pipeline.get_last_user_message()
+    transcript = pipeline.build_transcript(history, exclude_msg=last_user)
+    state["transcript"] = transcript
+    state["filters"] = None
+    state["kb_ids"] = []
+    if pipeline.router_mode:
+        decision = pipeline.route_message(transcript, last_user.text)
+        state["normalized"] = decision["normalized_text"]
+        state["needs_vehicles"] = decision["needs_vehicle_search"]
+        state["filters"] = decision["vehicle_filters"].to_dict()
+        state["kb_ids"] = decision["kb_article_ids"]
+    else:
+        normalized = pipeline.normalize_user_text(last_user.text)
+        state["normalized"] = normalized
+        state["needs_vehicles"] = pipeline.should_fetch_more_vehicle_info(transcript, normalized)
+        if pipeline.kb_retrieval == "llm":
+            state["kb_ids"] = pipeline.get_relevant_kb_article_ids(transcript, normalized)
+    print(f"Route for channel {state['ext_id']}: vehicles={state['needs_vehicles']} kb={state['kb_ids']}")
+    state["spans"] += _spans(state, pipeline, started)
+    return state
+
+
+def retrieve_vehicles(state: dict) -> dict:
+    """
+    Filtered vehicles CSV (filter extraction and catalog search). Returns
+    the run state, which carries on to generate.
+    """
+    _hold_lease(state)
+    started = time.time()
+    pipeline = _pipeline(state)
+    state["vehicles"] = ""
+    if state["needs_vehicles"]:
+        if state["filters"] is not None:
+            spec = VehicleFilter.from_dict(state["filters"])
+            state["vehicles"] = pipeline.search_vehicles_csv(spec, state["normalized"])
+        else:
+            state["vehicles"] = pipeline.retrieve_filtered_vehicles(state["normalized"], state["transcript"])
+    state["spans"] += _spans(state, pipeline, started)
+    return state
+
+
+def retrieve_extra(state: dict) -> dict:
+    """
+    The "Información adicional" section (KB articles or passages), returned
+    with its spans only.
+    """
+    _hold_lease(state)
+    started = time.time()
+    pipeline = _pipeline(state)
+    if pipeline.kb_retrieval != "llm":
+        extra = pipeline.retrieve_kb_passages(state["transcript"], state["normalized"])
+    else:
+        extra = pipeline.load_additional_data(state["kb_ids"]) if state["kb_ids"] else ""
+    return {"extra": extra, "spans": _spans(state, pipeline, started)}
+
+
+def merge(parts: List[dict]) -> dict:
+    """
+    Fold the chord's results into one state: the first is the run state
+    (retrieve_vehicles), the others add their fields and spans.
+    """
+    state = parts[0]
+    for part in parts[1:]:
+        spans = part.pop("spans")
+        state.update(part)
+        state["spans"].extend(spans)
+    return state
+
+
+def generate(state: dict) -> dict:
+    """Build the prompt, call the generation model and persist the reply."""
+    _hold_lease(state)
+    started = time.time()
+    pipeline = _pipeline(state)
+    try:
+        message = pipeline.generate_reply(
+            state["transcript"], state["normalized"], state["vehicles"], state["extra"]
+        )
+    finally:
+        state["spans"] += _spans(state, pipeline, started)
+    state["reply_id"] = str(message.id)
+    state["reply"] = message.text
+    return state
+
+
+def deliver(state: dict) -> dict:
+    """
+    Send the reply over WhatsApp and close the run. With the outbox the
+    generate stage already queued it, so only the run is closed. The reply
+    is persisted by now, so it goes out even if the lease has expired.
+    """
+    if TwilioConfig.OUTBOX:
+        finish(state, "replied")
+        return state
+    started = time.time()
+    twilio = TwilioWrapper()
+    twilio.send_whatsapp(state["reply"], state["ext_id"])
+    print(f"Replying to {state['profile']} in channel {state['ext_id']}: {state['reply']}")
+    state["spans"].append({
+        "name": "twilio_send",
+        "parent": None,
+        "start_ms": round((started - state["started_at"]) * 1000, 2),
+        "duration_ms": round((time.time() - started) * 1000, 2),
+        "model": None,
+        "prompt_tokens": 0,
+        "completion_tokens": 0,
+        "cached_tokens": 0,
+        "db_queries": 0,
+        "error": "",
+    })
+    finish(state, "replied")
+    return state
+
+
+def _first_finish(state: dict) -> bool:
+    """Whether this is the run's first finish: both chord members may fail and finish it."""
+    if not state.get("run_id"):
+        return True
+    try:
+        key = f"chat:run:{state['run_id']}:finished"
+        return bool(get_redis().set(key, 1, nx=True, ex=max(PipelineConfig.CHANNEL_LEASE_SECONDS, 3600)))
+    except Exception as e:
+        print(f"Error marking run {state['run_id']} finished: {e}")
+        return True
+
+
+def finish(state: dict, outcome: str, error: str = ""):
+    """
+    Release the lease, count the outcome and persist the run's spans
+    (PipelineConfig.TRACING). Called by deliver or on failure; only the
+    first call of a run counts it and saves its PipelineRun.
+    """
+    if state.get("lease"):
+        release_lease(state["ext_id"], state.pop("lease"))
+    if not _first_finish(state):
+        return
+    CHAT_RUNS.labels(outcome).inc()
+    if not PipelineConfig.TRACING or not state.get("channel_id"):
+        return
+    try:
+        PipelineRun.objects.create(
+            channel_id=state["channel_id"],
+            message=Message(id=state["reply_id"]) if state.get("reply_id") else None,
+            mode="dag",
+            total_ms=round((time.time() - state["started_at"]) * 1000, 2),
+            spans=state["spans"],
+            error=error,
+        )
+    except Exception as e:
+        print(f"Error saving pipeline trace: {e}")
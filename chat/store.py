@@ -0,0 +1,160 @@
+import json
+import uuid
+from datetime import datetime
+from typing import List, Optional
+from agent_chatbot.settings import PipelineConfig
+from chat.models import Channel, Message
+from core.clients import get_redis
+
+
+class ConversationStore:
+    """
+    Write-through Redis cache of the hot part of every conversation, keyed
+    by external_id. Postgres stays the durable record.
+
+    - `chat:conv:<ext_id>:msgs`  list of the last `max_messages` messages
+      as JSON, newest first (LPUSHX + LTRIM)
+    - `chat:conv:<ext_id>:meta`  hash with channel_id, summary and
+      last_activity (epoch seconds)
+
+    A missing list is rebuilt from the database on the next append, so a
+    flushed or evicted Redis only costs one extra query per channel.
+    """
+
+    def __init__(self, client=None, max_messages: int = 50, ttl_seconds: int = 86400):
+        self._client = client
+        self.max_messages = max_messages
+        self.ttl = ttl_seconds
+
+    @property
+    def redis(self):
+        # resolved per call so forked workers pick up their own client
+        return self._client or get_redis()
+
+    @staticmethod
+    def _msgs_key(ext_id: str) -> str:
+        return f"chat:conv:{ext_id}:msgs"
+
+    @staticmethod
+    def _meta_key(ext_id: str) -> str:
+        return f"chat:conv:{ext_id}:meta"
+
+    @staticmethod
+    def _encode(message: Message) -> str:
+        return json.dumps({
+            "id": str(message.id),
+            "author": message.author,
+            "text": message.text,
+            "ts": message.date_created.isoformat(),
+        }, ensure_ascii=False)
+
+    @staticmethod
+    def _decode(raw, channel: Channel) -> Message:
+        data = json.loads(raw)
+        message = Message(
+            id=uuid.UUID(data["id"]),
+            channel=channel,
+            author=data["author"],
+            text=data["text"],
+        )
+        message.date_created = datetime.fromisoformat(data["ts"])
+        message._state.adding = False
+        return message
+
+    # --- channels ----------------------------------------------------------
+
+    def get_channel(self, ext_id: str) -> Optional[Channel]:
+        """
+        Channel for an external_id from the cache, or None on a miss.
+        The instance carries id, external_id and summary only; it is meant
+        for reading and as a foreign key, not for saving.
+        """
+        meta = self.redis.hgetall(self._meta_key(ext_id))
+        channel_id = meta.get(b"channel_id")
+        if not channel_id:
+            return None
+        channel = Channel(id=uuid.UUID(channel_id.decode()), external_id=ext_id, summary=meta.get(b"summary", b"").decode())
+        channel._state.adding = False
+        return channel
+
+    def remember_channel(self, channel: Channel):
+        key = self._meta_key(channel.external_id)
+        with self.redis.pipeline() as pipe:
+            pipe.hset(key, mapping={"channel_id": str(channel.id), "summary": channel.summary or ""})
+            pipe.expire(key, self.ttl)
+            pipe.execute()
+
+    def set_summary(self, ext_id: str, summary: str):
+        # only refresh channels that are cached; never resurrect a partial entry
+        if self.redis.exists(self._meta_key(ext_id)):
+            self.redis.hset(self._meta_key(ext_id), "summary", summary or "")
+
+    def forget(self, ext_id: str, messages_only: bool = False):
+        keys = [self._msgs_key(ext_id)] if messages_only else [self._msgs_key(ext_id), self._meta_key(ext_id)]
+        self.redis.delete(*keys)
+
+    def clear(self):
+        """Drop every cached conversation (e.g. after primary keys were rewritten)."""
+        for key in self.redis.scan_iter(match="chat:conv:*", count=1000):
+            self.redis.delete(key)
+
+    # --- messages ----------------------------------------------------------
+
+    def append(self, channel: Channel, message: Message):
+        """Add a message that was just saved to the database."""
+        key = self._msgs_key(channel.external_id)
+        with self.redis.pipeline() as pipe:
+            pipe.lpushx(key, self._encode(message))
+            pipe.ltrim(key, 0, self.max_messages - 1)
+            pipe.expire(key, self.ttl)
+            pipe.hset(self._meta_key(channel.external_id), "last_activity", message.date_created.timestamp())
+            pipe.expire(self._meta_key(channel.external_id), self.ttl)
+            pushed = pipe.execute()[0]
+        if not pushed:
+            self.warm(channel)
+
+    def warm(self, channel: Channel):
+        """(Re)build the message list from the database."""
+        recent = list(channel.messages.order_by('-date_created')[: self.max_messages])
+        key = self._msgs_key(channel.external_id)
+        with self.redis.pipeline() as pipe:
+            pipe.delete(key)
+            if recent:
+                pipe.rpush(key, *[self._encode(m) for m in recent])
+                pipe.expire(key, self.ttl)
+            pipe.execute()
+        return recent
+
+    def recent(self, channel: Channel, limit: int) -> List[Message]:
+        """Last `limit` messages, oldest first, with one Redis read."""
+        rows = self.redis.lrange(self._msgs_key(channel.external_id), 0, limit - 1)
+        if rows:
+            return [self._decode(row, channel) for row in reversed(rows)]
+        return self.warm(channel)[:limit][::-1]
+
+    def last_activity(self, ext_id: str) -> Optional[float]:
+        value = self.redis.hget(self._meta_key(ext_id), "last_activity")
+        return float(value) if value else None
+
+
+_store: Optional[ConversationStore] = None
+
+
+def get_conversation_store() -> Optional[ConversationStore]:
+    """The configured store, or None when CHAT_CONVERSATION_STORE is off."""
+    global _store
+    if not PipelineConfig.CONVERSATION_STORE:
+        return None
+    if _store is None:
+        _store = ConversationStore(
+            max_messages=PipelineConfig.CONVERSATION_STORE_SIZE,
+            ttl_seconds=PipelineConfig.CONVERSATION_STORE_TTL,
+        )
+    return _store
+
+
+def forget_conversation(ext_id: str, messages_only: bool = False):
+    """Drop cached state after out-of-band edits (API CRUD)."""
+    store = get_conversation_store()
+    if store is not None:
+        store.forget(ext_id, messages_only=messages_only)
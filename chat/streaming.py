@@ -0,0 +1,79 @@
+import re
+from typing import List
+
+# WhatsApp markdown markers that must stay balanced within a single message
+_MARKERS = ('*', '_', '~')
+_SENTENCE_END_RE = re.compile(r"[.!?:](?=\s)")
+
+# Twilio rejects WhatsApp bodies over 1600 characters
+WHATSAPP_MAX_CHARS = 1500
+
+
+def _balanced(text: str) -> bool:
+    return all(text.count(marker) % 2 == 0 for marker in _MARKERS)
+
+
+class WhatsAppChunker:
+    """
+    Incrementally splits a streamed completion into WhatsApp-sized messages.
+
+    A chunk is emitted at a paragraph break (or, once the buffer is long,
+    at a sentence end) as soon as it is complete, never inside an open
+    *bold*, _italic_ or ~strike~ span. The first chunk uses a lower
+    threshold so the user sees something quickly.
+    """
+
+    def __init__(self, first_min_chars: int = 40, min_chars: int = 300, max_chars: int = WHATSAPP_MAX_CHARS):
+        self.first_min_chars = first_min_chars
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.buffer = ""
+        self.emitted = 0
+
+    def feed(self, delta: str) -> List[str]:
+        """Add streamed text and return the chunks that are now complete."""
+        self.buffer += delta or ""
+        chunks = []
+        while True:
+            cut = self._find_cut()
+            if cut is None:
+                break
+            chunk, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:].lstrip()
+            if chunk:
+                chunks.append(chunk)
+                self.emitted += 1
+        return chunks
+
+    def flush(self) -> List[str]:
+        """Return whatever is left once the stream has ended."""
+        rest, self.buffer = self.buffer.strip(), ""
+        out = []
+        while len(rest) > self.max_chars:
+            cut = rest.rfind(" ", 0, self.max_chars)
+            if cut <= 0:
+                cut = self.max_chars
+            out.append(rest[:cut].strip())
+            rest = rest[cut:].strip()
+        if rest:
+            out.append(rest)
+        return out
+
+    def _find_cut(self):
+        minimum = self.first_min_chars if self.emitted == 0 else self.min_chars
+        if len(self.buffer) < minimum:
+            return None
+        # prefer paragraph breaks past the minimum
+        candidates = [m.end() for m in re.finditer(r"\n\s*\n", self.buffer) if m.start() >= minimum]
+        # fall back to sentence ends once the buffer is getting long
+        if not candidates and len(self.buffer) >= 2 * minimum:
+            candidates = [m.end() for m in _SENTENCE_END_RE.finditer(self.buffer) if m.end() >= minimum]
+        # the first chunk goes out at the earliest boundary; later ones are
+        # packed up to the latest one to keep the message count low
+        for cut in (candidates if self.emitted == 0 else reversed(candidates)):
+            if cut <= self.max_chars and _balanced(self.buffer[:cut]):
+                return cut
+        if len(self.buffer) > self.max_chars:
+            # no clean boundary: hard split on whitespace
+            cut = self.buffer.rfind(" ", 0, self.max_chars)
+            return cut if cut > 0 else self.max_chars
+        return None
@@ -1,22 +1,267 @@
-from celery import shared_task
-from chat.models import Channel, Message
-from chat.utils import LLMPipeline, TwilioWrapper
+from celery import chain, group, shared_task
+from celery.exceptions import Ignore
+from django.conf import settings
+from agent_chatbot.settings import PipelineConfig
+from chat import archive, outbox, partitions, stages
+from chat.ingest import get_channel, ingest_message, is_latest, mark_latest
+from chat.models import Channel
+from chat.routing import LeaseBusy, channel_lease
+from chat.store import get_conversation_store
+from chat.utils import ConversationSummarizer, LLMPipeline, Superseded, TwilioWrapper
+from core.metrics import CHAT_LEASE_WAITS, CHAT_RUNS
+from core.ratelimit import RateLimited
 
-@shared_task
-def process_and_reply(ext_id: str, profile_name: str, msg_body: str):
+@shared_task(bind=True, max_retries=None)
+def process_and_reply(self, ext_id: str, profile_name: str, msg_body: str, message_id: str = ""):
+    """
+    1) Find or create the Channel (cached per external_id with the conversation store)
+    2) Persist the incoming message (written through to the conversation store)
+       and mark it as the channel's latest
+    3) Take the channel's lease (chat.routing). While another run holds it
+       only the latest message waits for it: older ones are answered by its run
+    4) Run the LLMPipeline over every message since the last reply
+    5) Send the LLM’s reply via WhatsApp (chunk by chunk when streaming)
+    6) Persist the run's per-stage spans (PipelineConfig.TRACING)
+    """
+    if not message_id:
+        try:
+            print(f"Processing message from {profile_name} in channel {ext_id}: {msg_body}")
+            _, message = ingest_message(ext_id, profile_name, msg_body)
+        except Exception as e:
+            print(f"Error processing message: {e}")
+            return
+        message_id = str(message.id)
+        mark_latest(ext_id, message_id, ttl_seconds=PipelineConfig.CHANNEL_LEASE_SECONDS + 60)
+    if not is_latest(ext_id, message_id):
+        print(f"Skipping superseded run for message {message_id} in channel {ext_id}")
+        CHAT_RUNS.labels('superseded').inc()
+        return
+    try:
+        with channel_lease(ext_id):
+            run_pipeline(
+                get_channel(ext_id),
+                profile_name,
+                coalesce_burst=True,
+                is_superseded=lambda: not is_latest(ext_id, message_id),
+            )
+    except LeaseBusy:
+        # the message is persisted: the retry only has to answer it
+        _wait_for_lease(self, ext_id, args=(ext_id, profile_name, msg_body, message_id))
+
+
+@shared_task(bind=True, max_retries=None)
+def reply_to_burst(self, ext_id: str, profile_name: str, message_id: str):
+    """
+    Debounced reply (PipelineConfig.DEBOUNCE_SECONDS): the webhook already
+    persisted the message; answer only if no newer message arrived during the
+    quiet period, merging the burst into one user turn.
+    """
+    if not is_latest(ext_id, message_id):
+        print(f"Skipping superseded run for message {message_id} in channel {ext_id}")
+        CHAT_RUNS.labels('superseded').inc()
+        return
+    channel = get_channel(ext_id)
+    if channel is None:
+        print(f"Channel {ext_id} not found")
+        return
+    try:
+        with channel_lease(ext_id):
+            run_pipeline(
+                channel,
+                profile_name,
+                coalesce_burst=True,
+                is_superseded=lambda: not is_latest(ext_id, message_id),
+            )
+    except LeaseBusy:
+        _wait_for_lease(self, ext_id)
+
+
+def _wait_for_lease(task, ext_id: str, args: tuple = None):
+    """
+    Requeue a reply task whose channel is busy. The retry keeps the task's
+    queue, so it stays on the channel's shard. Only a channel's latest
+    message waits (its run answers the whole backlog), so the retry's delay
+    can't reorder the replies.
+    """
+    print(f"Channel {ext_id} is busy, retrying in {PipelineConfig.CHANNEL_LEASE_RETRY_SECONDS}s")
+    CHAT_LEASE_WAITS.inc()
+    raise task.retry(args=args, countdown=PipelineConfig.CHANNEL_LEASE_RETRY_SECONDS)
+
+
+def run_pipeline(channel: Channel, profile_name: str, coalesce_burst: bool = False, is_superseded=None):
+    """
+    Steps 3-5 of process_and_reply for an already persisted user message.
+    """
+    pipeline = None
+    reply = None
+    error = ""
+    try:
+        pipeline = LLMPipeline.from_config(
+            channel,
+            coalesce_burst=coalesce_burst,
+            is_superseded=is_superseded,
+        )
+        twilio = None if pipeline.outbox else TwilioWrapper()
+
+        def send(text):
+            if pipeline.outbox:
+                outbox.enqueue(channel, text)
+                return
+            with pipeline.tracer.span("twilio_send"):
+                twilio.send_whatsapp(text, channel.external_id)
+
+        if pipeline.stream_reply:
+            # each chunk goes out as soon as it is complete
+            reply = pipeline.process(on_chunk=send)
+        else:
+            # with the outbox, persisting the reply already queued it
+            reply = pipeline.process()
+            print(f"Replying to {profile_name} in channel {channel.external_id}: {reply.text}")
+            if not pipeline.outbox:
+                send(reply.text)
+        CHAT_RUNS.labels('replied').inc()
+        # fold turns that left the history window, off the reply's critical path
+        update_channel_summary.delay(str(channel.id), pipeline.history_size)
+    except Superseded as e:
+        error = f"Superseded: {e}"
+        print(f"Dropping reply: {e}")
+        CHAT_RUNS.labels('superseded').inc()
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        print(f"Error processing message: {e}")
+        CHAT_RUNS.labels('error').inc()
+    finally:
+        if pipeline is not None and PipelineConfig.TRACING:
+            try:
+                pipeline.save_trace(reply, error)
+            except Exception as e:
+                print(f"Error saving pipeline trace: {e}")
+
+
+# --- stage DAG (PipelineConfig.PIPELINE_MODE == "dag", see chat.stages) -----
+
+def start_stage_pipeline(ext_id: str, profile_name: str, msg_body: str = "", message_id: str = "", countdown: float = None):
+    """
+    Run the pipeline as a chain of stage tasks, each routed to its stage's
+    queue (PipelineConfig.STAGE_QUEUES); the two retrievals run as a chord.
+    """
+    state = stages.new_state(ext_id, profile_name, msg_body, message_id)
+    workflow = chain(
+        stage_ingest.s(state),
+        stage_route.s(),
+        group(stage_retrieve_vehicles.s(), stage_retrieve_extra.s()),
+        stage_generate.s(),
+        stage_deliver.s(),
+    )
+    return workflow.apply_async(countdown=countdown)
+
+
+def _run_stage(task, stage, state: dict):
     """
-    1) Find or create the Channel
-    2) Persist the incoming message
-    3) Run the LLMPipeline
-    4) Send the LLM’s reply via WhatsApp
+    Run one stage. A busy channel or a throttled model retries the stage
+    alone; any other failure closes the run and stops the chain.
     """
+    if state is None:
+        # an earlier stage already closed the run (eager mode runs the whole chain)
+        raise Ignore()
     try:
-        print(f"Processing message from {profile_name} in channel {ext_id}: {msg_body}")
-        channel, _ = Channel.objects.get_or_create(external_id=ext_id)
-        Message.objects.create(channel=channel, text=msg_body, author=profile_name)
-        pipeline = LLMPipeline(channel=channel)
-        reply_text = pipeline.process().text
-        print(f"Replying to {profile_name} in channel {ext_id}: {reply_text}")
-        TwilioWrapper().send_whatsapp(reply_text, channel.external_id)
+        return stage(state)
+    except LeaseBusy:
+        _wait_for_lease(task, state["ext_id"], args=(state,))
+    except RateLimited as e:
+        if task.request.retries < PipelineConfig.STAGE_MAX_RETRIES:
+            print(f"Stage {task.name} throttled, retrying in {e.retry_after:.1f}s")
+            raise task.retry(exc=e, countdown=e.retry_after)
+        print(f"Error processing message: {e}")
+        stages.finish(state, 'error', f"{type(e).__name__}: {e}")
+    except Superseded as e:
+        print(f"Dropping reply: {e}")
+        stages.finish(state, 'superseded', f"Superseded: {e}")
     except Exception as e:
         print(f"Error processing message: {e}")
+        stages.finish(state, 'error', f"{type(e).__name__}: {e}")
+    # the run is over: don't hand anything to the next stage
+    raise Ignore()
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_ingest(self, state: dict):
+    """Take the channel's lease and persist the user message."""
+    return _run_stage(self, stages.ingest, state)
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_route(self, state: dict):
+    """Transcript, normalization and routing decisions."""
+    return _run_stage(self, stages.route, state)
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_retrieve_vehicles(self, state: dict):
+    """Catalog search (first chord member, carries the run state)."""
+    return _run_stage(self, stages.retrieve_vehicles, state)
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_retrieve_extra(self, state: dict):
+    """KB context (second chord member)."""
+    return _run_stage(self, stages.retrieve_extra, state)
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_generate(self, parts: list):
+    """Chord callback: merge both retrievals and generate the reply."""
+    return _run_stage(self, stages.generate, None if None in parts else stages.merge(parts))
+
+
+@shared_task(bind=True, max_retries=None)
+def stage_deliver(self, state: dict):
+    """Send the reply, close the run and refresh the summary."""
+    state = _run_stage(self, stages.deliver, state)
+    update_channel_summary.delay(state["channel_id"])
+    return state
+
+
+@shared_task(bind=True, max_retries=5)
+def update_channel_summary(self, channel_id: str, history_size: int = 10):
+    """
+    Incrementally fold the turns that fell out of the history window
+    into the channel's rolling summary.
+    """
+    channel = Channel.objects.filter(id=channel_id).first()
+    if channel is None:
+        return
+    try:
+        updated = ConversationSummarizer(history_size=history_size).update(channel)
+    except RateLimited as e:
+        raise self.retry(exc=e, countdown=e.retry_after)
+    if updated:
+        print(f"Updated summary for channel {channel.external_id}")
+        store = get_conversation_store()
+        if store:
+            store.set_summary(channel.external_id, channel.summary)
+
+
+@shared_task
+def drain_outbox():
+    """
+    Send queued outbound WhatsApp messages (chat.outbox). Triggered by every
+    new message and periodically by beat for retries.
+    """
+    counts = outbox.drain()
+    if counts:
+        print(f"Outbox drained: {dict(counts)}")
+
+
+@shared_task
+def ensure_message_partitions():
+    """Beat job: create next months' chat_message partitions (PostgreSQL)."""
+    created = partitions.ensure_message_partitions(settings.CHAT_MESSAGE_PARTITIONS_AHEAD)
+    print(f"Message partitions present: {created}")
+
+
+@shared_task
+def archive_idle_channels(retention_days: int = None, limit: int = 500):
+    """Beat job: move channels idle past the retention window to archive files."""
+    archived = archive.archive_idle_channels(retention_days or settings.CHAT_ARCHIVE_RETENTION_DAYS, limit)
+    print(f"Archived {len(archived)} channel(s)")
@@ -1,3 +1,453 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+from agent_chatbot.settings import OpenAIConfig, PipelineConfig, TwilioConfig
+from chat import outbox
+from chat.budget import PromptBudget
+from chat.concurrency import StageGraph
+from chat.ingest import is_latest, mark_latest
+from chat.models import Channel, OutboundMessage
+from chat.normalizer import WEIGHT_CATALOG, WEIGHT_PLACE, WEIGHT_WORD, LocalNormalizer, damerau_levenshtein
+from chat.routing import LeaseBusy, channel_lease, channel_shard, jump_hash, route_task
+from chat.streaming import WhatsAppChunker
+from chat.utils import LLMPipeline
+from core import clients, resilience
+from core.resilience import CircuitBreaker, get_breaker
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class StageGraphTests(SimpleTestCase):
+    def test_stages_receive_their_dependencies(self):
+        graph = (
+            StageGraph()
+            .add('history', lambda: ['hola'])
+            .add('transcript', lambda history: ' '.join(history), deps=['history'])
+            .add('reply', lambda history, transcript: f"{len(history)}:{transcript}", deps=['history', 'transcript'])
+        )
+        self.assertEqual(graph.run(), {'history': ['hola'], 'transcript': 'hola', 'reply': '1:hola'})
+
+    def test_independent_stages_overlap(self):
+        # each stage waits for the other: only passes if both run at once
+        barrier = threading.Barrier(2, timeout=5)
+        graph = StageGraph().add('classify', barrier.wait).add('kb_route', barrier.wait)
+        self.assertEqual(set(graph.run()), {'classify', 'kb_route'})
+
+    def test_unknown_dependency(self):
+        with self.assertRaises(ValueError):
+            StageGraph().add('reply', lambda history: history, deps=['history'])
+
+    def test_stage_error_is_raised(self):
+        def fail():
+            raise RuntimeError('model down')
+
+        graph = StageGraph().add('classify', fail).add('reply', lambda classify: classify, deps=['classify'])
+        with self.assertRaisesMessage(RuntimeError, 'model down'):
+            graph.run()
+
+
+def completion(content: str):
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+
+@mock.patch.object(OpenAIConfig, 'API_KEY', 'sk-test')
+class RouterTests(TestCase):
+    def setUp(self):
+        self.pipeline = LLMPipeline(Channel.objects.create(external_id='+5491100000001'), router_mode=True)
+        self.pipeline.client = mock.Mock()
+
+    def route(self, content: str) -> dict:
+        self.pipeline.client.chat.completions.create.return_value = completion(content)
+        return self.pipeline.route_message('', 'nesesito un versa')
+
+    def test_parses_the_structured_answer(self):
+        route = self.route(
+            '{"normalized_text": " Necesito un Versa ", "needs_vehicle_search": true,'
+            ' "vehicle_filters": {"model": "Versa", "price_max": "250000"}, "kb_article_ids": ["unknown"]}'
+        )
+        self.assertEqual(route['normalized_text'], 'Necesito un Versa')
+        self.assertIs(route['needs_vehicle_search'], True)
+        self.assertEqual((route['vehicle_filters'].model, route['vehicle_filters'].price_max), ('Versa', 250000))
+        # only ids of active articles survive
+        self.assertEqual(route['kb_article_ids'], [])
+
+    def test_malformed_answers_fall_back_to_the_user_text(self):
+        for content in ('not json', '[]', '{"needs_vehicle_search": "yes", "kb_article_ids": [1, null]}'):
+            with self.subTest(content=content):
+                route = self.route(content)
+                self.assertEqual(route['normalized_text'], 'nesesito un versa')
+                self.assertIs(route['needs_vehicle_search'], False)
+                self.assertEqual(route['kb_article_ids'], [])
+
+
+class DamerauLevenshteinTests(SimpleTestCase):
+    def test_distances(self):
+        self.assertEqual(damerau_levenshtein('versa', 'versa', 2), 0)
+        self.assertEqual(damerau_levenshtein('nesesito', 'necesito', 2), 1)
+        # a transposition is a single edit
+        self.assertEqual(damerau_levenshtein('nissna', 'nissan', 2), 1)
+        self.assertEqual(damerau_levenshtein('gudalajra', 'guadalajara', 2), 2)
+
+    def test_capped_at_max_distance(self):
+        self.assertEqual(damerau_levenshtein('versa', 'sentra', 1), 2)
+        self.assertEqual(damerau_levenshtein('kia', 'mitsubishi', 2), 3)
+
+
+class LocalNormalizerTests(SimpleTestCase):
+    def setUp(self):
+        self.normalizer = (
+            LocalNormalizer()
+            .add_terms(['necesito', 'un', 'en', 'casa', 'cosa', 'esta', 'está'], WEIGHT_WORD)
+            .add_terms(['Guadalajara', 'Ciudad de México'], WEIGHT_PLACE)
+            .add_terms(['Nissan', 'Versa'], WEIGHT_CATALOG)
+        )
+
+    def test_corrects_typos_and_casing(self):
+        result = self.normalizer.normalize('nesesito un nissan versa 2022 en guadaljara')
+        self.assertEqual(result.text, 'Necesito un Nissan Versa 2022 en Guadalajara')
+        self.assertEqual(result.confidence, 1.0)
+        self.assertEqual(
+            result.corrections,
+            [('nesesito', 'necesito'), ('nissan', 'Nissan'), ('versa', 'Versa'), ('guadaljara', 'Guadalajara')],
+        )
+
+    def test_multi_word_terms_are_indexed_per_word(self):
+        self.assertEqual(self.normalizer.lookup('mexico'), ('México', True))
+
+    def test_unknown_words_lower_the_confidence(self):
+        result = self.normalizer.normalize('un xyzqw')
+        self.assertEqual(result.text, 'Un xyzqw')
+        self.assertEqual(result.confidence, 0.5)
+
+    def test_ambiguous_words_are_left_alone(self):
+        # casa and cosa are both one edit away
+        self.assertEqual(self.normalizer.lookup('cxsa'), (None, False))
+        # known word whose accent can't be decided
+        self.assertEqual(self.normalizer.lookup('esta'), (None, True))
+        # short words are never corrected
+        self.assertEqual(self.normalizer.lookup('uj'), (None, False))
+
+
+@mock.patch('chat.budget.get_encoding', return_value=None)
+class PromptBudgetTests(SimpleTestCase):
+    # without a tokenizer a token is ~4 characters
+    def budget(self, **budgets) -> PromptBudget:
+        return PromptBudget('gpt-test', budgets)
+
+    def test_sections_within_budget_are_untouched(self, encoding):
+        budget = self.budget()
+        self.assertEqual(budget.fit_transcript('user: hola'), 'user: hola')
+        self.assertEqual(budget.usage['transcript'], {
+            'tokens': 3, 'budget': 1500, 'truncated': False, 'original_tokens': 3,
+        })
+
+    def test_transcript_keeps_the_latest_lines(self, encoding):
+        budget = self.budget(transcript=6)
+        transcript = '\n'.join(f'line {i}' for i in range(1, 6))
+        self.assertEqual(budget.fit_transcript(transcript), 'line 4\nline 5')
+        self.assertTrue(budget.usage['transcript']['truncated'])
+        self.assertLessEqual(budget.usage['transcript']['tokens'], 6)
+
+    def test_vehicles_keep_the_header_and_best_rows(self, encoding):
+        budget = self.budget(vehicles=14)
+        vehicles = 'stock_id,make\n' + ''.join(f'{i:04d},Nissan\n' for i in range(10))
+        self.assertEqual(budget.fit_vehicles(vehicles), 'stock_id,make\n0000,Nissan\n0001,Nissan\n')
+
+    def test_extra_keeps_whole_passages_then_truncates(self, encoding):
+        budget = self.budget(extra=12)
+        extra = '\n\n'.join(['a' * 20, 'b' * 40, 'c' * 40])
+        self.assertEqual(budget.fit_extra(extra), 'a' * 20 + '\n\n' + 'b' * 20)
+
+    def test_last_user_message_is_truncated(self, encoding):
+        budget = self.budget(last_user_message=2)
+        self.assertEqual(budget.fit_last_user_message('hola, busco un auto'), 'hola, bu')
+
+
+class WhatsAppChunkerTests(SimpleTestCase):
+    def stream(self, chunker: WhatsAppChunker, text: str, step: int = 7) -> list:
+        chunks = []
+        for i in range(0, len(text), step):
+            chunks += chunker.feed(text[i:i + step])
+        return chunks + chunker.flush()
+
+    def test_first_chunk_goes_out_early(self):
+        chunker = WhatsAppChunker(first_min_chars=10, min_chars=200)
+        self.assertEqual(chunker.feed('Hola, con gusto te ayudo.\n\nTenemos '), ['Hola, con gusto te ayudo.'])
+        self.assertEqual(chunker.feed('dos opciones.\n\n'), [])
+        self.assertEqual(chunker.flush(), ['Tenemos dos opciones.'])
+
+    def test_never_splits_inside_markdown(self):
+        chunker = WhatsAppChunker(first_min_chars=10)
+        text = 'Te comparto *dos opciones:\n\nVersa y Sentra* a buen precio.\n\nSaludos'
+        self.assertEqual(self.stream(chunker, text), [
+            'Te comparto *dos opciones:\n\nVersa y Sentra* a buen precio.',
+            'Saludos',
+        ])
+
+    def test_long_text_is_split_on_whitespace(self):
+        chunker = WhatsAppChunker(first_min_chars=10, min_chars=20, max_chars=50)
+        text = ' '.join(['palabra'] * 40)
+        chunks = self.stream(chunker, text)
+        self.assertTrue(all(len(chunk) <= 50 for chunk in chunks))
+        self.assertEqual(' '.join(chunks), text)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class DebounceTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(clients._clients, {'redis': fakeredis.FakeRedis()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_only_the_latest_message_replies(self):
+        mark_latest('+5491100000001', 'm1', 60)
+        self.assertTrue(is_latest('+5491100000001', 'm1'))
+        mark_latest('+5491100000001', 'm2', 60)
+        self.assertFalse(is_latest('+5491100000001', 'm1'))
+        self.assertTrue(is_latest('+5491100000001', 'm2'))
+
+    def test_channels_are_independent(self):
+        mark_latest('+5491100000001', 'm1', 60)
+        mark_latest('+5491100000002', 'm2', 60)
+        self.assertTrue(is_latest('+5491100000001', 'm1'))
+
+    def test_missing_key_never_blocks(self):
+        self.assertTrue(is_latest('+5491100000001', 'm1'))
+
+
+class JumpHashTests(SimpleTestCase):
+    def test_growing_only_moves_keys_to_the_new_bucket(self):
+        for buckets in (1, 2, 5, 10):
+            before = [jump_hash(key, buckets) for key in range(2000)]
+            after = [jump_hash(key, buckets + 1) for key in range(2000)]
+            moved = [a for b, a in zip(before, after) if a != b]
+            self.assertTrue(all(bucket == buckets for bucket in moved))
+            # about 1/(N+1) of the keys move
+            self.assertAlmostEqual(len(moved) / 2000, 1 / (buckets + 1), delta=0.05)
+
+    def test_keys_spread_over_every_bucket(self):
+        counts = [0] * 4
+        for i in range(4000):
+            counts[channel_shard(f'+52155{i:08d}', 4)] += 1
+        self.assertTrue(all(800 < count < 1200 for count in counts))
+
+    def test_channel_shard_is_stable(self):
+        self.assertEqual(channel_shard('+5491100000001', 8), channel_shard('+5491100000001', 8))
+
+    @mock.patch.object(PipelineConfig, 'QUEUE_SHARDS', 4)
+    def test_route_task(self):
+        queue = f"chat.{channel_shard('+5491100000001', 4)}"
+        self.assertEqual(route_task('chat.tasks.process_and_reply', ('+5491100000001', '', 'hola'), {}, {}), {'queue': queue})
+        self.assertEqual(route_task('chat.tasks.reply_to_burst', (), {'ext_id': '+5491100000001'}, {}), {'queue': queue})
+        self.assertIsNone(route_task('catalog.tasks.import_vehicles', ('import-id',), {}, {}))
+        with mock.patch.object(PipelineConfig, 'QUEUE_SHARDS', 0):
+            self.assertIsNone(route_task('chat.tasks.process_and_reply', ('+5491100000001',), {}, {}))
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class ChannelLeaseTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = fakeredis.FakeRedis()
+        patcher = mock.patch.dict(clients._clients, {'redis': self.redis})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_one_holder_at_a_time(self):
+        with channel_lease('+5491100000001', 60):
+            with self.assertRaises(LeaseBusy), channel_lease('+5491100000001', 60):
+                pass
+            # other channels are not affected
+            with channel_lease('+5491100000002', 60):
+                pass
+        with channel_lease('+5491100000001', 60):
+            pass
+
+    def test_release_only_frees_our_own_lease(self):
+        with channel_lease('+5491100000001', 60):
+            # the lease expired and passed to another run
+            self.redis.set('chat:lease:+5491100000001', 'other-run')
+        self.assertEqual(self.redis.get('chat:lease:+5491100000001'), b'other-run')
+
+    @mock.patch.object(PipelineConfig, 'CHANNEL_LEASE_SECONDS', 0)
+    def test_disabled(self):
+        with channel_lease('+5491100000001'), channel_lease('+5491100000001'):
+            self.assertEqual(self.redis.keys(), [])
+
+
+@mock.patch.object(OpenAIConfig, 'API_KEY', 'sk-test')
+@mock.patch.dict(resilience._breakers, clear=True)
+class ModelCircuitTests(TestCase):
+    def setUp(self):
+        channel = Channel.objects.create(external_id='+5491100000001')
+        self.pipeline = LLMPipeline(channel, model_name='gpt-test', fallback_model='gpt-test-mini')
+        self.pipeline.client = mock.Mock()
+        self.create = self.pipeline.client.chat.completions.create
+
+    def half_open(self) -> CircuitBreaker:
+        breaker = get_breaker('gpt-test')
+        breaker.cooldown = 0
+        breaker.state = CircuitBreaker.OPEN
+        return breaker
+
+    def chat(self):
+        return self.pipeline._chat(model='gpt-test', messages=[{'role': 'user', 'content': 'hola'}])
+
+    def test_open_circuit_uses_the_fallback(self):
+        breaker = get_breaker('gpt-test')
+        breaker.state = CircuitBreaker.OPEN
+        breaker._opened_at = float('inf')
+        self.create.return_value = completion('hola')
+        self.chat()
+        self.assertEqual(self.create.call_args.kwargs['model'], 'gpt-test-mini')
+
+    def test_successful_probe_closes_the_circuit(self):
+        breaker = self.half_open()
+        self.create.return_value = completion('hola')
+        self.chat()
+        self.assertEqual(self.create.call_args.kwargs['model'], 'gpt-test')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+    def test_probe_failing_for_another_reason_is_released(self):
+        breaker = self.half_open()
+        self.create.side_effect = ValueError('bad request')
+        with self.assertRaises(ValueError):
+            self.chat()
+        self.assertEqual(breaker.state, CircuitBreaker.HALF_OPEN)
+        # the next call probes again instead of going to the fallback forever
+        self.create.side_effect = None
+        self.create.return_value = completion('hola')
+        self.chat()
+        self.assertEqual(self.create.call_args.kwargs['model'], 'gpt-test')
+        self.assertEqual(breaker.state, CircuitBreaker.CLOSED)
+
+
+@mock.patch.object(TwilioConfig, 'VALIDATE_SIGNATURE', False)
+class TwilioInboundTests(TestCase):
+    url = '/api/twilio/inbound/'
+
+    def setUp(self):
+        self.claimed = set()
+
+        async def claim(sid):
+            if sid in self.claimed:
+                return False
+            self.claimed.add(sid)
+            return True
+
+        async def release(sid):
+            self.claimed.discard(sid)
+
+        for name, fake in (('claim_message_sid', claim), ('release_message_sid', release)):
+            patcher = mock.patch(f'chat.api_views.{name}', side_effect=fake)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch('chat.api_views.enqueue_reply')
+        self.enqueue = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, **data):
+        fields = {'From': 'whatsapp:+5491100000001', 'Body': 'Hola', 'MessageSid': 'SM1', **data}
+        return self.client.post(self.url, fields)
+
+    def test_enqueues_the_message(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 200)
+        self.enqueue.assert_called_once_with('+5491100000001', '', 'Hola')
+
+    def test_retry_of_a_message_sid_is_only_acknowledged(self):
+        self.post()
+        self.assertEqual(self.post().status_code, 200)
+        self.assertEqual(self.enqueue.call_count, 1)
+
+    def test_failed_enqueue_releases_the_message_sid(self):
+        self.enqueue.side_effect = ConnectionError('broker down')
+        with self.assertRaises(ConnectionError):
+            self.post()
+        self.enqueue.side_effect = None
+        # Twilio's retry goes through
+        self.post()
+        self.assertEqual(self.enqueue.call_count, 2)
+
+    def test_invalid_requests(self):
+        self.assertEqual(self.post(From='').status_code, 400)
+        self.assertEqual(self.post(Body='').status_code, 400)
+        for body in (b'{not json', b'[]'):
+            response = self.client.post(self.url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400)
+
+
+class FakeTwilio:
+    def __init__(self, fail: Exception = None):
+        self.fail = fail
+        self.sent = []
+        self.messages = self
+
+    def create(self, body, from_, to, **kwargs):
+        if self.fail:
+            raise self.fail
+        self.sent.append((to, body))
+        return mock.Mock(sid=f"SM{len(self.sent)}", status='queued')
+
+
+@mock.patch.object(TwilioConfig, 'SEND_RATE', 0)
+@mock.patch('chat.outbox.trigger_drain')
+class OutboxTests(TestCase):
+    def setUp(self):
+        self.alice = Channel.objects.create(external_id='+5491100000001')
+        self.bob = Channel.objects.create(external_id='+5491100000002')
+
+    def enqueue(self, channel, *bodies):
+        return [outbox.enqueue(channel, body) for body in bodies]
+
+    def test_claims_the_oldest_unsent_message_of_each_channel(self, trigger):
+        a1, a2, a3 = self.enqueue(self.alice, 'a1', 'a2', 'a3')
+        b1, = self.enqueue(self.bob, 'b1')
+        self.assertEqual({row.id for row in outbox.claim_batch(10)}, {a1.id, b1.id})
+        # claimed (SENDING) heads keep their channels' next messages back
+        self.assertEqual(outbox.claim_batch(10), [])
+
+    def test_channel_messages_are_sent_in_order(self, trigger):
+        self.enqueue(self.alice, 'a1', 'a2', 'a3')
+        self.enqueue(self.bob, 'b1', 'b2')
+        twilio = FakeTwilio()
+        with mock.patch('chat.outbox.get_twilio_client', return_value=twilio):
+            while True:
+                rows = outbox.claim_batch(10)
+                if not rows:
+                    break
+                self.assertEqual(len({row.channel_id for row in rows}), len(rows))
+                for row in rows:
+                    self.assertEqual(outbox.send(row), 'sent')
+        sent = {}
+        for to, body in twilio.sent:
+            sent.setdefault(to, []).append(body)
+        self.assertEqual(sent, {
+            f"whatsapp:{self.alice.external_id}": ['a1', 'a2', 'a3'],
+            f"whatsapp:{self.bob.external_id}": ['b1', 'b2'],
+        })
+
+    def test_retry_holds_back_its_channel_only(self, trigger):
+        a1, a2 = self.enqueue(self.alice, 'a1', 'a2')
+        b1, = self.enqueue(self.bob, 'b1')
+        failing = FakeTwilio(fail=outbox.requests.ConnectionError('reset'))
+        with mock.patch('chat.outbox.get_twilio_client', return_value=failing):
+            self.assertEqual(outbox.send(outbox.claim_batch(1)[0]), 'retry')
+        a1.refresh_from_db()
+        self.assertEqual((a1.status, a1.attempts), (OutboundMessage.PENDING, 1))
+        OutboundMessage.objects.filter(id=a1.id).update(next_attempt_at=timezone.now() + timedelta(minutes=5))
+        # a2 is due but must not overtake a1; the batch slot goes to bob
+        self.assertEqual([row.id for row in outbox.claim_batch(1)], [b1.id])
+
+    def test_permanent_error_fails_the_message(self, trigger):
+        a1, a2 = self.enqueue(self.alice, 'a1', 'a2')
+        error = outbox.TwilioRestException(400, '/Messages', 'invalid number')
+        with mock.patch('chat.outbox.get_twilio_client', return_value=FakeTwilio(fail=error)):
+            self.assertEqual(outbox.send(outbox.claim_batch(10)[0]), 'failed')
+        # a failed message no longer blocks its channel
+        self.assertEqual([row.id for row in outbox.claim_batch(10)], [a2.id])
@@ -0,0 +1,167 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+from django.db import connection
+
+
+class Span:
+    """One timed pipeline stage."""
+
+    def __init__(self, name: str, parent: Optional[str], start_ms: float, model: Optional[str] = None):
+        self.name = name
+        self.parent = parent
+        self.start_ms = start_ms
+        self.duration_ms = 0.0
+        self.model = model
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.db_queries = 0
+        self.error = ""
+
+    def add_usage(self, usage, model: Optional[str] = None):
+        """Accumulate token counts from an OpenAI `usage` object."""
+        if model and not self.model:
+            self.model = model
+        if usage is None:
+            return
+        self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+        self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+        details = getattr(usage, "prompt_tokens_details", None)
+        # prompt-cache hits reported by the API
+        self.cached_tokens += getattr(details, "cached_tokens", 0) or 0
+
+    def to_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "start_ms": round(self.start_ms, 2),
+            "duration_ms": round(self.duration_ms, 2),
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "cached_tokens": self.cached_tokens,
+            "db_queries": self.db_queries,
+            "error": self.error,
+        }
+
+
+class Tracer:
+    """
+    Collects the spans of one pipeline run.
+
+    Spans nest per thread (the innermost open span is the parent of a new
+    one) and are safe to open from StageGraph worker threads. Durations and
+    DB query counts are inclusive of nested spans.
+    """
+
+    def __init__(self):
+        self.spans: List[Span] = []
+        self._started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def current(self) -> Optional[Span]:
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    @contextmanager
+    def span(self, name: str, model: Optional[str] = None):
+        stack = self._stack()
+        start = time.perf_counter()
+        span = Span(name, stack[-1].name if stack else None, (start - self._started) * 1000, model)
+        with self._lock:
+            self.spans.append(span)
+
+        def count_query(execute, sql, params, many, context):
+            span.db_queries += 1
+            return execute(sql, params, many, context)
+
+        stack.append(span)
+        try:
+            with connection.execute_wrapper(count_query):
+                yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            stack.pop()
+            span.duration_ms = (time.perf_counter() - start) * 1000
+
+    def record_usage(self, usage, model: Optional[str] = None):
+        """Attach token usage to the innermost open span of this thread."""
+        span = self.current()
+        if span is not None:
+            span.add_usage(usage, model)
+
+    @property
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self._started) * 1000
+
+    def to_list(self) -> List[dict]:
+        with self._lock:
+            return [span.to_dict() for span in self.spans]
+
+
+def traced(name: str, model_attr: Optional[str] = None):
+    """
+    Method decorator: run the method inside `self.tracer.span(name)`.
+    `model_attr` names the attribute holding the model the stage calls.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            model = getattr(self, model_attr) if model_attr else None
+            with self.tracer.span(name, model=model):
+                return fn(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0-100) of an unsorted list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def stage_stats(runs: List[List[dict]]) -> Dict[str, dict]:
+    """
+    Aggregate the spans of many runs into per-stage latency/token stats.
+    Spans with the same name in one run (e.g. several WhatsApp sends) are
+    summed first so every run contributes one sample per stage.
+    """
+    samples: Dict[str, List[dict]] = {}
+    for spans in runs:
+        per_run: Dict[str, dict] = {}
+        for span in spans:
+            agg = per_run.setdefault(span["name"], {"ms": 0.0, "tokens": 0, "queries": 0, "errors": 0})
+            agg["ms"] += span.get("duration_ms", 0.0)
+            agg["tokens"] += span.get("prompt_tokens", 0) + span.get("completion_tokens", 0)
+            agg["queries"] += span.get("db_queries", 0)
+            agg["errors"] += 1 if span.get("error") else 0
+        for name, agg in per_run.items():
+            samples.setdefault(name, []).append(agg)
+
+    stats = {}
+    for name, rows in samples.items():
+        latencies = [r["ms"] for r in rows]
+        stats[name] = {
+            "count": len(rows),
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "mean_ms": round(sum(latencies) / len(rows), 2),
+            "mean_tokens": round(sum(r["tokens"] for r in rows) / len(rows), 1),
+            "mean_db_queries": round(sum(r["queries"] for r in rows) / len(rows), 2),
+            "errors": sum(r["errors"] for r in rows),
+        }
+    return dict(sorted(stats.items(), key=lambda item: -item[1]["p95_ms"]))
@@ -1,11 +1,13 @@
 # chat/urls.py
 from rest_framework import routers
 from django.urls import path, include
-from chat.api_views import ChannelViewSet, MessageViewSet, twilio_inbound
+from chat.api_views import ChannelViewSet, MessageViewSet, OutboundMessageViewSet, PipelineRunViewSet, twilio_inbound
 
 router = routers.DefaultRouter()
 router.register(r'channels', ChannelViewSet)
 router.register(r'messages', MessageViewSet)
+router.register(r'runs', PipelineRunViewSet)
+router.register(r'outbox', OutboundMessageViewSet)
 
 urlpatterns = [
     # your DRF router endpoints
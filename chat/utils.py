@@ -1,20 +1,57 @@
-import csv
-import io
 import json
-from typing import List, Optional
+import threading
+import time
+from typing import Callable, List, Optional
+from django.db import transaction
 from django.utils import timezone
-from agent_chatbot.settings import TwilioConfig, OpenAIConfig
-from chat.models import Channel, Message
-from catalog.models import Vehicle, KnowledgeArticle
-from openai import OpenAI
-from twilio.rest import Client
+from agent_chatbot.settings import PipelineConfig, TwilioConfig
+from chat.models import Channel, Message, PipelineRun
+from catalog.kb_index import get_kb_index
+from catalog.models import KnowledgeArticle, Vehicle
+from catalog.search import VehicleFilter, search_vehicles, vehicles_to_csv
+from catalog.snapshot import get_catalog_snapshot
+from catalog.vector_index import semantic_kb_passages, semantic_vehicle_stock_ids
+from chat import outbox
+from chat.budget import PromptBudget, count_tokens, truncate_tokens
+from chat.concurrency import StageGraph
+from chat.normalizer import get_local_normalizer
+from chat.store import ConversationStore, get_conversation_store
+from chat.streaming import WhatsAppChunker
+from chat.tracing import Tracer, traced
+from core.clients import get_openai_client, get_twilio_client
+from core.metrics import record_openai_usage
+from core.ratelimit import BACKGROUND, LIVE, call_openai
+from core.resilience import get_breaker, hedged, is_model_failure, latency_percentile, observe_latency
+
+def format_transcript(messages: List[Message], exclude_msg: Optional[Message] = None) -> str:
+    """
+    Render messages as "Author: text" lines, skipping `exclude_msg`.
+    """
+    lines = []
+    for m in messages:
+        if exclude_msg and m.id == exclude_msg.id:
+            continue
+        author = m.author.lower() if m.author else ""
+        if author in ("assistant", "bot"):
+            label = "Bot"
+        elif m.author:
+            label = str(m.author)
+        else:
+            label = "Usuario"
+        lines.append(f"{label}: {m.text}")
+    return "\n".join(lines)
+
+
+class Superseded(Exception):
+    """A newer inbound message made this pipeline run obsolete."""
+
 
 class TwilioWrapper:
     """
     A wrapper class for Twilio API interactions.
     """
     def __init__(self):
-        self.client = Client(TwilioConfig.ACCOUNT_SID, TwilioConfig.AUTH_TOKEN)
+        self.client = get_twilio_client()
 
     def send_whatsapp(self, body: str, to_number: str, from_number: str = TwilioConfig.WHATSAPP_FROM):
         message = self.client.messages.create(
@@ -35,14 +72,76 @@ class LLMPipeline:
         channel: Channel,
         model_name: str = "gpt-4-turbo",
         temperature: float = 0.5,
+        fallback_model: Optional[str] = None,
         classification_model: str = "gpt-3.5-turbo",
         classification_model_temperature: float = 0,
+        classification_fallback_model: Optional[str] = None,
+        hedge_requests: bool = False,
+        latency_slos: Optional[dict] = None,
         history_size: int = 10,
         timeout_minutes: int = 15,
+        vehicle_results_limit: int = 10,
+        concurrent_stages: bool = False,
+        speculative_vehicle_search: bool = False,
+        router_mode: bool = False,
+        router_model: str = "gpt-4o-mini",
+        local_normalization: bool = False,
+        local_normalization_threshold: float = 0.9,
+        kb_retrieval: str = "llm",
+        kb_top_k: int = 4,
+        kb_min_score: float = 1.0,
+        semantic_vehicle_search: bool = False,
+        token_budgets: Optional[dict] = None,
+        stream_reply: bool = False,
+        outbox: bool = False,
+        conversation_store: Optional[ConversationStore] = None,
+        coalesce_burst: bool = False,
+        is_superseded: Optional[Callable[[], bool]] = None,
     ):
         """
         Initialize the pipeline with channel, models, and parameters.
+
+        fallback_model / classification_fallback_model: faster models that
+            take over calls to `model_name` / `classification_model` while
+            that model's circuit breaker is open, and answer hedged requests.
+        hedge_requests: when a non-streamed call outlives its stage's latency
+            SLO (`latency_slos[stage]` in seconds, else the stage's rolling
+            p95), send a duplicate to the fallback model (or the same model)
+            and take the first answer.
+        concurrent_stages: run independent stages (vehicle classification,
+            KB routing, KB load) in parallel on a thread pool.
+        speculative_vehicle_search: in concurrent mode, extract vehicle filters
+            alongside the classification call and discard them if unused;
+            saves one more LLM round-trip at the cost of a cheap extra call.
+        router_mode: replace normalization, vehicle classification, filter
+            extraction and KB routing with a single structured-output call
+            to `router_model` (must support JSON-schema response formats).
+        local_normalization: correct typos with the in-process lexicon first
+            and only call the LLM when the share of recognised words is below
+            `local_normalization_threshold`.
+        kb_retrieval: "llm" lets the classification model pick whole KB
+            articles; "bm25" / "embedding" take the `kb_top_k` best-matching
+            passages from the in-process BM25 or vector index, without an LLM call.
+        semantic_vehicle_search: when the extracted filter spec is empty
+            (vague queries like "algo familiar y económico"), rank vehicles by
+            embedding similarity instead of returning the cheapest ones.
+        token_budgets: per-section token caps for the final prompt
+            (transcript, last_user_message, vehicles, extra); see
+            chat.budget.DEFAULT_TOKEN_BUDGETS.
+        stream_reply: stream the final completion and hand each complete
+            WhatsApp-sized chunk to the `on_chunk` callback given to `process`.
+        outbox: queue the (non-streamed) reply for sending in the transaction
+            that persists it (chat.outbox) instead of leaving delivery to the caller.
+        conversation_store: read history and the last user message from the
+            Redis conversation buffer (one read per run) and write the reply
+            through to it; the database is only hit on a cache miss.
+        coalesce_burst: treat every user message since the last bot reply as
+            one "last user message" (debounced bursts).
+        is_superseded: checked before the final LLM call and before the reply
+            is persisted; when it returns True the run raises Superseded.
         """
+        if kb_retrieval not in ("llm", "bm25", "embedding"):
+            raise ValueError(f"Unknown kb_retrieval mode: {kb_retrieval}")
         if not channel:
             raise ValueError("channel must be provided to LLMPipeline.")
         self.channel = channel
@@ -50,15 +149,140 @@ class LLMPipeline:
         self.temperature = temperature
         self.classification_model = classification_model
         self.classification_model_temperature = classification_model_temperature
+        self.fallback_models = {
+            model: fallback
+            for model, fallback in ((model_name, fallback_model), (classification_model, classification_fallback_model))
+            if fallback
+        }
+        self.hedge_requests = hedge_requests
+        self.latency_slos = latency_slos or {}
         self.history_size = history_size
         self.timeout_minutes = timeout_minutes
-        self.client = OpenAI(api_key=OpenAIConfig.API_KEY)
+        self.vehicle_results_limit = vehicle_results_limit
+        self.concurrent_stages = concurrent_stages
+        self.speculative_vehicle_search = speculative_vehicle_search
+        self.router_mode = router_mode
+        self.router_model = router_model
+        self.local_normalization = local_normalization
+        self.local_normalization_threshold = local_normalization_threshold
+        self.kb_retrieval = kb_retrieval
+        self.kb_top_k = kb_top_k
+        self.kb_min_score = kb_min_score
+        self.semantic_vehicle_search = semantic_vehicle_search
+        self.token_budgets = token_budgets
+        self.stream_reply = stream_reply
+        self.outbox = outbox
+        self.store = conversation_store
+        self._recent: Optional[List[Message]] = None
+        self._recent_lock = threading.Lock()
+        self.coalesce_burst = coalesce_burst
+        self.is_superseded = is_superseded
+        self._burst_ids = set()
+        self.token_usage: dict = {}
+        self.tracer = Tracer()
+        self.client = get_openai_client()
+
+    @classmethod
+    def from_config(cls, channel: Channel, **overrides) -> "LLMPipeline":
+        """Pipeline configured from PipelineConfig (CHAT_* settings)."""
+        options = dict(
+            fallback_model=PipelineConfig.FALLBACK_MODEL,
+            classification_fallback_model=PipelineConfig.CLASSIFICATION_FALLBACK_MODEL,
+            hedge_requests=PipelineConfig.HEDGE_REQUESTS,
+            latency_slos=PipelineConfig.LATENCY_SLOS,
+            concurrent_stages=PipelineConfig.CONCURRENT_STAGES,
+            speculative_vehicle_search=PipelineConfig.SPECULATIVE_VEHICLE_SEARCH,
+            router_mode=PipelineConfig.ROUTER_MODE,
+            router_model=PipelineConfig.ROUTER_MODEL,
+            local_normalization=PipelineConfig.LOCAL_NORMALIZATION,
+            local_normalization_threshold=PipelineConfig.LOCAL_NORMALIZATION_THRESHOLD,
+            kb_retrieval=PipelineConfig.KB_RETRIEVAL,
+            kb_top_k=PipelineConfig.KB_TOP_K,
+            semantic_vehicle_search=PipelineConfig.SEMANTIC_VEHICLE_SEARCH,
+            token_budgets=PipelineConfig.TOKEN_BUDGETS,
+            stream_reply=PipelineConfig.STREAM_REPLY,
+            outbox=TwilioConfig.OUTBOX,
+            conversation_store=get_conversation_store(),
+        )
+        options.update(overrides)
+        return cls(channel=channel, **options)
+
+    @property
+    def mode(self) -> str:
+        """Short label of the execution path, stored on PipelineRun."""
+        if self.router_mode:
+            return "routed"
+        return "concurrent" if self.concurrent_stages else "sequential"
+
+    def _chat(self, **kwargs):
+        """
+        Chat completion whose token usage is recorded on the current span
+        and in the process metrics. Goes to the fallback model while the
+        requested model's circuit is open, and is hedged past the stage's
+        latency SLO (streams are never hedged).
+        """
+        model = kwargs.pop("model")
+        operation = "chat_stream" if kwargs.get("stream") else "chat"
+        span = self.tracer.current()
+        stage = span.name if span else operation
+        fallback = self.fallback_models.get(model)
+        if fallback and not get_breaker(model).allow():
+            print(f"Circuit for {model} is open, using {fallback} for {stage}")
+            model, fallback = fallback, None
+
+        def attempt(m: str):
+            def run():
+                start = time.perf_counter()
+                breaker = get_breaker(m)
+                ok = None
+                try:
+                    resp = call_openai(self.client.chat.completions.create, operation, LIVE, model=m, **kwargs)
+                    ok = True
+                except Exception as e:
+                    if is_model_failure(e):
+                        ok = False
+                    raise
+                finally:
+                    # a half-open circuit must not wait forever on a probe that said nothing
+                    if ok is None:
+                        breaker.release()
+                    else:
+                        breaker.record(ok)
+                if operation == "chat":
+                    observe_latency(stage, m, time.perf_counter() - start)
+                    # a losing hedge still used tokens
+                    record_openai_usage(m, getattr(resp, "usage", None))
+                return m, resp
+            return run
+
+        delay = None
+        if self.hedge_requests and operation == "chat":
+            delay = self.latency_slos.get(stage) or latency_percentile(stage, model)
+        used, resp = hedged(attempt(model), attempt(fallback or model), delay, stage, retry_on=is_model_failure)
+        if span is not None:
+            # the stage's model is whichever answered
+            span.model = used
+        self.tracer.record_usage(getattr(resp, "usage", None), used)
+        return resp
+
+    def _record_usage(self, usage, model: Optional[str]):
+        self.tracer.record_usage(usage, model)
+        record_openai_usage(model, usage)
 
+    @traced("history")
     def get_active_history(self) -> List[Message]:
         """
         STEP 1: Fetch the last N messages if within timeout window,
         otherwise return only the most recent message.
         """
+        if self.store:
+            recent = self._recent_messages()
+            if not recent:
+                return []
+            last = recent[-1]
+            if (timezone.now() - last.date_created).total_seconds() > self.timeout_minutes * 60:
+                return [last]
+            return recent[-self.history_size:]
         qs = self.channel.messages.order_by('-date_created')
         if not qs.exists():
             return []
@@ -67,6 +291,7 @@ class LLMPipeline:
             return [last]
         return list(qs[: self.history_size][::-1])
 
+    @traced("transcript")
     def build_transcript(
         self,
         messages: List[Message],
@@ -74,32 +299,69 @@ class LLMPipeline:
     ) -> str:
         """
         STEP 1b: Convert messages to a human-readable transcript,
-        excluding the specified message (typically the latest user message).
+        excluding the specified message (typically the latest user message)
+        and, with coalesce_burst, the rest of the burst it stands for.
         """
-        lines = []
-        for m in messages:
-            if exclude_msg and m.id == exclude_msg.id:
-                continue
-            author = m.author.lower() if m.author else ""
-            if author in ("assistant", "bot"):
-                label = "Bot"
-            elif m.author:
-                label = str(m.author)
-            else:
-                label = "Usuario"
-            lines.append(f"{label}: {m.text}")
-        return "\n".join(lines)
+        if self._burst_ids:
+            messages = [m for m in messages if m.id not in self._burst_ids]
+        return format_transcript(messages, exclude_msg)
 
+    @traced("last_user")
     def get_last_user_message(self) -> Optional[Message]:
         """
         STEP 2a: Return the most recent message sent by a user (not the bot).
+        With coalesce_burst, the user messages sent since the last bot reply
+        are merged into one.
         """
+        if self.coalesce_burst:
+            burst = self._trailing_user_messages()
+            if len(burst) > 1:
+                self._burst_ids = {m.id for m in burst}
+                merged = Message(id=burst[-1].id, channel=self.channel, author=burst[-1].author,
+                                 text="\n".join(m.text for m in burst))
+                merged.date_created = burst[-1].date_created
+                return merged
+        if self.store:
+            for message in reversed(self._recent_messages()):
+                if (message.author or "").lower() != "bot":
+                    return message
         return Message.objects.filter(channel=self.channel).exclude(author__iexact="bot").order_by('-date_created').first()
 
+    def _recent_messages(self) -> List[Message]:
+        """The conversation buffer, read once per run (history and last_user share it)."""
+        with self._recent_lock:
+            if self._recent is None:
+                self._recent = self.store.recent(self.channel, self.history_size)
+            return self._recent
+
+    def _trailing_user_messages(self) -> List[Message]:
+        """User messages after the last bot reply, oldest first."""
+        if self.store:
+            recent = self._recent_messages()
+        else:
+            recent = list(self.channel.messages.order_by('-date_created')[: self.history_size][::-1])
+        burst = []
+        for message in reversed(recent):
+            if (message.author or "").lower() == "bot":
+                break
+            burst.append(message)
+        return burst[::-1]
+
+    def _check_superseded(self):
+        if self.is_superseded and self.is_superseded():
+            raise Superseded(f"newer message in channel {self.channel.external_id}")
+
+    @traced("normalize")
     def normalize_user_text(self, text: str) -> str:
         """
         STEP 2b: Use LLM to correct typos, accents, and normalize the user input.
+        With local_normalization, the lexicon-based corrector answers first.
         """
+        if self.local_normalization:
+            result = get_local_normalizer().normalize(text)
+            print(f"Local normalization (confidence {result.confidence:.2f}): {result.corrections}")
+            if result.confidence >= self.local_normalization_threshold:
+                return result.text
         prompt = [
             {
                 "role": "system",
@@ -112,13 +374,14 @@ class LLMPipeline:
             },
             {"role": "user", "content": text}
         ]
-        resp = self.client.chat.completions.create(
+        resp = self._chat(
             model=self.classification_model,
             messages=prompt,
             temperature=self.classification_model_temperature
         )
         return resp.choices[0].message.content.strip()
 
+    @traced("classify_vehicle_intent", "classification_model")
     def should_fetch_more_vehicle_info(
         self,
         transcript: str,
@@ -143,7 +406,7 @@ class LLMPipeline:
                 )
             }
         ]
-        resp = self.client.chat.completions.create(
+        resp = self._chat(
             model=self.classification_model,
             messages=prompt,
             temperature=self.classification_model_temperature
@@ -151,47 +414,74 @@ class LLMPipeline:
         should_fetch = True if resp.choices[0].message.content.strip().lower() == "true" else False
         return should_fetch
 
-    def retrieve_filtered_vehicles(self, user_msg: str) -> str:
-        """
-        STEP 4: Dump catalog to CSV and ask LLM to filter vehicles per user query.
-        Returns the filtered CSV (or an empty string if no matches).
-        """
-        # Load full catalog into CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        writer.writerow([
-            'stock_id','km','price','make','model','year',
-            'version','bluetooth','largo','ancho','altura','car_play'
-        ])
-        for v in Vehicle.objects.all():
-            writer.writerow([
-                v.stock_id, v.km, v.price, v.make, v.model, v.year,
-                v.version, 'true' if v.bluetooth else 'false',
-                v.largo, v.ancho, v.altura,
-                'true' if v.car_play else 'false'
-            ])
-        vehicles_csv = output.getvalue()
-
-        # Spanish prompt to filter
+    @traced("extract_filters", "classification_model")
+    def extract_vehicle_filters(self, user_msg: str, transcript: str = "") -> VehicleFilter:
+        """
+        STEP 4a: Ask LLM to turn the user query into a typed VehicleFilter spec.
+        """
+        schema = json.dumps(VehicleFilter.json_schema()["properties"], ensure_ascii=False)
         system = (
-            "Eres un agente de ventas de autos de Kavak. Se te proporciona un CSV con datos de vehículos. "
-            "Filtra los vehículos según la siguiente consulta del usuario y devuelve un CSV "
-            "con los que cumplan. No inventes nada. Si no hay coincidencias, devuelve un CSV con solo el encabezado.\n\n"
-            f"Consulta:\n{user_msg}\n\n"
-            f"CSV de vehículos:\n{vehicles_csv}\n\n"
-            "Formato de salida:\n"
-            "stock_id,km,price,make,model,year,version,bluetooth,largo,ancho,altura,car_play\n"
+            "Eres un agente de ventas de autos de Kavak. Extrae de la consulta del usuario los criterios "
+            "de búsqueda de vehículos y devuélvelos como un objeto JSON con estas llaves:\n"
+            f"{schema}\n\n"
+            "Usa null para cualquier criterio que el usuario no haya mencionado. No inventes criterios. "
+            "Los precios son en pesos mexicanos, el kilometraje en km y las dimensiones en metros. "
+            "Para 'sort' usa price_asc (más barato), price_desc, year_desc (más nuevo) o km_asc (menos km); "
+            "por defecto price_asc.\n\n"
+            f"Conversación previa:\n{transcript}\n\n"
+            f"Consulta:\n{user_msg}\n"
         )
-        resp = self.client.chat.completions.create(
-            model=self.model,
-            messages=[{"role":"system","content":system}],
-            temperature=0
+        resp = self._chat(
+            model=self.classification_model,
+            messages=[{"role": "system", "content": system}],
+            temperature=0,
+            response_format={"type": "json_object"}
         )
-        return resp.choices[0].message.content.strip()
+        try:
+            data = json.loads(resp.choices[0].message.content)
+        except (TypeError, ValueError):
+            data = {}
+        return VehicleFilter.from_dict(data)
 
+    def retrieve_filtered_vehicles(self, user_msg: str, transcript: str = "") -> str:
+        """
+        STEP 4b: Extract a filter spec from the user query, run it against the
+        in-memory catalog snapshot and return the top matches as CSV
+        (header only if no matches).
+        """
+        return self.search_vehicles_csv(self.extract_vehicle_filters(user_msg, transcript), user_msg)
+
+    @traced("vehicle_search")
+    def search_vehicles_csv(self, spec: VehicleFilter, query: str = "") -> str:
+        """
+        Run a filter spec against the catalog snapshot and render the top-N as CSV.
+        Vague queries (empty spec) fall back to semantic ranking when enabled.
+        Without a snapshot (e.g. its directory can't be written) the same
+        search runs as an indexed database query.
+        """
+        print(f"Vehicle filter spec: {spec.to_dict()}")
+        try:
+            snapshot = get_catalog_snapshot()
+        except Exception as e:
+            print(f"Catalog snapshot unavailable, searching the database: {e}")
+            snapshot = None
+        if spec.is_empty() and self.semantic_vehicle_search and query:
+            stock_ids = semantic_vehicle_stock_ids(query, k=self.vehicle_results_limit)
+            if snapshot is not None:
+                vehicles = snapshot.vehicles(snapshot.indices_for(stock_ids))
+            else:
+                by_stock_id = Vehicle.objects.in_bulk(stock_ids, field_name='stock_id')
+                vehicles = [by_stock_id[s] for s in stock_ids if s in by_stock_id]
+        elif snapshot is not None:
+            vehicles = snapshot.search(spec, limit=self.vehicle_results_limit)
+        else:
+            vehicles = search_vehicles(spec, limit=self.vehicle_results_limit)
+        return vehicles_to_csv(vehicles)
+
+    @traced("kb_route", "classification_model")
     def get_relevant_kb_article_ids(self, transcript: str, last_user_message: str) -> List[str]:
         """
-        STEP 4a: Ask LLM if user requested company policy or FAQs.
+        STEP 4c: Ask LLM if user requested company policy or FAQs.
 
         """
         # 1) Fetch active articles
@@ -216,7 +506,7 @@ class LLMPipeline:
         prompt = [{"role": "system", "content": system_content}]
         print(f"Prompt for KB IDs:\n{system_content}")
         # 4) Call the LLM
-        resp = self.client.chat.completions.create(
+        resp = self._chat(
             model=self.classification_model,
             messages=prompt,
             temperature=0
@@ -234,9 +524,73 @@ class LLMPipeline:
             # fallback: no valid JSON, return empty list
             return []
 
+    @traced("route", "router_model")
+    def route_message(self, transcript: str, user_text: str) -> dict:
+        """
+        STEP 2-4c (router mode): a single structured-output call that returns
+        the normalized text, whether to search vehicles (with the extracted
+        filters) and the relevant KB article IDs.
+        """
+        if self.kb_retrieval == "llm":
+            kbs = list(KnowledgeArticle.objects.filter(active=True).order_by('date_created').values_list('id', 'name'))
+        else:
+            # local KB modes retrieve passages themselves; the router only sees an empty list
+            kbs = []
+        valid_ids = [str(kb_id) for kb_id, _ in kbs]
+        id_block = "\n".join(f"{kb_id}: {name}" for kb_id, name in kbs)
+        id_items = {"type": "string", "enum": valid_ids} if valid_ids else {"type": "string"}
+        schema = {
+            "type": "object",
+            "properties": {
+                "normalized_text": {"type": "string"},
+                "needs_vehicle_search": {"type": "boolean"},
+                "vehicle_filters": VehicleFilter.json_schema(),
+                "kb_article_ids": {"type": "array", "items": id_items},
+            },
+            "required": ["normalized_text", "needs_vehicle_search", "vehicle_filters", "kb_article_ids"],
+            "additionalProperties": False,
+        }
+        system = (
+            "Eres un agente de ventas de autos de Kavak. Analiza el último mensaje del usuario y la conversación previa.\n"
+            "1. normalized_text: corrige typos y acentos del último mensaje, en español, sin añadir información. "
+            "Ejemplo: 'nesesito un nissan versa 2022 en guadaljara' -> 'Necesito un Nissan Versa 2022 en Guadalajara'.\n"
+            "2. needs_vehicle_search: true solo si el usuario pide información nueva de vehículos, marcas, modelos, "
+            "kilometraje o rango de precios que no se le haya proporcionado ya.\n"
+            "3. vehicle_filters: criterios de búsqueda mencionados (null si no se mencionan; precios en pesos, "
+            "dimensiones en metros; sort: price_asc, price_desc, year_desc o km_asc).\n"
+            "4. kb_article_ids: IDs de los artículos de conocimiento relevantes (o [] si ninguno aplica). "
+            "Artículos en formato `id: título`:\n"
+            f"{id_block}\n\n"
+            f"Conversación previa:\n{transcript}\n"
+        )
+        resp = self._chat(
+            model=self.router_model,
+            messages=[{"role": "system", "content": system}, {"role": "user", "content": user_text}],
+            temperature=0,
+            response_format={
+                "type": "json_schema",
+                "json_schema": {"name": "message_route", "strict": True, "schema": schema},
+            },
+        )
+        try:
+            data = json.loads(resp.choices[0].message.content)
+        except (TypeError, ValueError):
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        normalized = data.get("normalized_text")
+        known_ids = set(valid_ids)
+        return {
+            "normalized_text": normalized.strip() if isinstance(normalized, str) and normalized.strip() else user_text,
+            "needs_vehicle_search": data.get("needs_vehicle_search") is True,
+            "vehicle_filters": VehicleFilter.from_dict(data.get("vehicle_filters")),
+            "kb_article_ids": [i for i in data.get("kb_article_ids") or [] if isinstance(i, str) and i in known_ids],
+        }
+
+    @traced("kb_load")
     def load_additional_data(self, kb_ids: list) -> str:
         """
-        STEP 4b: Load KBs for relevant policy/FAQ snippets.
+        STEP 4d: Load KBs for relevant policy/FAQ snippets.
         """
         # fetch only active articles in the given order
         articles = list(KnowledgeArticle.objects.filter(id__in=kb_ids, active=True))
@@ -245,19 +599,46 @@ class LLMPipeline:
         snippets = [f"{a.name}\n{a.text}" for a in articles]
 
         # join with a blank line
-        return "\n".join(snippets)
+        return "\n\n".join(snippets)
+
+    @traced("kb_retrieve")
+    def retrieve_kb_passages(self, transcript: str, last_user_message: str) -> str:
+        """
+        STEP 4c-4d (bm25/embedding mode): Score KB passages locally against the
+        user message and return the top-k as "Title\nPassage" snippets.
+        """
+        if self.kb_retrieval == "embedding":
+            passages = semantic_kb_passages(last_user_message, k=self.kb_top_k)
+        else:
+            passages = get_kb_index().search(last_user_message, k=self.kb_top_k, min_score=self.kb_min_score)
+        print(f"KB passages: {[(p.article_name, round(p.score, 2)) for p in passages]}")
+        return "\n\n".join(f"{p.article_name}\n{p.text}" for p in passages)
+
+    def get_extra_context(self, transcript: str, last_user_message: str) -> str:
+        """
+        STEP 4c-4d: Resolve the "Información adicional" section with the
+        configured KB retrieval mode.
+        """
+        if self.kb_retrieval != "llm":
+            return self.retrieve_kb_passages(transcript, last_user_message)
+        kb_ids = self.get_relevant_kb_article_ids(transcript, last_user_message)
+        print(f"Fetch KBs: {kb_ids}")
+        return self.load_additional_data(kb_ids) if kb_ids else ""
 
     def build_prompt(
         self,
         transcript: str,
         last_user_message: str,
         vehicle_section: str,
-        extra_section: str
+        extra_section: str,
+        summary_section: str = ""
     ) -> List[dict]:
         """
         STEP 5: Build the final LLM prompt in Spanish, including transcript,
         last user message, filtered vehicles, and extra context.
+        The rolling summary of older turns is added when available.
         """
+        summary_block = f"Resumen de la conversación anterior:\n{summary_section}\n\n" if summary_section else ""
         system = (
             "Eres un agente de ventas de autos de Kavak. Responde solo usando la información proporcionada. "
             "La seccion de Conversación previa contiene la conversación previa entre el usuario y el bot. "
@@ -278,6 +659,7 @@ class LLMPipeline:
             "El formato de salida es un mensaje de WhatsApp en español, "
             "sin etiquetas HTML ni encabezados, y sin emojis ni abreviaciones. No agregues markdown que no este especificado.\n\n"
             f"Último mensaje del usuario:\n{last_user_message}\n\n"
+            f"{summary_block}"
             f"Conversación previa:\n{transcript}\n\n"
             f"Vehículos filtrados (CSV):\n{vehicle_section}\n\n"
             f"Información adicional:\n{extra_section}\n"
@@ -286,28 +668,66 @@ class LLMPipeline:
             {"role": "system", "content": system},
             {"role": "user", "content": last_user_message}
         ]
+    @traced("final_call", "model")
     def call_llm(self, prompt: List[dict]) -> str:
         """
         STEP 6: Call OpenAI ChatCompletion and return text.
         """
-        resp = self.client.chat.completions.create(
+        resp = self._chat(
             model=self.model,
             messages=prompt,
             temperature=self.temperature
         )
         return resp.choices[0].message.content.strip()
 
-    def process_response(self, reply: str) -> Message:
+    @traced("final_call", "model")
+    def call_llm_stream(self, prompt: List[dict], on_chunk: Callable[[str], None]) -> str:
         """
-        STEP 7: Persist the assistant's reply.
+        STEP 6 (streaming): Consume the completion as a stream and deliver each
+        paragraph/sentence-bounded chunk as soon as it is complete.
+        Returns the full text.
         """
-        return Message.objects.create(
-            channel=self.channel,
-            text=reply,
-            author='bot'
+        stream = self._chat(
+            model=self.model,
+            messages=prompt,
+            temperature=self.temperature,
+            stream=True,
+            stream_options={"include_usage": True}
         )
+        chunker = WhatsAppChunker()
+        parts = []
+        for event in stream:
+            if not event.choices:
+                # the final event carries only the usage totals
+                self._record_usage(getattr(event, "usage", None), self.model)
+                continue
+            delta = event.choices[0].delta.content or ""
+            parts.append(delta)
+            for chunk in chunker.feed(delta):
+                on_chunk(chunk)
+        for chunk in chunker.flush():
+            on_chunk(chunk)
+        return "".join(parts).strip()
 
-    def process(self) -> Message:
+    @traced("persist")
+    def process_response(self, reply: str, deliver: bool = True) -> Message:
+        """
+        STEP 7: Persist the assistant's reply (and, with the outbox, queue
+        it for sending in the same transaction unless `deliver` is False).
+        """
+        with transaction.atomic():
+            message = Message.objects.create(
+                channel=self.channel,
+                text=reply,
+                author='bot'
+            )
+            if self.outbox and deliver:
+                outbox.enqueue(self.channel, reply, message=message)
+        if self.store:
+            self.store.append(self.channel, message)
+        return message
+
+    def process(self, on_chunk: Optional[Callable[[str], None]] = None) -> Message:
         """
         Orchestrate the full pipeline:
           1. Fetch recent history (with timeout)
@@ -315,21 +735,27 @@ class LLMPipeline:
           2. Fetch last user message from DB
           2b. Normalize user text
           3. Decide if we should fetch vehicle info
-          4. Fetch filtered vehicles (if needed)
-          4a. Decide if we should fetch extra data
-          4b. Fetch extra data (if needed)
+          4a. Extract a vehicle filter spec (if needed)
+          4b. Query the catalog with the spec and keep the top-N matches
+          4c. Decide if we should fetch extra data
+          4d. Fetch extra data (if needed)
           5. Build final prompt
           6. Call LLM
           7. Save and return the reply
+
+        With stream_reply, `on_chunk` receives the reply chunk by chunk
+        while step 6 is still generating.
         """
+        if self.router_mode:
+            return self.process_routed(on_chunk)
+        if self.concurrent_stages:
+            return self.process_concurrent(on_chunk)
+
         # 1 & 1b
         history = self.get_active_history()
         last_user = self.get_last_user_message()
         user_text = last_user.text
         transcript = self.build_transcript(history, exclude_msg=last_user)
-        # print(f"Last user message: {user_text}")
-        # print(f"Transcript:\n{transcript}")
-
 
         # 2 & 2b
         normalized = self.normalize_user_text(user_text)
@@ -341,24 +767,253 @@ class LLMPipeline:
         should_fetch_vehicle_info = self.should_fetch_more_vehicle_info(transcript, normalized)
         print(f"Should fetch vehicle info: {should_fetch_vehicle_info}")
         if should_fetch_vehicle_info:
-            vehicles_csv = self.retrieve_filtered_vehicles(normalized)
+            vehicles_csv = self.retrieve_filtered_vehicles(normalized, transcript)
             print(f"Filtered vehicles CSV:\n{vehicles_csv}")
 
-        # 4a & 4b
-        extra = ""
-        kb_ids = self.get_relevant_kb_article_ids(transcript, normalized)
-        print(f"Fetch KBs: {kb_ids}")
-        if kb_ids and isinstance(kb_ids, list) and len(kb_ids) > 0:
-            extra = self.load_additional_data(kb_ids)
-            print(f"Extra data:\n{extra}")
+        # 4c & 4d
+        extra = self.get_extra_context(transcript, normalized)
+        print(f"Extra data:\n{extra}")
+
+        return self.generate_reply(transcript, normalized, vehicles_csv, extra, on_chunk)
+
+    def process_concurrent(self, on_chunk: Optional[Callable[[str], None]] = None) -> Message:
+        """
+        Same steps as `process`, expressed as a dependency graph so that
+        independent stages overlap:
+
+          history ─┐
+                   ├─ transcript ─┬─ should_fetch ─┐
+          last_user┤              │                ├─ vehicles ─┐
+                   └─ normalized ─┤ (filters*) ────┘            ├─ 5-7
+                                  └─ kb_ids ─ extra ────────────┘
+
+        (*) only when speculative_vehicle_search is enabled. In local KB modes
+        `extra` is computed locally and has no kb_ids stage.
+        """
+        graph = StageGraph(max_workers=4)
+        graph.add("history", self.get_active_history)
+        graph.add("last_user", self.get_last_user_message)
+        graph.add(
+            "transcript",
+            lambda history, last_user: self.build_transcript(history, exclude_msg=last_user),
+            deps=["history", "last_user"],
+        )
+        graph.add("normalized", lambda last_user: self.normalize_user_text(last_user.text), deps=["last_user"])
+        graph.add(
+            "should_fetch",
+            lambda transcript, normalized: self.should_fetch_more_vehicle_info(transcript, normalized),
+            deps=["transcript", "normalized"],
+        )
+        if self.speculative_vehicle_search:
+            graph.add(
+                "filters",
+                lambda normalized, transcript: self.retrieve_filtered_vehicles(normalized, transcript),
+                deps=["normalized", "transcript"],
+            )
+            graph.add(
+                "vehicles",
+                lambda should_fetch, filters: filters if should_fetch else "",
+                deps=["should_fetch", "filters"],
+            )
+        else:
+            graph.add(
+                "vehicles",
+                lambda should_fetch, normalized, transcript: (
+                    self.retrieve_filtered_vehicles(normalized, transcript) if should_fetch else ""
+                ),
+                deps=["should_fetch", "normalized", "transcript"],
+            )
+        if self.kb_retrieval != "llm":
+            graph.add(
+                "extra",
+                lambda transcript, normalized: self.retrieve_kb_passages(transcript, normalized),
+                deps=["transcript", "normalized"],
+            )
+        else:
+            graph.add(
+                "kb_ids",
+                lambda transcript, normalized: self.get_relevant_kb_article_ids(transcript, normalized),
+                deps=["transcript", "normalized"],
+            )
+            graph.add("extra", lambda kb_ids: self.load_additional_data(kb_ids) if kb_ids else "", deps=["kb_ids"])
+
+        results = graph.run()
+        print(f"Normalized user text: {results['normalized']}")
+        print(f"Should fetch vehicle info: {results['should_fetch']}")
+        print(f"Fetch KBs: {results.get('kb_ids')}")
+        return self.generate_reply(
+            results["transcript"], results["normalized"], results["vehicles"], results["extra"], on_chunk
+        )
 
+    def process_routed(self, on_chunk: Optional[Callable[[str], None]] = None) -> Message:
+        """
+        Router mode: history/transcript, one structured routing call, then the
+        catalog search and KB load (in parallel when concurrent_stages is set).
+        """
+        history = self.get_active_history()
+        last_user = self.get_last_user_message()
+        transcript = self.build_transcript(history, exclude_msg=last_user)
+
+        route = self.route_message(transcript, last_user.text)
+        normalized = route["normalized_text"]
+        print(f"Route: {route}")
+
+        def vehicles():
+            if not route["needs_vehicle_search"]:
+                return ""
+            return self.search_vehicles_csv(route["vehicle_filters"], normalized)
+
+        def extra():
+            if self.kb_retrieval != "llm":
+                return self.retrieve_kb_passages(transcript, normalized)
+            return self.load_additional_data(route["kb_article_ids"]) if route["kb_article_ids"] else ""
+
+        if self.concurrent_stages:
+            results = StageGraph(max_workers=2).add("vehicles", vehicles).add("extra", extra).run()
+            vehicles_csv, extra_text = results["vehicles"], results["extra"]
+        else:
+            vehicles_csv, extra_text = vehicles(), extra()
+        return self.generate_reply(transcript, normalized, vehicles_csv, extra_text, on_chunk)
+
+    def generate_reply(
+        self,
+        transcript: str,
+        normalized: str,
+        vehicles_csv: str,
+        extra: str,
+        on_chunk: Optional[Callable[[str], None]] = None
+    ) -> Message:
+        """
+        STEPS 5-7: Build the final prompt, call the LLM and persist the reply.
+        """
         # 5
-        prompt = self.build_prompt(transcript, normalized, vehicles_csv, extra)
+        with self.tracer.span("prompt_build"):
+            budget = PromptBudget(self.model, self.token_budgets)
+            prompt = self.build_prompt(
+                budget.fit_transcript(transcript),
+                budget.fit_last_user_message(normalized),
+                budget.fit_vehicles(vehicles_csv),
+                budget.fit_extra(extra),
+                budget.fit_summary(self.channel.summary),
+            )
+            self.token_usage = budget.report(prompt)
         print(f"Final prompt:\n{prompt}")
+        print(f"Prompt token usage: {self.token_usage}")
 
         # 6
-        reply = self.call_llm(prompt)
+        self._check_superseded()
+        if self.stream_reply and on_chunk:
+            reply = self.call_llm_stream(prompt, on_chunk)
+        else:
+            reply = self.call_llm(prompt)
         print(f"LLM reply:\n{reply}")
-        
-        # 7
-        return self.process_response(reply)
+
+        # 7 (a streamed reply was already delivered and is always kept)
+        streamed = bool(self.stream_reply and on_chunk)
+        if not streamed:
+            self._check_superseded()
+        return self.process_response(reply, deliver=not streamed)
+
+    def save_trace(self, message: Optional[Message] = None, error: str = "") -> PipelineRun:
+        """
+        Persist the spans collected so far as a PipelineRun.
+        """
+        return PipelineRun.objects.create(
+            channel=self.channel,
+            message=message,
+            mode=self.mode,
+            total_ms=round(self.tracer.total_ms, 2),
+            spans=self.tracer.to_list(),
+            error=error,
+        )
+
+
+class ConversationSummarizer:
+    """
+    Folds the turns that fell out of a channel's history window into
+    Channel.summary, one incremental LLM call at a time. A fold takes at
+    most `fold_messages` messages and `fold_tokens` tokens, so a long
+    backlog is folded over several calls.
+    """
+
+    def __init__(
+        self,
+        model_name: str = "gpt-3.5-turbo",
+        history_size: int = 10,
+        max_words: int = 150,
+        fold_messages: int = 50,
+        fold_tokens: int = 3000,
+    ):
+        self.model = model_name
+        self.history_size = history_size
+        self.max_words = max_words
+        self.fold_messages = fold_messages
+        self.fold_tokens = fold_tokens
+        self.client = get_openai_client()
+
+    def pending_messages(self, channel: Channel) -> List[Message]:
+        """
+        The oldest messages outside the active window that are not
+        summarized yet, within one fold's message and token cap.
+        """
+        window = list(channel.messages.order_by('-date_created').values_list('date_created', flat=True)[: self.history_size])
+        if len(window) < self.history_size:
+            return []
+        qs = channel.messages.filter(date_created__lt=window[-1])
+        if channel.summary_until:
+            qs = qs.filter(date_created__gt=channel.summary_until)
+        messages, used = [], 0
+        for message in qs.order_by('date_created')[: self.fold_messages]:
+            cost = count_tokens(message.text, self.model)
+            if messages and used + cost > self.fold_tokens:
+                break
+            if cost > self.fold_tokens:
+                # a single oversized message still gets folded, cut down
+                message.text = truncate_tokens(message.text, self.fold_tokens, self.model)
+            messages.append(message)
+            used += cost
+        return messages
+
+    def summarize(self, summary: str, messages: List[Message]) -> str:
+        transcript = format_transcript(messages)
+        system = (
+            "Eres un agente de ventas de autos de Kavak. Mantienes un resumen breve de una conversación de WhatsApp. "
+            "Actualiza el resumen actual con los nuevos mensajes. Conserva los datos útiles para la venta: nombre del cliente, "
+            "vehículos de interés, presupuesto, enganche, plazos, ciudad, dudas pendientes y lo que ya se le ofreció. "
+            f"Devuelve solo el resumen actualizado, en español, en máximo {self.max_words} palabras.\n\n"
+            f"Resumen actual:\n{summary or '(vacío)'}\n\n"
+            f"Nuevos mensajes:\n{transcript}\n"
+        )
+        resp = call_openai(
+            self.client.chat.completions.create,
+            priority=BACKGROUND,
+            model=self.model,
+            messages=[{"role": "system", "content": system}],
+            temperature=0
+        )
+        record_openai_usage(self.model, resp.usage)
+        return resp.choices[0].message.content.strip()
+
+    def update(self, channel: Channel, max_folds: int = 5) -> bool:
+        """
+        Fold pending turns into the summary, one capped fold at a time (at
+        most `max_folds`; the rest waits for the next update). Each fold
+        advances summary_until with a compare-and-set, so concurrent runs
+        for the same channel don't double-fold.
+        """
+        folded = False
+        for _ in range(max_folds):
+            messages = self.pending_messages(channel)
+            if not messages:
+                break
+            summary = self.summarize(channel.summary, messages)
+            updated = Channel.objects.filter(id=channel.id, summary_until=channel.summary_until).update(
+                summary=summary,
+                summary_until=messages[-1].date_created,
+                date_updated=timezone.now(),
+            )
+            if not updated:
+                break
+            channel.summary, channel.summary_until = summary, messages[-1].date_created
+            folded = True
+        return folded
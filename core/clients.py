@@ -0,0 +1,104 @@
+"""
+Per-process registry of long-lived API clients.
+
+Every client owns a keep-alive connection pool, so steady-state calls reuse
+warm TLS connections instead of paying a handshake per message. Clients are
+created lazily and dropped in forked children (Celery prefork), because
+sockets inherited across fork must never be shared between processes.
+"""
+import asyncio
+import os
+import threading
+import weakref
+import httpx
+import redis
+import redis.asyncio
+import requests
+from django.conf import settings
+from openai import OpenAI
+from requests.adapters import HTTPAdapter
+from twilio.http.http_client import TwilioHttpClient
+from twilio.rest import Client as TwilioClient
+from agent_chatbot.settings import OpenAIConfig, TwilioConfig
+
+_clients = {}
+_lock = threading.Lock()
+_pid = os.getpid()
+
+
+def reset_clients():
+    """Forget every client (called in forked children and on worker init)."""
+    global _lock, _pid
+    _clients.clear()
+    _lock = threading.Lock()
+    _pid = os.getpid()
+
+
+os.register_at_fork(after_in_child=reset_clients)
+
+
+def _get(name: str, factory):
+    if _pid != os.getpid():
+        reset_clients()
+    client = _clients.get(name)
+    if client is None:
+        with _lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = factory()
+    return client
+
+
+def _mounted_session(session: requests.Session, pool_size: int) -> requests.Session:
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_openai_client() -> OpenAI:
+    """Shared OpenAI client backed by a pooled keep-alive httpx.Client."""
+    def factory():
+        http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=OpenAIConfig.MAX_CONNECTIONS,
+                max_keepalive_connections=OpenAIConfig.MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=OpenAIConfig.KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(OpenAIConfig.TIMEOUT, connect=5.0),
+        )
+        # retries are coordinated across processes by core.ratelimit.call_openai
+        return OpenAI(api_key=OpenAIConfig.API_KEY, http_client=http_client, max_retries=0)
+    return _get('openai', factory)
+
+
+def get_twilio_client() -> TwilioClient:
+    """Shared Twilio client whose requests.Session keeps connections alive."""
+    def factory():
+        http_client = TwilioHttpClient(pool_connections=True, timeout=TwilioConfig.TIMEOUT)
+        _mounted_session(http_client.session, TwilioConfig.POOL_SIZE)
+        return TwilioClient(TwilioConfig.ACCOUNT_SID, TwilioConfig.AUTH_TOKEN, http_client=http_client)
+    return _get('twilio', factory)
+
+
+def get_http_session() -> requests.Session:
+    """Shared requests.Session for plain HTTP fetches (e.g. knowledge articles)."""
+    return _get('http', lambda: _mounted_session(requests.Session(), 10))
+
+
+def get_redis() -> redis.Redis:
+    """Shared Redis client (REDIS_URL) for counters, locks and queues."""
+    return _get('redis', lambda: redis.Redis.from_url(settings.REDIS_URL, health_check_interval=30))
+
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+    Redis client for async views. asyncio connections belong to the event
+    loop that opened them, so there is one client per running loop.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _get('redis_async', weakref.WeakKeyDictionary)
+    client = clients.get(loop)
+    if client is None:
+        client = clients[loop] = redis.asyncio.Redis.from_url(settings.REDIS_URL, health_check_interval=30)
+    return client
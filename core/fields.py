@@ -0,0 +1,63 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+from django.db import models
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7(timestamp_ms: Optional[int] = None) -> uuid.UUID:
+    """
+    Time-ordered UUID (RFC 9562 version 7): 48-bit Unix milliseconds, a
+    12-bit counter that keeps ids generated in the same millisecond by this
+    process increasing, then 62 random bits.
+
+    `timestamp_ms` pins the time part (used to rekey existing rows by their
+    creation date).
+    """
+    global _last_ms, _counter
+    if timestamp_ms is None:
+        with _lock:
+            now = time.time_ns() // 1_000_000
+            if now > _last_ms:
+                _last_ms, _counter = now, int.from_bytes(os.urandom(2), 'big') & 0x3FF
+            else:
+                # same (or a backwards) millisecond: bump the counter, borrowing a ms on overflow
+                _counter += 1
+                if _counter > 0xFFF:
+                    _last_ms, _counter = _last_ms + 1, 0
+            timestamp_ms, counter = _last_ms, _counter
+    else:
+        counter = int.from_bytes(os.urandom(2), 'big') & 0xFFF
+    rand = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    value = (
+        (timestamp_ms & ((1 << 48) - 1)) << 80
+        | 0x7 << 76
+        | counter << 64
+        | 0b10 << 62
+        | rand
+    )
+    return uuid.UUID(int=value)
+
+
+def uuid7_time(value: uuid.UUID) -> Optional[float]:
+    """Creation time (Unix seconds) embedded in a UUIDv7, None for other versions."""
+    if value.version != 7:
+        return None
+    return (value.int >> 80) / 1000
+
+
+class UUIDv7Field(models.UUIDField):
+    """
+    UUIDField whose default is a time-ordered UUIDv7, so new primary keys
+    append to the right edge of the B-tree instead of landing on random pages.
+    Same column type as UUIDField; switching a field is a state-only migration.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault('default', uuid7)
+        super().__init__(*args, **kwargs)
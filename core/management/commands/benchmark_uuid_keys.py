@@ -0,0 +1,69 @@
+import time
+import uuid
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+from core.fields import uuid7
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare insert throughput and primary-key index size of uuid4 vs UUIDv7 keys "
+        "on a message-shaped scratch table (index size on PostgreSQL only)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000)
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--channels', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        channels = [uuid.uuid4() for _ in range(options['channels'])]
+        results = {}
+        for name, factory in (('uuid4', uuid.uuid4), ('uuid7', uuid7)):
+            results[name] = self.run(name, factory, channels, options['rows'], options['batch_size'])
+            r = results[name]
+            size = f", pk index {r['index_bytes'] / 1024 / 1024:.1f} MiB" if r['index_bytes'] is not None else ""
+            self.stdout.write(f"{name}: {r['rows_per_s']:,.0f} rows/s ({r['seconds']:.2f}s){size}")
+
+        base, v7 = results['uuid4'], results['uuid7']
+        self.stdout.write(self.style.SUCCESS(
+            f"uuid7 vs uuid4: {v7['rows_per_s'] / base['rows_per_s']:.2f}x insert throughput"
+            + (f", {v7['index_bytes'] / base['index_bytes']:.2f}x index size" if base['index_bytes'] else "")
+        ))
+
+    def run(self, name, factory, channels, rows, batch_size):
+        table = connection.ops.quote_name(f'bench_keys_{name}')
+        uuid_type = 'uuid' if connection.vendor == 'postgresql' else 'char(32)'
+        prep = str if connection.vendor == 'postgresql' else (lambda u: u.hex)
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            cursor.execute(
+                f"CREATE TABLE {table} (id {uuid_type} PRIMARY KEY, channel_id {uuid_type} NOT NULL, "
+                f"date_created timestamp NOT NULL, text text NOT NULL)"
+            )
+        try:
+            start = time.perf_counter()
+            for offset in range(0, rows, batch_size):
+                now = timezone.now().replace(tzinfo=None)
+                batch = [
+                    (prep(factory()), prep(channels[(offset + i) % len(channels)]), now, "Hola, busco un auto familiar")
+                    for i in range(min(batch_size, rows - offset))
+                ]
+                with transaction.atomic(), connection.cursor() as cursor:
+                    cursor.executemany(
+                        f"INSERT INTO {table} (id, channel_id, date_created, text) VALUES (%s, %s, %s, %s)", batch
+                    )
+            seconds = time.perf_counter() - start
+            index_bytes = None
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "SELECT pg_relation_size(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND indisprimary",
+                        [f'bench_keys_{name}'],
+                    )
+                    index_bytes = cursor.fetchone()[0]
+            return {'seconds': seconds, 'rows_per_s': rows / seconds, 'index_bytes': index_bytes}
+        finally:
+            with connection.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
@@ -0,0 +1,92 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from catalog.kb_index import bump_kb_version
+from catalog.snapshot import bump_catalog_version
+from chat.store import get_conversation_store
+from core.fields import uuid7
+
+DEFAULT_MODELS = [
+    'chat.Channel', 'chat.Message', 'chat.PipelineRun', 'chat.ChannelArchive',
+    'catalog.KnowledgeArticle', 'catalog.KnowledgeChunk', 'catalog.Vehicle',
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Rewrite existing random (v4) primary keys as time-ordered UUIDv7, derived from "
+        "date_created when the model has it, updating every foreign key that points at them. "
+        "Archived messages (chat.archive) are no longer rows and keep their old ids in the "
+        "archive files, which also stay in their directory named after the channel's old id."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('models', nargs='*', default=DEFAULT_MODELS, help="app_label.Model to rekey.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        for label in options['models']:
+            try:
+                model = apps.get_model(label)
+            except LookupError as e:
+                raise CommandError(str(e))
+            count = self.rekey(model, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f"{label}: rekeyed {count} rows"))
+
+        # in-process caches and the conversation buffer hold the old ids
+        bump_catalog_version()
+        bump_kb_version()
+        store = get_conversation_store()
+        if store:
+            store.clear()
+
+    def rekey(self, model, batch_size: int) -> int:
+        pk = model._meta.pk
+        has_created = any(f.name == 'date_created' for f in model._meta.concrete_fields)
+        # every FK column (with or without a DB constraint) that references this table
+        references = [
+            (rel.related_model._meta.db_table, rel.field.column)
+            for rel in model._meta.related_objects
+            if rel.field.concrete and rel.field.target_field == pk
+        ]
+        table, column = model._meta.db_table, pk.column
+        qn = connection.ops.quote_name
+        total, last = 0, None
+
+        while True:
+            qs = model.objects.order_by('pk')
+            if last is not None:
+                qs = qs.filter(pk__gt=last)
+            rows = list(qs.values_list('pk', 'date_created' if has_created else 'pk')[:batch_size])
+            if not rows:
+                return total
+            last = rows[-1][0]
+            mapping = [
+                (old, uuid7(int(created.timestamp() * 1000)) if has_created else uuid7())
+                for old, created in rows
+                if old.version != 7
+            ]
+            if not mapping:
+                continue
+
+            params = [
+                (pk.get_db_prep_value(old, connection), pk.get_db_prep_value(new, connection))
+                for old, new in mapping
+            ]
+            with transaction.atomic(), connection.cursor() as cursor:
+                # FKs are DEFERRABLE INITIALLY DEFERRED, so parents and children
+                # only have to agree again at commit
+                cursor.execute(
+                    f"CREATE TEMPORARY TABLE IF NOT EXISTS rekey_map "
+                    f"(old_id {pk.db_type(connection)} PRIMARY KEY, new_id {pk.db_type(connection)})"
+                )
+                cursor.execute("DELETE FROM rekey_map")
+                cursor.executemany("INSERT INTO rekey_map (old_id, new_id) VALUES (%s, %s)", params)
+                for ref_table, ref_column in references + [(table, column)]:
+                    cursor.execute(
+                        f"UPDATE {qn(ref_table)} SET {qn(ref_column)} = "
+                        f"(SELECT new_id FROM rekey_map WHERE old_id = {qn(ref_table)}.{qn(ref_column)}) "
+                        f"WHERE {qn(ref_column)} IN (SELECT old_id FROM rekey_map)"
+                    )
+            total += len(mapping)
+            self.stdout.write(f"  {model._meta.label}: {total} rows")
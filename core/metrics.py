@@ -0,0 +1,248 @@
+"""
+Prometheus metrics shared by the web (gunicorn) and Celery worker processes.
+
+With PROMETHEUS_MULTIPROC_DIR set, every process writes its samples to
+mmap'ed files in that directory and the scrape endpoint aggregates them, so
+counters and histograms are exact across gunicorn workers and prefork
+children. Files are named after host and pid, which lets the web and worker
+containers share one volume without pid collisions.
+"""
+import functools
+import inspect
+import os
+import socket
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+    values,
+)
+from prometheus_client.core import GaugeMetricFamily
+from agent_chatbot.settings import MetricsConfig
+from core.clients import get_redis
+
+_host = socket.gethostname().replace('_', '-')
+
+
+def _process_id(pid: int) -> str:
+    return f'{_host}-{pid}'
+
+
+if MetricsConfig.MULTIPROC_DIR:
+    values.ValueClass = values.MultiProcessValue(lambda: _process_id(os.getpid()))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests handled, by view and status code.', ['view', 'status'],
+)
+HTTP_LATENCY = Histogram(
+    'http_request_duration_seconds', 'HTTP request latency by view.', ['view'], buckets=LATENCY_BUCKETS,
+)
+CELERY_TASKS = Counter(
+    'celery_tasks_total', 'Celery tasks finished, by task and state.', ['task', 'state'],
+)
+CELERY_TASK_WAIT = Histogram(
+    'celery_task_wait_seconds', 'Time between publishing a task and a worker starting it.', ['task'],
+    buckets=LATENCY_BUCKETS,
+)
+CELERY_TASK_DURATION = Histogram(
+    'celery_task_duration_seconds', 'Celery task run time.', ['task'], buckets=LATENCY_BUCKETS,
+)
+OPENAI_REQUESTS = Counter(
+    'openai_requests_total', 'OpenAI API calls, by model, operation and outcome.', ['model', 'operation', 'status'],
+)
+OPENAI_LATENCY = Histogram(
+    'openai_request_duration_seconds', 'OpenAI API latency (time to first byte for streams).',
+    ['model', 'operation'], buckets=LATENCY_BUCKETS,
+)
+OPENAI_TOKENS = Counter(
+    'openai_tokens_total', 'Tokens processed by OpenAI, by model and kind (prompt/completion/cached).',
+    ['model', 'kind'],
+)
+OPENAI_RATE_LIMIT_WAIT = Histogram(
+    'openai_rate_limit_wait_seconds', 'Time spent waiting for the cluster-wide OpenAI rate limiter.',
+    ['model', 'priority'], buckets=(0, 0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60),
+)
+OPENAI_RETRIES = Counter(
+    'openai_retries_total', 'OpenAI calls retried after throttling or transient errors, by model and error.',
+    ['model', 'error'],
+)
+OPENAI_HEDGES = Counter(
+    'openai_hedged_requests_total', 'Hedged OpenAI requests by stage and outcome (sent/primary_won/hedge_won).',
+    ['stage', 'outcome'],
+)
+OPENAI_CIRCUIT_TRANSITIONS = Counter(
+    'openai_circuit_transitions_total', 'Circuit breaker state changes by model and new state.', ['model', 'state'],
+)
+CHAT_RUNS = Counter(
+    'chat_pipeline_runs_total', 'Reply pipeline runs, by outcome (replied/superseded/error).', ['outcome'],
+)
+CHAT_LEASE_WAITS = Counter(
+    'chat_channel_lease_waits_total', 'Reply tasks requeued because another run held the channel lease.',
+)
+CHAT_PARTITION_ERRORS = Counter(
+    'chat_message_partition_errors_total', 'Monthly chat_message partitions that could not be created.',
+)
+OUTBOX_SENDS = Counter(
+    'outbox_sends_total', 'Outbound WhatsApp send attempts, by outcome (sent/retry/failed/throttled).', ['outcome'],
+)
+OUTBOX_LAG = Histogram(
+    'outbox_delivery_lag_seconds', 'Time from queuing an outbound WhatsApp message to Twilio accepting it.',
+    buckets=LATENCY_BUCKETS,
+)
+CACHE_REQUESTS = Counter(
+    'cache_requests_total', 'In-process cache lookups (snapshot, indexes), by cache and result.', ['cache', 'result'],
+)
+CATALOG_IMPORT_DURATION = Histogram(
+    'catalog_import_duration_seconds', 'Vehicle CSV import duration.', buckets=(0.5, 1, 2, 5, 10, 30, 60, 120, 300, 600),
+)
+CATALOG_IMPORT_ROWS = Counter(
+    'catalog_import_rows_total', 'Vehicle rows imported, by action.', ['action'],
+)
+
+
+def track_view(name: str):
+    """View decorator (sync or async views): count requests by status and observe latency."""
+    def observe(start: float, status: int):
+        HTTP_LATENCY.labels(name).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(name, str(status)).inc()
+
+    def decorator(view):
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                start = time.perf_counter()
+                status = 500
+                try:
+                    response = await view(request, *args, **kwargs)
+                    status = response.status_code
+                    return response
+                finally:
+                    observe(start, status)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            start = time.perf_counter()
+            status = 500
+            try:
+                response = view(request, *args, **kwargs)
+                status = response.status_code
+                return response
+            finally:
+                observe(start, status)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def observe_openai(model: str, operation: str = 'chat'):
+    """Time one OpenAI call and count it as ok/error."""
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        OPENAI_REQUESTS.labels(model, operation, 'error').inc()
+        raise
+    finally:
+        OPENAI_LATENCY.labels(model, operation).observe(time.perf_counter() - start)
+    OPENAI_REQUESTS.labels(model, operation, 'ok').inc()
+
+
+def record_openai_usage(model: Optional[str], usage):
+    """Add an OpenAI `usage` object to the token counters."""
+    if usage is None or not model:
+        return
+    OPENAI_TOKENS.labels(model, 'prompt').inc(getattr(usage, 'prompt_tokens', 0) or 0)
+    OPENAI_TOKENS.labels(model, 'completion').inc(getattr(usage, 'completion_tokens', 0) or 0)
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', 0) or 0
+    if cached:
+        OPENAI_TOKENS.labels(model, 'cached').inc(cached)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+# --- process lifecycle (gunicorn.conf.py, agent_chatbot.celery) ------------
+
+def clear_process_files():
+    """
+    On service start, before any worker forks: drop the sample files this
+    host's previous processes left, so the directory doesn't grow with
+    every restart. Other containers' files are left alone.
+    """
+    if not MetricsConfig.MULTIPROC_DIR:
+        return
+    for path in Path(MetricsConfig.MULTIPROC_DIR).glob('*.db'):
+        prefix, _, pid = path.stem.rpartition('-')
+        if pid.isdigit() and prefix.endswith(f'_{_host}'):
+            path.unlink(missing_ok=True)
+
+
+def mark_process_dead(pid: int):
+    """A gunicorn worker or Celery child exited: drop its live gauge files."""
+    if MetricsConfig.MULTIPROC_DIR:
+        multiprocess.mark_process_dead(_process_id(pid), MetricsConfig.MULTIPROC_DIR)
+
+
+# --- Celery signal handlers (connected in agent_chatbot.celery) -------------
+
+def on_task_publish(headers=None, **kwargs):
+    """before_task_publish: stamp the message so the worker can measure queue wait."""
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
+
+
+def on_task_prerun(task=None, **kwargs):
+    published_at = getattr(task.request, 'published_at', None)
+    if published_at:
+        CELERY_TASK_WAIT.labels(task.name).observe(max(0.0, time.time() - float(published_at)))
+    task.request._metrics_started = time.perf_counter()
+
+
+def on_task_postrun(task=None, state=None, **kwargs):
+    started = getattr(task.request, '_metrics_started', None)
+    if started is not None:
+        CELERY_TASK_DURATION.labels(task.name).observe(time.perf_counter() - started)
+    CELERY_TASKS.labels(task.name, state or 'UNKNOWN').inc()
+
+
+# --- scrape endpoint -------------------------------------------------------
+
+class CeleryQueueCollector:
+    """Reports the Redis broker's queue lengths at scrape time."""
+
+    def collect(self):
+        family = GaugeMetricFamily('celery_queue_length', 'Messages waiting in a Celery queue.', labels=['queue'])
+        try:
+            client = get_redis()
+            for queue in MetricsConfig.CELERY_QUEUES:
+                family.add_metric([queue], client.llen(queue))
+        except Exception as e:
+            print(f"Could not read Celery queue lengths: {e}")
+        yield family
+
+
+def render_metrics() -> bytes:
+    """Exposition-format metrics of every process plus current queue lengths."""
+    if MetricsConfig.MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry) + generate_latest(_queue_registry)
+
+
+_queue_registry = CollectorRegistry()
+_queue_registry.register(CeleryQueueCollector())
@@ -0,0 +1,223 @@
+"""
+Cluster-wide OpenAI rate limiting.
+
+Every web and worker process draws from the same Redis token buckets, one
+pair per model: requests per minute and tokens per minute
+(OpenAIConfig.RATE_LIMITS). A request is admitted only when both buckets
+cover it. Background work (summaries, article cleaning, embeddings) must
+leave RATE_LIMIT_RESERVE of each bucket untouched, so live customer replies
+always find capacity.
+
+Token cost is estimated before the call and reconciled with the reported
+usage afterwards. A 429 puts the model into a cluster-wide cool-down for
+its Retry-After, and retries back off with full jitter.
+"""
+import random
+import time
+from typing import Optional
+import openai
+from agent_chatbot.settings import OpenAIConfig
+from core.clients import get_redis
+from core.metrics import OPENAI_RATE_LIMIT_WAIT, OPENAI_RETRIES, observe_openai
+
+LIVE = 'live'
+BACKGROUND = 'background'
+
+# completion allowance when the call sets no max_tokens
+DEFAULT_COMPLETION_TOKENS = 500
+
+
+class RateLimited(Exception):
+    """The model's quota could not be obtained in time; retry after `retry_after` seconds."""
+
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"OpenAI rate limit for {model}, retry in {retry_after:.1f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+# KEYS: requests bucket, tokens bucket, cool-down flag
+# ARGV: requests/min, tokens/min, token cost, reserved fraction
+# Returns 0 when admitted, otherwise the milliseconds to wait.
+_ACQUIRE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+local cooling = redis.call('PTTL', KEYS[3])
+if cooling > 0 then return cooling end
+
+local rpm, tpm = tonumber(ARGV[1]), tonumber(ARGV[2])
+local reserve = tonumber(ARGV[4])
+-- a request larger than what the priority may use would never fit
+local cost = math.min(tonumber(ARGV[3]), tpm * (1 - reserve))
+
+local function level(key, capacity)
+    local v = redis.call('HMGET', key, 'level', 'ts')
+    local lvl = tonumber(v[1]) or capacity
+    local ts = tonumber(v[2]) or now
+    return math.min(capacity, lvl + (now - ts) * capacity / 60000)
+end
+
+local requests = level(KEYS[1], rpm)
+local tokens = level(KEYS[2], tpm)
+local wait = 0
+local missing = 1 + reserve * rpm - requests
+if missing > 0 then wait = math.max(wait, missing * 60000 / rpm) end
+missing = cost + reserve * tpm - tokens
+if missing > 0 then wait = math.max(wait, missing * 60000 / tpm) end
+if wait > 0 then return math.ceil(wait) end
+
+redis.call('HSET', KEYS[1], 'level', requests - 1, 'ts', now)
+redis.call('HSET', KEYS[2], 'level', tokens - cost, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], 120000)
+redis.call('PEXPIRE', KEYS[2], 120000)
+return 0
+"""
+
+# KEYS: tokens bucket; ARGV: tokens to take back (negative returns them)
+_ADJUST = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HINCRBYFLOAT', KEYS[1], 'level', -tonumber(ARGV[1]))
+end
+return 0
+"""
+
+
+class OpenAIRateLimiter:
+    """Redis token buckets per model shared by every process."""
+
+    def __init__(self, limits: dict, reserve: float = 0.2):
+        self.limits = limits
+        self.reserve = reserve
+
+    def _keys(self, model: str):
+        prefix = f"ratelimit:openai:{model}"
+        return f"{prefix}:requests", f"{prefix}:tokens", f"{prefix}:cooldown"
+
+    def acquire(self, model: str, tokens: int, priority: str = LIVE, max_wait: float = None):
+        """
+        Block until the model's buckets admit one request of `tokens` tokens,
+        raising RateLimited when that would take longer than `max_wait`.
+        """
+        if model not in self.limits:
+            return
+        rpm, tpm = self.limits[model]
+        reserve = 0 if priority == LIVE else self.reserve
+        if max_wait is None:
+            max_wait = OpenAIConfig.RATE_LIMIT_MAX_WAIT if priority == LIVE else OpenAIConfig.RATE_LIMIT_BACKGROUND_MAX_WAIT
+        started = time.monotonic()
+        deadline = started + max_wait
+        while True:
+            wait_ms = get_redis().eval(_ACQUIRE, 3, *self._keys(model), rpm, tpm, tokens, reserve)
+            if not wait_ms:
+                OPENAI_RATE_LIMIT_WAIT.labels(model, priority).observe(time.monotonic() - started)
+                return
+            # jitter keeps waiting processes from waking up in lockstep
+            wait = wait_ms / 1000 * random.uniform(1.0, 1.25)
+            if time.monotonic() + wait > deadline:
+                raise RateLimited(model, wait)
+            time.sleep(wait)
+
+    def reconcile(self, model: str, estimated: int, actual: int):
+        """Correct the tokens bucket once the real usage is known."""
+        if model in self.limits and actual:
+            get_redis().eval(_ADJUST, 1, self._keys(model)[1], actual - estimated)
+
+    def cool_down(self, model: str, seconds: float):
+        """Pause the model for every process (after a 429)."""
+        get_redis().set(self._keys(model)[2], 1, px=max(1, int(seconds * 1000)))
+
+
+_limiter: Optional[OpenAIRateLimiter] = None
+
+
+def get_rate_limiter() -> Optional[OpenAIRateLimiter]:
+    """The configured limiter, None when OPENAI_RATE_LIMITS is empty."""
+    global _limiter
+    if _limiter is None and OpenAIConfig.RATE_LIMITS:
+        _limiter = OpenAIRateLimiter(OpenAIConfig.RATE_LIMITS, OpenAIConfig.RATE_LIMIT_RESERVE)
+    return _limiter
+
+
+def estimate_tokens(kwargs: dict) -> int:
+    """Rough prompt plus completion size of a chat or embeddings request."""
+    chars = 0
+    for message in kwargs.get('messages') or []:
+        content = message.get('content') if isinstance(message, dict) else None
+        chars += len(content) if isinstance(content, str) else 0
+    inputs = kwargs.get('input')
+    if isinstance(inputs, str):
+        chars += len(inputs)
+    elif isinstance(inputs, list):
+        chars += sum(len(text) for text in inputs if isinstance(text, str))
+    completion = 0 if 'input' in kwargs else kwargs.get('max_tokens') or DEFAULT_COMPLETION_TOKENS
+    # ~4 characters per token, as in chat.budget
+    return (chars + 3) // 4 + completion
+
+
+def retry_after(exc: Exception) -> Optional[float]:
+    """Seconds requested by the Retry-After(-Ms) header of an API error."""
+    response = getattr(exc, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return None
+
+
+def _retryable(exc: Exception) -> bool:
+    if isinstance(exc, openai.RateLimitError):
+        # an exhausted quota does not come back by waiting
+        return getattr(exc, 'code', None) != 'insufficient_quota'
+    return isinstance(exc, (openai.APIConnectionError, openai.InternalServerError))
+
+
+def backoff_delay(attempt: int, exc: Exception = None) -> float:
+    """Full-jitter exponential backoff, never shorter than the server's Retry-After."""
+    delay = random.uniform(0, min(OpenAIConfig.BACKOFF_MAX, OpenAIConfig.BACKOFF_BASE * 2 ** attempt))
+    hinted = retry_after(exc) if exc is not None else None
+    if hinted is not None:
+        delay = hinted + random.uniform(0, OpenAIConfig.BACKOFF_BASE)
+    return delay
+
+
+def call_openai(create, operation: str = 'chat', priority: str = LIVE, **kwargs):
+    """
+    Call an OpenAI client method (`client.chat.completions.create`,
+    `client.embeddings.create`, ...) with `kwargs` through the cluster-wide
+    limiter, retrying throttled and transient failures.
+    """
+    model = kwargs.get('model')
+    limiter = get_rate_limiter()
+    estimated = estimate_tokens(kwargs)
+    attempt = 0
+    while True:
+        if limiter:
+            limiter.acquire(model, estimated, priority)
+        try:
+            with observe_openai(model, operation):
+                resp = create(**kwargs)
+        except Exception as e:
+            if not _retryable(e):
+                raise
+            delay = backoff_delay(attempt, e)
+            attempt += 1
+            if attempt > OpenAIConfig.MAX_RETRIES:
+                if isinstance(e, openai.RateLimitError):
+                    raise RateLimited(model, delay) from e
+                raise
+            OPENAI_RETRIES.labels(model, type(e).__name__).inc()
+            print(f"OpenAI {operation} on {model} failed ({type(e).__name__}), retry {attempt} in {delay:.1f}s")
+            if isinstance(e, openai.RateLimitError) and limiter and model in limiter.limits:
+                # every process backs off; acquire() waits out the cool-down
+                limiter.cool_down(model, delay)
+            else:
+                time.sleep(delay)
+            continue
+        usage = getattr(resp, 'usage', None)
+        if limiter and usage is not None:
+            limiter.reconcile(model, estimated, getattr(usage, 'total_tokens', 0) or 0)
+        return resp
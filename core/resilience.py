@@ -0,0 +1,176 @@
+"""
+Tail-latency and failure control for model calls: per-model circuit
+breakers, rolling latency percentiles per stage and hedged requests.
+
+State is per process. Every worker sees enough traffic to judge a model on
+its own, and a local decision reacts faster than a shared one.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Optional, Tuple
+import openai
+from agent_chatbot.settings import OpenAIConfig
+from core.metrics import OPENAI_CIRCUIT_TRANSITIONS, OPENAI_HEDGES
+
+
+def is_model_failure(exc: Exception) -> bool:
+    """
+    Provider-side errors that say the model is unhealthy (not that the
+    request was bad). Our own limiter's RateLimited never reached the
+    provider, so it doesn't count.
+    """
+    return isinstance(exc, (
+        openai.APIConnectionError,
+        openai.InternalServerError,
+        openai.RateLimitError,
+    ))
+
+
+class CircuitBreaker:
+    """
+    Opens when more than `error_rate` of the last `window` calls (at least
+    `min_calls`) failed. After `cooldown` seconds one probe call is let
+    through (half-open); its outcome closes or re-opens the circuit.
+    """
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, name: str, error_rate: float = 0.5, min_calls: int = 10, window: int = 50, cooldown: float = 30):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str):
+        self.state = state
+        OPENAI_CIRCUIT_TRANSITIONS.labels(self.name, state).inc()
+        print(f"Circuit for {self.name} is now {state}")
+
+    def allow(self) -> bool:
+        """Whether a call may go to this model now."""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self._transition(self.HALF_OPEN)
+            if self.state == self.HALF_OPEN:
+                if self._probing:
+                    return False
+                self._probing = True
+                return True
+            return self.state == self.CLOSED
+
+    def release(self):
+        """
+        End a call whose outcome says nothing about the model (a bad request,
+        our own rate limit, a superseded run): a half-open circuit lets the
+        next call probe instead.
+        """
+        with self._lock:
+            self._probing = False
+
+    def record(self, ok: bool):
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probing = False
+                self._outcomes.clear()
+                if ok:
+                    self._transition(self.CLOSED)
+                else:
+                    self._opened_at = time.monotonic()
+                    self._transition(self.OPEN)
+                return
+            self._outcomes.append(ok)
+            failures = self._outcomes.count(False)
+            if (
+                self.state == self.CLOSED
+                and len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) > self.error_rate
+            ):
+                self._opened_at = time.monotonic()
+                self._transition(self.OPEN)
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(model: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(model)
+        if breaker is None:
+            breaker = _breakers[model] = CircuitBreaker(
+                model,
+                error_rate=OpenAIConfig.CIRCUIT_ERROR_RATE,
+                min_calls=OpenAIConfig.CIRCUIT_MIN_CALLS,
+                cooldown=OpenAIConfig.CIRCUIT_COOLDOWN,
+            )
+        return breaker
+
+
+# --- rolling latency per (stage, model) -------------------------------------
+
+_latencies: Dict[Tuple[str, str], deque] = {}
+_latencies_lock = threading.Lock()
+LATENCY_WINDOW = 200
+MIN_LATENCY_SAMPLES = 20
+
+
+def observe_latency(stage: str, model: str, seconds: float):
+    with _latencies_lock:
+        _latencies.setdefault((stage, model), deque(maxlen=LATENCY_WINDOW)).append(seconds)
+
+
+def latency_percentile(stage: str, model: str, q: float = 95) -> Optional[float]:
+    """Nearest-rank percentile of recent latencies, None until enough samples."""
+    with _latencies_lock:
+        samples = sorted(_latencies.get((stage, model), ()))
+    if len(samples) < MIN_LATENCY_SAMPLES:
+        return None
+    rank = max(1, -(-len(samples) * q // 100))
+    return samples[int(rank) - 1]
+
+
+# --- hedged requests ---------------------------------------------------------
+
+# threads outlive a losing request (a sync HTTP call can't be cancelled)
+_pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix='hedge')
+
+
+def hedged(
+    primary: Callable,
+    hedge: Callable,
+    delay: Optional[float],
+    stage: str = '',
+    retry_on: Callable[[Exception], bool] = lambda e: True,
+):
+    """
+    Run `primary`; if it has not answered after `delay` seconds, also start
+    `hedge` and return whichever succeeds first. The slower call is left
+    to finish in the background and its result dropped. A `primary` that
+    fails sooner starts `hedge` right away when `retry_on(error)` holds.
+    Raises the first error only when both fail. Without a delay, `primary`
+    runs inline.
+    """
+    if delay is None:
+        return primary()
+    first = _pool.submit(primary)
+    done, _ = wait([first], timeout=delay)
+    if done and (first.exception() is None or not retry_on(first.exception())):
+        return first.result()
+    OPENAI_HEDGES.labels(stage, 'sent').inc()
+    pending = {first: 'primary', _pool.submit(hedge): 'hedge'}
+    error = None
+    while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            label = pending.pop(future)
+            if future.exception() is None:
+                OPENAI_HEDGES.labels(stage, f'{label}_won').inc()
+                return future.result()
+            error = error or future.exception()
+    raise error
@@ -1,3 +1,222 @@
-from django.test import TestCase
+import threading
+from unittest import mock, skipUnless
+from django.test import SimpleTestCase, override_settings
+from agent_chatbot.settings import MetricsConfig
+from core import clients, resilience
+from core.fields import uuid7, uuid7_time
+from core.ratelimit import BACKGROUND, LIVE, OpenAIRateLimiter, RateLimited
+from core.resilience import CircuitBreaker, hedged, latency_percentile, observe_latency
 
-# Create your tests here.
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+@mock.patch('core.views_api.render_metrics', return_value=b'chat_runs_total 1.0\n')
+class MetricsEndpointTests(SimpleTestCase):
+    url = '/api/metrics/'
+
+    @mock.patch.object(MetricsConfig, 'TOKEN', 'secret')
+    def test_token_is_required(self, render):
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+        self.assertEqual(self.client.get(self.url, HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+        response = self.client.get(self.url, HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'chat_runs_total 1.0\n')
+
+    @mock.patch.object(MetricsConfig, 'TOKEN', '')
+    def test_without_a_token_only_debug_serves_metrics(self, render):
+        with override_settings(DEBUG=False):
+            self.assertEqual(self.client.get(self.url).status_code, 403)
+        with override_settings(DEBUG=True):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class UUID7Tests(SimpleTestCase):
+    def test_ids_increase_within_one_millisecond(self):
+        # a millisecond well ahead of any id generated so far
+        frozen_ms = (uuid7().int >> 80) + 1000
+        with mock.patch('core.fields.time.time_ns', return_value=frozen_ms * 1_000_000):
+            # more ids than the 12-bit counter holds: the overflow borrows a ms
+            ids = [uuid7() for _ in range(5000)]
+        self.assertEqual(ids, sorted(ids))
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertEqual(uuid7_time(ids[0]), frozen_ms / 1000)
+        self.assertTrue(all(value.version == 7 for value in ids))
+
+    def test_pinned_timestamp(self):
+        value = uuid7(timestamp_ms=1_700_000_000_123)
+        self.assertEqual(uuid7_time(value), 1_700_000_000.123)
+
+
+@skipUnless(fakeredis, "fakeredis is not installed")
+class OpenAIRateLimiterTests(SimpleTestCase):
+    def setUp(self):
+        patcher = mock.patch.dict(clients._clients, {'redis': fakeredis.FakeRedis()})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        # (requests/min, tokens/min); refill during a test is a few tokens at most
+        self.limiter = OpenAIRateLimiter({'gpt-test': (100, 1000)}, reserve=0.2)
+
+    def test_background_leaves_the_reserve_to_live(self):
+        self.limiter.acquire('gpt-test', 700, BACKGROUND, max_wait=0)
+        # 300 tokens left: 150 would cut into the 200 reserved for live replies
+        with self.assertRaises(RateLimited):
+            self.limiter.acquire('gpt-test', 150, BACKGROUND, max_wait=0)
+        self.limiter.acquire('gpt-test', 150, LIVE, max_wait=0)
+
+    def test_live_drains_the_bucket(self):
+        self.limiter.acquire('gpt-test', 990, LIVE, max_wait=0)
+        with self.assertRaises(RateLimited) as ctx:
+            self.limiter.acquire('gpt-test', 100, LIVE, max_wait=0)
+        # ~90 tokens missing at 1000/min, plus up to 25% jitter
+        self.assertGreater(ctx.exception.retry_after, 4)
+        self.assertLess(ctx.exception.retry_after, 7)
+
+    def test_requests_bucket(self):
+        limiter = OpenAIRateLimiter({'gpt-test': (2, 100000)}, reserve=0.2)
+        limiter.acquire('gpt-test', 10, LIVE, max_wait=0)
+        limiter.acquire('gpt-test', 10, LIVE, max_wait=0)
+        with self.assertRaises(RateLimited) as ctx:
+            limiter.acquire('gpt-test', 10, LIVE, max_wait=0)
+        # one request refills every 30s
+        self.assertGreater(ctx.exception.retry_after, 29)
+
+    def test_oversized_request_is_capped(self):
+        # larger than a minute's worth: admitted once the bucket is full
+        self.limiter.acquire('gpt-test', 5000, LIVE, max_wait=0)
+        with self.assertRaises(RateLimited):
+            self.limiter.acquire('gpt-test', 10, LIVE, max_wait=0)
+
+    def test_reconcile_returns_unused_tokens(self):
+        self.limiter.acquire('gpt-test', 900, LIVE, max_wait=0)
+        with self.assertRaises(RateLimited):
+            self.limiter.acquire('gpt-test', 400, BACKGROUND, max_wait=0)
+        # the call used 300: 600 tokens go back, 700 are left
+        self.limiter.reconcile('gpt-test', 900, 300)
+        self.limiter.acquire('gpt-test', 400, BACKGROUND, max_wait=0)
+
+    def test_cool_down_blocks_every_priority(self):
+        self.limiter.cool_down('gpt-test', 5)
+        with self.assertRaises(RateLimited) as ctx:
+            self.limiter.acquire('gpt-test', 10, LIVE, max_wait=0)
+        self.assertGreater(ctx.exception.retry_after, 4)
+
+    def test_unlimited_model(self):
+        for _ in range(10):
+            self.limiter.acquire('other-model', 10**6, BACKGROUND, max_wait=0)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker('gpt-test', error_rate=0.5, min_calls=4, cooldown=0)
+
+    def open(self):
+        for ok in (True, False, False, False):
+            self.breaker.record(ok)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_opens_past_the_error_rate(self):
+        for ok in (True, False, True, False):
+            self.breaker.record(ok)
+        # 2 of 4 failed: not more than half
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+
+    def test_stays_open_during_the_cooldown(self):
+        self.breaker.cooldown = 30
+        self.open()
+        self.assertFalse(self.breaker.allow())
+
+    def test_half_open_lets_one_probe_through(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(True)
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_failed_probe_reopens(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.cooldown = 30
+        self.breaker.record(False)
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow())
+
+    def test_released_probe_lets_the_next_call_probe(self):
+        self.open()
+        self.assertTrue(self.breaker.allow())
+        self.breaker.release()
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow())
+
+
+class HedgedTests(SimpleTestCase):
+    def test_without_delay_runs_inline(self):
+        self.assertEqual(hedged(lambda: 'primary', lambda: 'hedge', None), 'primary')
+
+    def test_fast_primary_wins(self):
+        hedge = mock.Mock(return_value='hedge')
+        self.assertEqual(hedged(lambda: 'primary', hedge, 5), 'primary')
+        hedge.assert_not_called()
+
+    def test_slow_primary_is_hedged(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow():
+            release.wait(5)
+            return 'primary'
+
+        self.assertEqual(hedged(slow, lambda: 'hedge', 0.01), 'hedge')
+
+    def test_early_failure_falls_back(self):
+        def failing():
+            raise ConnectionError('down')
+
+        self.assertEqual(hedged(failing, lambda: 'hedge', 5), 'hedge')
+
+    def test_early_failure_not_retried(self):
+        def failing():
+            raise ValueError('bad request')
+
+        hedge = mock.Mock(return_value='hedge')
+        with self.assertRaises(ValueError):
+            hedged(failing, hedge, 5, retry_on=lambda e: isinstance(e, ConnectionError))
+        hedge.assert_not_called()
+
+    def test_first_error_is_raised_when_both_fail(self):
+        def failing():
+            raise ConnectionError('primary')
+
+        def failing_hedge():
+            raise ConnectionError('hedge')
+
+        with self.assertRaisesMessage(ConnectionError, 'primary'):
+            hedged(failing, failing_hedge, 5)
+
+
+@mock.patch.dict(resilience._latencies, clear=True)
+class LatencyPercentileTests(SimpleTestCase):
+    def test_needs_enough_samples(self):
+        for _ in range(resilience.MIN_LATENCY_SAMPLES - 1):
+            observe_latency('final', 'gpt-test', 1.0)
+        self.assertIsNone(latency_percentile('final', 'gpt-test'))
+
+    def test_nearest_rank(self):
+        for ms in range(1, 101):
+            observe_latency('final', 'gpt-test', ms / 1000)
+        self.assertEqual(latency_percentile('final', 'gpt-test', 95), 0.095)
+        self.assertEqual(latency_percentile('final', 'gpt-test', 50), 0.05)
+        self.assertIsNone(latency_percentile('final', 'other-model'))
+
+    def test_keeps_a_rolling_window(self):
+        for _ in range(resilience.LATENCY_WINDOW):
+            observe_latency('final', 'gpt-test', 9.0)
+        for _ in range(resilience.LATENCY_WINDOW):
+            observe_latency('final', 'gpt-test', 1.0)
+        self.assertEqual(latency_percentile('final', 'gpt-test', 100), 1.0)
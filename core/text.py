@@ -0,0 +1,7 @@
+import unicodedata
+
+
+def fold(text: str) -> str:
+    """Lowercase and strip accents: the lookup key for every term."""
+    decomposed = unicodedata.normalize('NFKD', text.lower())
+    return ''.join(ch for ch in decomposed if not unicodedata.combining(ch))
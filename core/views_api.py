@@ -1,10 +1,13 @@
 # core/views_api.py
-from agent_chatbot.settings import TwilioConfig, OpenAIConfig
+import hmac
+from django.conf import settings
+from django.http import HttpResponse
+from agent_chatbot.settings import MetricsConfig, TwilioConfig
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
-from twilio.rest import Client as TwilioClient
-from openai import OpenAI
+from core.clients import get_openai_client, get_twilio_client
+from core.metrics import CONTENT_TYPE_LATEST, render_metrics
 
 
 @api_view(['GET'])
@@ -15,7 +18,7 @@ def credentials_check(request):
     
     # Check Twilio credentials
     try:
-        tw_client = TwilioClient(TwilioConfig.ACCOUNT_SID, TwilioConfig.AUTH_TOKEN)
+        tw_client = get_twilio_client()
         account = tw_client.api.accounts(TwilioConfig.ACCOUNT_SID).fetch()
         results['twilio'] = {'status': 'ok', 'account_sid': account.sid}
     except Exception as e:
@@ -23,8 +26,7 @@ def credentials_check(request):
     
     # Check OpenAI credentials
     try:
-        
-        client = OpenAI()
+        client = get_openai_client()
         _input = "Hello, how are you?"
         response = client.responses.create(
             model="gpt-4-turbo",
@@ -38,3 +40,18 @@ def credentials_check(request):
         }
 
     return Response(results)
+
+
+def metrics(request):
+    """
+    Prometheus scrape endpoint aggregating web and worker processes.
+    Requires `Authorization: Bearer <METRICS_TOKEN>`; without a token the
+    endpoint is only served with DEBUG on.
+    """
+    if MetricsConfig.TOKEN:
+        supplied = request.headers.get('Authorization', '').removeprefix('Bearer ').strip()
+        if not hmac.compare_digest(supplied, MetricsConfig.TOKEN):
+            return HttpResponse('Unauthorized', status=401)
+    elif not settings.DEBUG:
+        return HttpResponse('Forbidden: METRICS_TOKEN is not set', status=403)
+    return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,15 @@
+"""
+Gunicorn hooks (read from the working directory by the web and ingest
+services): keep the Prometheus multiprocess directory in step with the
+workers (core.metrics).
+"""
+
+
+def on_starting(server):
+    from core.metrics import clear_process_files
+    clear_process_files()
+
+
+def child_exit(server, worker):
+    from core.metrics import mark_process_dead
+    mark_process_dead(worker.pid)